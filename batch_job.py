@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import threading
+from tag_cache import get_cache_dir, folder_key
+
+JOB_MAX_ATTEMPTS = 3
+CHECKPOINT_EVERY = 200
+CHECKPOINT_INTERVAL = 30.0
+
+
+def job_path(folder_path, kind):
+    return os.path.join(get_cache_dir(), f"job_{kind}_{folder_key(folder_path)}.json")
+
+
+class BatchJob:
+    """Persistent state of one batch AI run over a folder.
+
+    The manifest records the job kind, its parameters (model, threshold,
+    task prompt) and the images it covers; every image is marked done or
+    failed with its attempt count as the workers go. The file in the cache
+    dir is rewritten atomically every CHECKPOINT_EVERY images or
+    CHECKPOINT_INTERVAL seconds, so a cancelled or crashed run resumes with
+    the images that are not done yet. Failed images are retried until they
+    reach max_attempts. The manifest is removed once nothing is left to try.
+    """
+
+    def __init__(self, folder_path, kind, params, image_paths, max_attempts=JOB_MAX_ATTEMPTS):
+        self.folder_path = os.path.abspath(folder_path)
+        self.kind = kind
+        self.params = dict(params)
+        self.max_attempts = max_attempts
+        self.names = [self.name_for(p) for p in image_paths]
+        self.state = {} # name -> {"status": "done"|"failed"|"skipped", "attempts": n, "error": msg}
+        self.created = time.time()
+        self._dirty = 0
+        self._last_checkpoint = time.monotonic()
+        # Called after every checkpoint, to save state that has to match it
+        self.checkpoint_listeners = []
+        # Images are marked done from the tag store's writer thread
+        self._lock = threading.RLock()
+
+    @classmethod
+    def load(cls, folder_path, kind):
+        """The unfinished job of kind in folder_path, or None"""
+        try:
+            with open(job_path(folder_path, kind), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        job = cls(folder_path, kind, data.get("params", {}), [], data.get("max_attempts", JOB_MAX_ATTEMPTS))
+        job.names = data.get("images", [])
+        job.state = data.get("state", {})
+        job.created = data.get("created", job.created)
+        return job
+
+    def name_for(self, image_path):
+        return os.path.relpath(os.path.abspath(image_path), self.folder_path)
+
+    def path_for(self, name):
+        return os.path.join(self.folder_path, name)
+
+    @property
+    def image_paths(self):
+        return [self.path_for(n) for n in self.names]
+
+    def can_retry(self, image_path):
+        entry = self.state.get(self.name_for(image_path))
+        if entry is None:
+            return True
+        return entry["status"] == "failed" and entry["attempts"] < self.max_attempts
+
+    def remaining(self):
+        """Images that are neither done nor out of attempts, in job order"""
+        return [self.path_for(n) for n in self.names if self._pending(n)]
+
+    def _pending(self, name):
+        entry = self.state.get(name)
+        return entry is None or (entry["status"] == "failed" and entry["attempts"] < self.max_attempts)
+
+    def mark_done(self, image_path):
+        name = self.name_for(image_path)
+        with self._lock:
+            attempts = self.state.get(name, {}).get("attempts", 0) + 1
+            self.state[name] = {"status": "done", "attempts": attempts}
+            self._changed()
+
+    def mark_failed(self, image_path, error):
+        name = self.name_for(image_path)
+        with self._lock:
+            attempts = self.state.get(name, {}).get("attempts", 0) + 1
+            self.state[name] = {"status": "failed", "attempts": attempts, "error": str(error)}
+            self._changed()
+
+    def mark_skipped(self, image_path):
+        """Leave an image out of the job, e.g. a duplicate of another one"""
+        with self._lock:
+            self.state[self.name_for(image_path)] = {"status": "skipped", "attempts": 0}
+            self._changed()
+
+    def counts(self):
+        """(done, failed for good, remaining)"""
+        with self._lock:
+            done = sum(1 for e in self.state.values() if e["status"] == "done")
+            remaining = sum(1 for n in self.names if self._pending(n))
+            return done, len(self.names) - done - remaining - self.skipped_count(), remaining
+
+    def skipped_count(self):
+        with self._lock:
+            return sum(1 for e in self.state.values() if e["status"] == "skipped")
+
+    def is_complete(self):
+        return not any(self._pending(n) for n in self.names)
+
+    def _changed(self):
+        self._dirty += 1
+        if self._dirty >= CHECKPOINT_EVERY or time.monotonic() - self._last_checkpoint >= CHECKPOINT_INTERVAL:
+            self.checkpoint()
+
+    def checkpoint(self):
+        path = job_path(self.folder_path, self.kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {
+            "kind": self.kind,
+            "folder": self.folder_path,
+            "params": self.params,
+            "max_attempts": self.max_attempts,
+            "created": self.created,
+            "images": self.names,
+            "state": self.state,
+        }
+        tmp_path = path + ".tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            self._dirty = 0
+            self._last_checkpoint = time.monotonic()
+            for listener in self.checkpoint_listeners:
+                listener()
+
+    def finish(self):
+        """Drop the manifest when nothing is left to try, otherwise save it for a later resume"""
+        if self.is_complete():
+            self.discard()
+        else:
+            self.checkpoint()
+
+    def discard(self):
+        try:
+            os.remove(job_path(self.folder_path, self.kind))
+        except OSError:
+            pass
@@ -0,0 +1,495 @@
+import os
+import traceback
+import numpy as np
+from decode_pipeline import PrefetchDecoder, load_rgb, resize_for_model
+from florence_model import FLORENCE_MODEL_ID, FLORENCE_BATCH_SIZE, get_florence_host
+from batch_job import BatchJob
+from inference_cache import get_inference_cache
+from score_store import get_score_store
+from tag_store import append_missing
+from tag_vocab import ensure_vocabulary
+from dedup import skip_duplicates
+from onnx_tagger import TAGGER_BATCH_SIZE, TaggerProcessPool, default_cpu_processes, get_onnx_device, get_tagger
+
+# Tagging and captioning without Qt. The QThread workers in ai_tagger.py and
+# the command line in tag_editor.py both drive these.
+
+
+class BatchTaggingError(Exception):
+    pass
+
+
+def tag_image(image_path, threshold=0.35, model_name="v0.9", on_status=None):
+    """Tags for one image, characters first"""
+    device_name, _ = get_onnx_device()
+    if device_name is None:
+        raise BatchTaggingError("ONNX Runtime not installed.")
+    if on_status:
+        on_status(f"Running inference on {device_name}...")
+
+    try:
+        # Reuses the session left open by earlier runs
+        general_tags, character_tags = get_tagger(model_name).tag_images([image_path], threshold, threshold)[0]
+        return list(character_tags.keys()) + list(general_tags.keys())
+    except Exception:
+        traceback.print_exc()
+        print("ONNX tagger session unavailable. Falling back to imgutils...")
+
+    try:
+        from imgutils.tagging.pixai import get_pixai_tags
+        import inspect
+
+        sig = inspect.signature(get_pixai_tags)
+        params = sig.parameters
+
+        tagger_kwargs = {"model_name": model_name}
+        if "threshold" in params:
+            tagger_kwargs["threshold"] = threshold
+        elif "thresholds" in params:
+            tagger_kwargs["thresholds"] = threshold
+
+        general_tags, character_tags = get_pixai_tags(image_path, **tagger_kwargs)
+    except (ImportError, TypeError):
+        print("PixAI module not found or incompatible. Falling back to SwinV2...")
+        from imgutils.tagging import get_wd14_tags
+        general_tags, character_tags = get_wd14_tags(
+            image_path, model_name='SwinV2',
+            general_threshold=threshold, character_threshold=threshold
+        )
+    return list(character_tags.keys()) + list(general_tags.keys())
+
+
+def caption_text(result):
+    """Text of a Florence-2 answer. Region tasks answer with a dict of boxes
+    and labels; their labels are kept (OCR text) and the boxes dropped."""
+    if isinstance(result, dict):
+        labels = [label.strip() for label in result.get("labels", []) if isinstance(label, str)]
+        return ", ".join(label for label in labels if label)
+    return result.strip() if isinstance(result, str) else ""
+
+
+def caption_image(image_path, task_prompt="<DETAILED_CAPTION>", model_id=FLORENCE_MODEL_ID, on_status=None):
+    """Florence-2 answer for one image as a tag list (empty when there is none)"""
+    host = get_florence_host(model_id)
+    if not host.is_loaded() and on_status:
+        on_status("Loading Florence-2 model...")
+    result = caption_text(host.caption(image_path, task_prompt))
+    return [result] if result else []
+
+
+class BatchTagger:
+    """PixAI batch tagging of a folder as a resumable BatchJob.
+
+    Stored scores are reused first, the rest goes through the ONNX session
+    (or the CPU process pool) in batches, and new tags are merged into the
+    sidecars. imgutils is the fallback when the session cannot start.
+    """
+
+    def __init__(self, file_manager, image_paths, threshold=0.35, batch_size=TAGGER_BATCH_SIZE, cpu_processes=None, job=None, skip_duplicates=False):
+        self.file_manager = file_manager
+        self.threshold = threshold
+        self.batch_size = max(1, batch_size)
+        # Worker processes used when there is no GPU; None picks from the core count, 0 disables
+        self.cpu_processes = default_cpu_processes() if cpu_processes is None else cpu_processes
+        self.model_name = "v0.9"
+        # A resumed job brings its own image list; otherwise a new one is started
+        self.job = job or BatchJob(file_manager.folder_path, "pixai", {"model": self.model_name, "threshold": threshold, "skip_duplicates": skip_duplicates}, image_paths)
+        self.image_paths = self.job.image_paths
+        self.skip_duplicates = self.job.params.get("skip_duplicates", False)
+        # Tags go through the folder's single writer instead of being saved from this thread
+        self.tag_store = file_manager.tag_store()
+        self.tagger = None
+        self.cache = None
+        self.store = None
+        self.digests = {}
+        self.failed_paths = []
+        self.done = 0
+        self.on_progress = None
+        self.should_stop = None
+
+    def run(self, on_progress=None, should_stop=None):
+        """Tag every image the job still needs. Returns (images done, total)."""
+        self.on_progress = on_progress
+        self.should_stop = should_stop
+        total = len(self.image_paths)
+        device_name, _ = get_onnx_device()
+        if device_name is None:
+            raise BatchTaggingError("ONNX Runtime not installed.")
+
+        try:
+            if self.skip_duplicates:
+                # Only one image of each group of near-duplicates goes through the model
+                skip_duplicates(self.job, on_progress=self.report, should_stop=self.stopped)
+
+            try:
+                self.tagger = get_tagger(self.model_name)
+                self.tagger.load_labels()
+                # The tagger's tag list seeds the offline tag dictionary
+                ensure_vocabulary(self.tagger.tags_path)
+            except Exception:
+                traceback.print_exc()
+                print("Could not load the ONNX tagger. Falling back to imgutils...")
+                self.tagger = None
+
+            if self.tagger is not None:
+                # Full score rows are kept per folder so the threshold can be changed later
+                try:
+                    self.store = get_score_store(self.file_manager.folder_path)
+                    self.store.ensure_model(self.tagger.spec["repo_id"], self.tagger.version, self.tagger.tag_names, self.tagger.general_mask | self.tagger.character_mask)
+                    # The row index is saved with the job, so a resumed job finds the rows already written
+                    self.job.checkpoint_listeners.append(self.store.save)
+                except (OSError, ValueError) as e:
+                    print(f"Score store disabled: {e}")
+                    self.store = None
+                self.cache = get_inference_cache()
+
+            # Images that failed are tried again until they run out of attempts
+            pending = self.job.remaining()
+            while pending and not self.stopped():
+                self.done = total - len(pending)
+                self.failed_paths = []
+                self.process(pending, device_name)
+                # Write failures are reported by the tag store
+                self.tag_store.drain()
+                pending = [p for p in self.failed_paths if self.job.can_retry(p)]
+
+            if self.cache: self.cache.commit()
+            if self.store: self.store.set_threshold(self.threshold)
+            self.job.finish()
+            done, _, _ = self.job.counts()
+            return done, total
+        except Exception:
+            self.tag_store.drain()
+            self.job.checkpoint()
+            raise
+
+    def process(self, image_paths, device_name):
+        if self.tagger is None:
+            self.run_imgutils(image_paths)
+            return
+
+        # Images tagged before by the same model only need the new threshold applied
+        pending = self.apply_cached_scores(image_paths) if self.cache else list(image_paths)
+        if not pending or self.stopped():
+            return
+        if device_name == "CPU" and self.cpu_processes > 1 and len(pending) > self.batch_size:
+            handled = set()
+            try:
+                self.run_processes(pending, handled)
+                return
+            except Exception:
+                traceback.print_exc()
+                print("CPU process pool failed. Falling back to a single session...")
+            # Images the pool already tagged or failed are not run again
+            pending = [p for p in pending if p not in handled]
+        self.run_session(pending)
+
+    def stopped(self):
+        return bool(self.should_stop and self.should_stop())
+
+    def report(self, current, total, filename):
+        if self.on_progress:
+            self.on_progress(current, total, filename)
+
+    def emit_progress(self, img_path):
+        self.report(self.done, len(self.image_paths), os.path.basename(img_path))
+        self.done += 1
+
+    def mark_failed(self, img_path, error):
+        print(f"Error: {error}")
+        self.job.mark_failed(img_path, error)
+        self.failed_paths.append(img_path)
+
+    def on_stored(self, img_path, error):
+        # Called by the tag store once the sidecar is written, so a checkpoint
+        # never lists an image as done while its tags are still queued
+        if error is None:
+            self.job.mark_done(img_path)
+        else:
+            self.mark_failed(img_path, error)
+
+    def apply_scores(self, paths, scores, from_cache=False):
+        if not paths:
+            return
+        results = self.tagger.tags_from_scores(scores, self.threshold, self.threshold)
+        for img_path, row, (general_tags, character_tags) in zip(paths, scores, results):
+            try:
+                if not from_cache and self.cache and img_path in self.digests:
+                    self.cache.put_scores(self.digests[img_path], self.tagger.spec["repo_id"], self.tagger.version, row)
+                new_tags = list(character_tags.keys()) + list(general_tags.keys())
+                if self.store:
+                    self.store.put(img_path, row)
+                    self.tag_store.submit(img_path, self.merge_recorded(img_path, new_tags), self.on_stored)
+                else:
+                    self.tag_store.merge(img_path, new_tags, self.on_stored)
+            except Exception as e:
+                self.mark_failed(img_path, e)
+
+    def merge_recorded(self, img_path, new_tags):
+        """Tag store update appending new_tags that also records in the score
+        store which of them the image did not have yet"""
+        def update(tags):
+            merged = append_missing(tags, new_tags)
+            self.store.mark_applied(img_path, merged[len(tags):])
+            return merged
+        return update
+
+    def apply_cached_scores(self, image_paths):
+        """Tag images with stored scores; returns the paths that still need inference"""
+        model, version = self.tagger.spec["repo_id"], self.tagger.version
+
+        def lookup(path):
+            digest = self.cache.image_hash(path)
+            return digest, self.cache.get_scores(digest, model, version)
+
+        pending = []
+        paths, rows = [], []
+        # Hashing reads every file, so it runs on the decoder threads
+        with PrefetchDecoder(image_paths, lookup) as decoder:
+            for img_path, result, error in decoder:
+                if self.stopped(): break
+                if error is not None:
+                    pending.append(img_path)
+                    continue
+                digest, scores = result
+                self.digests[img_path] = digest
+                if scores is None or len(scores) != len(self.tagger.tag_names):
+                    pending.append(img_path)
+                    continue
+                self.emit_progress(img_path)
+                paths.append(img_path)
+                rows.append(scores)
+                if len(paths) >= self.batch_size:
+                    self.apply_scores(paths, np.stack(rows), from_cache=True)
+                    paths, rows = [], []
+        if paths:
+            self.apply_scores(paths, np.stack(rows), from_cache=True)
+        return pending
+
+    def run_session(self, image_paths):
+        try:
+            self.tagger.load()
+        except Exception:
+            traceback.print_exc()
+            print("Could not start the ONNX tagger session. Falling back to imgutils...")
+            self.tagger = None
+            self.run_imgutils(image_paths)
+            return
+
+        # Decoder threads preprocess the next batches while the session runs
+        with PrefetchDecoder(image_paths, self.tagger.preprocess, depth=self.batch_size * 3) as decoder:
+            for batch in decoder.batches(self.batch_size):
+                if self.stopped(): break
+                paths, inputs = [], []
+                for img_path, array, error in batch:
+                    self.emit_progress(img_path)
+                    if error is not None:
+                        self.mark_failed(img_path, error)
+                        continue
+                    paths.append(img_path)
+                    inputs.append(array)
+                if not inputs:
+                    continue
+                try:
+                    scores = self.tagger.predict(np.stack(inputs))
+                except Exception as e:
+                    traceback.print_exc()
+                    for img_path in paths:
+                        self.mark_failed(img_path, e)
+                    continue
+                self.apply_scores(paths, scores)
+
+    def run_processes(self, image_paths, handled):
+        pool = TaggerProcessPool(self.model_name, processes=self.cpu_processes)
+        results = pool.scores(image_paths, self.batch_size, should_stop=self.stopped)
+        try:
+            for img_path, scores, error in results:
+                if self.stopped(): break
+                self.emit_progress(img_path)
+                handled.add(img_path)
+                if error is not None:
+                    self.mark_failed(img_path, error)
+                    continue
+                self.apply_scores([img_path], scores[np.newaxis])
+        finally:
+            results.close()
+
+    def run_imgutils(self, image_paths):
+        try:
+            from imgutils.tagging.pixai import get_pixai_tags
+            import inspect
+            params = inspect.signature(get_pixai_tags).parameters
+            tagger_kwargs = {"model_name": self.model_name}
+            if "threshold" in params:
+                tagger_kwargs["threshold"] = self.threshold
+            elif "thresholds" in params:
+                tagger_kwargs["thresholds"] = self.threshold
+            tag_image = lambda image: get_pixai_tags(image, **tagger_kwargs)
+        except ImportError:
+            from imgutils.tagging import get_wd14_tags
+            tag_image = lambda image: get_wd14_tags(image, model_name='SwinV2', general_threshold=self.threshold, character_threshold=self.threshold)
+
+        # Images are decoded on background threads while the tagger runs
+        with PrefetchDecoder(image_paths, load_rgb) as decoder:
+            for img_path, image, error in decoder:
+                if self.stopped(): break
+                self.emit_progress(img_path)
+                if error is not None:
+                    self.mark_failed(img_path, error)
+                    continue
+                try:
+                    general_tags, character_tags = tag_image(image)
+                    self.tag_store.merge(img_path, list(character_tags.keys()) + list(general_tags.keys()), self.on_stored)
+                except Exception as e:
+                    self.mark_failed(img_path, e)
+
+
+class BatchCaptioner:
+    """Florence-2 batch captioning of a folder as a resumable BatchJob"""
+
+    def __init__(self, file_manager, image_paths, task_prompt="<DETAILED_CAPTION>", batch_size=FLORENCE_BATCH_SIZE, job=None, skip_duplicates=False):
+        self.file_manager = file_manager
+        self.task_prompt = task_prompt
+        self.batch_size = max(1, batch_size)
+        self.model_id = FLORENCE_MODEL_ID
+        # A resumed job brings its own image list; otherwise a new one is started
+        self.job = job or BatchJob(file_manager.folder_path, "florence", {"model": self.model_id, "task": task_prompt, "skip_duplicates": skip_duplicates}, image_paths)
+        self.image_paths = self.job.image_paths
+        self.skip_duplicates = self.job.params.get("skip_duplicates", False)
+        self.tag_store = file_manager.tag_store()
+        self.host = None
+        self.cache = None
+        self.version = None
+        self.digests = {}
+        self.failed_paths = []
+        self.done = 0
+        self.on_progress = None
+        self.should_stop = None
+
+    def stopped(self):
+        return bool(self.should_stop and self.should_stop())
+
+    def report(self, current, total, filename):
+        if self.on_progress:
+            self.on_progress(current, total, filename)
+
+    def mark_failed(self, img_path, error):
+        print(f"Error: {error}")
+        self.job.mark_failed(img_path, error)
+        self.failed_paths.append(img_path)
+
+    def on_stored(self, img_path, error):
+        # Called by the tag store once the sidecar is written, so a checkpoint
+        # never lists an image as done while its tags are still queued
+        if error is None:
+            self.job.mark_done(img_path)
+        else:
+            self.mark_failed(img_path, error)
+
+    def save_caption(self, img_path, result):
+        try:
+            # Region answers without any labels just add nothing
+            result = caption_text(result)
+            if result:
+                self.tag_store.merge(img_path, [result], self.on_stored)
+            else:
+                self.job.mark_done(img_path)
+        except Exception as e:
+            traceback.print_exc()
+            self.mark_failed(img_path, e)
+
+    def run(self, on_progress=None, should_stop=None):
+        """Caption every image the job still needs. Returns (images done, total)."""
+        self.on_progress = on_progress
+        self.should_stop = should_stop
+        total = len(self.image_paths)
+        try:
+            if self.skip_duplicates:
+                skip_duplicates(self.job, on_progress=self.report, should_stop=self.stopped)
+            self.host = get_florence_host(self.model_id)
+            self.cache = get_inference_cache()
+            self.version = self.host.version() if self.cache else None
+
+            # Images that failed are tried again until they run out of attempts
+            pending = self.job.remaining()
+            while pending and not self.stopped():
+                self.done = total - len(pending)
+                self.failed_paths = []
+                self.process(pending)
+                # Write failures are reported by the tag store
+                self.tag_store.drain()
+                pending = [p for p in self.failed_paths if self.job.can_retry(p)]
+
+            if self.cache: self.cache.commit()
+            self.job.finish()
+            done, _, _ = self.job.counts()
+            return done, total
+        except Exception:
+            self.tag_store.drain()
+            self.job.checkpoint()
+            raise
+
+    def process(self, image_paths):
+        pending = self.apply_cached_results(image_paths) if self.cache else list(image_paths)
+        if not pending or self.stopped():
+            return
+
+        host = self.host
+        host.load()
+        input_size = host.input_size()
+        decode = resize_for_model(input_size) if input_size else (lambda p: (load_rgb(p), None))
+
+        # Decoder threads prepare the next batches while the model runs
+        with PrefetchDecoder(pending, decode, depth=self.batch_size * 3) as decoder:
+            for batch in decoder.batches(self.batch_size):
+                if self.stopped(): break
+                self.report(self.done, len(self.image_paths), os.path.basename(batch[0][0]))
+                self.done += len(batch)
+
+                paths, images, sizes = [], [], []
+                for img_path, decoded, error in batch:
+                    if error is not None:
+                        self.mark_failed(img_path, f"could not decode: {error}")
+                        continue
+                    image, original_size = decoded
+                    paths.append(img_path)
+                    images.append(image)
+                    sizes.append(original_size or image.size)
+                if not images:
+                    continue
+                try:
+                    results = host.caption_batch(images, self.task_prompt, self.batch_size, image_sizes=sizes)
+                except Exception as e:
+                    traceback.print_exc()
+                    for img_path in paths:
+                        self.mark_failed(img_path, e)
+                    continue
+
+                for img_path, result in zip(paths, results):
+                    if self.cache and img_path in self.digests and isinstance(result, str):
+                        self.cache.put_result(self.digests[img_path], self.model_id, self.version, self.task_prompt, result)
+                    self.save_caption(img_path, result)
+
+    def apply_cached_results(self, image_paths):
+        """Save captions made before for the same image, model and task; returns
+        the paths that still need the model"""
+        def lookup(path):
+            digest = self.cache.image_hash(path)
+            return digest, self.cache.get_result(digest, self.model_id, self.version, self.task_prompt)
+
+        pending = []
+        with PrefetchDecoder(image_paths, lookup) as decoder:
+            for img_path, found, error in decoder:
+                if self.stopped(): break
+                if error is not None:
+                    pending.append(img_path)
+                    continue
+                digest, result = found
+                self.digests[img_path] = digest
+                if result is None:
+                    pending.append(img_path)
+                    continue
+                self.report(self.done, len(self.image_paths), os.path.basename(img_path))
+                self.done += 1
+                self.save_caption(img_path, result)
+        return pending
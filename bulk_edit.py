@@ -0,0 +1,240 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tag_cache import get_cache_dir, folder_key
+
+BULK_EDIT_WORKERS = 8
+
+
+class BulkEditError(Exception):
+    pass
+
+
+def add_tag_edit(tag, position="end"):
+    def edit(tags):
+        if tag in tags:
+            return tags
+        return [tag] + tags if position == "start" else tags + [tag]
+    return edit
+
+
+def remove_tag_edit(tag):
+    def edit(tags):
+        return [t for t in tags if t != tag]
+    return edit
+
+
+def replace_tag_edit(old_tag, new_tag):
+    new_tag = new_tag.strip() if new_tag else ""
+
+    def edit(tags):
+        if old_tag not in tags:
+            return tags
+        tags = list(tags)
+        idx = tags.index(old_tag)
+        if not new_tag or new_tag in tags:
+            tags.pop(idx)
+        else:
+            tags[idx] = new_tag
+        return tags
+    return edit
+
+
+def journal_path(folder_path):
+    return os.path.join(get_cache_dir(), f"journal_{folder_key(folder_path)}.json")
+
+
+class BulkEdit:
+    """One bulk tag operation applied to a folder as a single unit.
+
+    Candidate images come from the tag index, so only files that actually
+    change are read and rewritten. New contents are computed first, then a
+    write-ahead journal with the before/after tags of every file is stored
+    in the cache dir and the files are written in parallel (save_tags
+    replaces each sidecar atomically). If a write fails or the edit is
+    cancelled, the files already written are restored, and a journal left
+    behind by a crash can be rolled back with rollback_journal.
+    """
+    # Planned tags go through the file manager's tag dictionary, so the
+    # recorded after tags are exactly what gets written
+    canonicalize = True
+
+    def __init__(self, file_manager, description, edit, image_paths):
+        self.file_manager = file_manager
+        self.description = description
+        self.edit = edit
+        self.image_paths = list(image_paths)
+        self.changes = [] # (image_path, before, after)
+        self.cancelled = False
+
+    def _plan_one(self, image_path):
+        tags = self.file_manager.get_tags(image_path)
+        return tags, self.edit(list(tags))
+
+    def plan(self):
+        self.changes = []
+        with ThreadPoolExecutor(BULK_EDIT_WORKERS) as pool:
+            for image_path, (before, after) in zip(self.image_paths, pool.map(self._plan_one, self.image_paths)):
+                if after != before and self.canonicalize:
+                    after = self.file_manager.canonical_tags(after)
+                if after != before:
+                    self.changes.append((image_path, before, after))
+        return self.changes
+
+    def run(self, on_progress=None, should_stop=None):
+        """Apply the edit. Returns the number of files changed (0 when cancelled)."""
+        self.plan()
+        if not self.changes:
+            return 0
+        self._write_journal()
+        applied, failed = self._write_all([(p, after) for p, _, after in self.changes], on_progress, should_stop)
+        if failed or (should_stop and should_stop()):
+            before = {p: b for p, b, _ in self.changes}
+            _, restore_failed = self._write_all([(p, before[p]) for p in applied])
+            if not restore_failed:
+                self._remove_journal()
+            if failed:
+                raise BulkEditError(
+                    f"Could not write {os.path.basename(failed[0])}; "
+                    f"the {len(applied)} files already written were restored."
+                )
+            self.cancelled = True
+            return 0
+        self._remove_journal()
+        return len(self.changes)
+
+    def _write_all(self, writes, on_progress=None, should_stop=None):
+        applied = []
+        failed = []
+        total = len(writes)
+        pool = ThreadPoolExecutor(BULK_EDIT_WORKERS)
+        # Written as planned; restores must bring back the exact old tags
+        futures = {pool.submit(self.file_manager.save_tags, path, tags, False): path for path, tags in writes}
+        try:
+            for i, future in enumerate(as_completed(futures)):
+                path = futures[future]
+                if on_progress:
+                    on_progress(i, total, os.path.basename(path))
+                if not future.result():
+                    failed.append(path)
+                if failed or (should_stop and should_stop()):
+                    break
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+        for future, path in futures.items():
+            if future.done() and not future.cancelled() and future.result():
+                applied.append(path)
+        return applied, failed
+
+    def inverse(self):
+        return RestoreEdit(
+            self.file_manager, self.description,
+            [(p, after, before) for p, before, after in self.changes],
+        )
+
+    def _write_journal(self):
+        path = journal_path(self.file_manager.folder_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {
+            "folder": os.path.abspath(self.file_manager.folder_path),
+            "description": self.description,
+            "changes": self.changes,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _remove_journal(self):
+        discard_journal(self.file_manager.folder_path)
+
+
+class RestoreEdit(BulkEdit):
+    """Moves each image from one recorded tag list to another. Images whose
+    tags were changed again in the meantime are left alone."""
+    canonicalize = False
+
+    def __init__(self, file_manager, description, changes):
+        super().__init__(file_manager, description, None, [p for p, _, _ in changes])
+        self.targets = {p: (list(expected), list(wanted)) for p, expected, wanted in changes}
+
+    def _plan_one(self, image_path):
+        tags = self.file_manager.get_tags(image_path)
+        expected, wanted = self.targets[image_path]
+        return tags, (wanted if tags == expected else tags)
+
+
+def pending_journal(folder_path):
+    """Description of a bulk edit that did not finish in folder_path, or None"""
+    try:
+        with open(journal_path(folder_path), "r", encoding="utf-8") as f:
+            return json.load(f).get("description", "bulk edit")
+    except (OSError, ValueError):
+        return None
+
+
+def rollback_journal(file_manager):
+    """Undo a bulk edit interrupted by a crash. Returns the number of files restored."""
+    path = journal_path(file_manager.folder_path)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    restore = RestoreEdit(
+        file_manager, data.get("description", ""),
+        [(p, after, before) for p, before, after in data.get("changes", [])],
+    )
+    count = restore.run()
+    discard_journal(file_manager.folder_path)
+    return count
+
+
+def discard_journal(folder_path):
+    try:
+        os.remove(journal_path(folder_path))
+    except OSError:
+        pass
+
+
+class BulkEditHistory:
+    """Undo/redo stacks of completed bulk edits for the loaded folder"""
+
+    def __init__(self, limit=20):
+        self.limit = limit
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def clear(self):
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def record(self, bulk_edit, kind="do"):
+        """Record a finished edit; kind is "undo" or "redo" for edits obtained
+        from undo_edit/redo_edit"""
+        if kind == "undo":
+            self.undo_stack.pop()
+            if bulk_edit.changes:
+                self.redo_stack.append(bulk_edit)
+        elif kind == "redo":
+            self.redo_stack.pop()
+            if bulk_edit.changes:
+                self.undo_stack.append(bulk_edit)
+        elif bulk_edit.changes:
+            self.undo_stack.append(bulk_edit)
+            del self.undo_stack[:-self.limit]
+            self.redo_stack = []
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def undo_edit(self):
+        return self.undo_stack[-1].inverse() if self.undo_stack else None
+
+    def redo_edit(self):
+        return self.redo_stack[-1].inverse() if self.redo_stack else None
@@ -0,0 +1,26 @@
+import traceback
+from PyQt6.QtCore import QThread, pyqtSignal
+from bulk_edit import BulkEditError
+
+
+class BulkEditWorker(QThread):
+    progress = pyqtSignal(int, int, str)
+    finished = pyqtSignal(int, int, str) # changed files, planned files, error_msg
+
+    def __init__(self, file_manager, bulk_edit, kind="do"):
+        super().__init__()
+        self.file_manager = file_manager
+        self.bulk_edit = bulk_edit
+        self.kind = kind
+
+    def run(self):
+        try:
+            count = self.bulk_edit.run(on_progress=self.progress.emit, should_stop=self.isInterruptionRequested)
+            if not self.bulk_edit.cancelled:
+                self.file_manager.bulk_history.record(self.bulk_edit, self.kind)
+            self.finished.emit(count, len(self.bulk_edit.changes), "")
+        except BulkEditError as e:
+            self.finished.emit(0, len(self.bulk_edit.changes), str(e))
+        except Exception as e:
+            traceback.print_exc()
+            self.finished.emit(0, len(self.bulk_edit.changes), str(e))
@@ -0,0 +1,88 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+DECODE_WORKERS = min(8, os.cpu_count() or 4)
+PREFETCH_DEPTH = 32
+
+
+def load_rgb(path):
+    with Image.open(path) as image:
+        return image.convert("RGB")
+
+
+def resize_for_model(size):
+    """Decode function that also scales images down to size (w, h) for models
+    that resize to a fixed input anyway. Returns (image, original size)."""
+    def decode(path):
+        with Image.open(path) as image:
+            original_size = image.size
+            if image.format == "JPEG":
+                # Let libjpeg decode at a fraction of the resolution
+                image.draft("RGB", (size[0] * 2, size[1] * 2))
+            image = image.convert("RGB")
+        return image.resize(size, Image.Resampling.BICUBIC), original_size
+    return decode
+
+
+class PrefetchDecoder:
+    """Decodes images on a thread pool ahead of the model.
+
+    Iterating yields (path, result, error) in input order, where result is
+    decode(path) or None if it raised. At most `depth` images are decoded or
+    waiting at any time, so memory stays bounded while disk reads and decoding
+    overlap with inference on the consumer thread. Pillow releases the GIL
+    while decoding, so threads scale across cores.
+    """
+
+    def __init__(self, image_paths, decode=load_rgb, workers=DECODE_WORKERS, depth=PREFETCH_DEPTH):
+        self.image_paths = list(image_paths)
+        self.decode = decode
+        self.depth = max(1, depth)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._pending = deque()
+        self._next = 0
+
+    def _fill(self):
+        while len(self._pending) < self.depth and self._next < len(self.image_paths):
+            path = self.image_paths[self._next]
+            self._pending.append((path, self._pool.submit(self.decode, path)))
+            self._next += 1
+
+    def __iter__(self):
+        try:
+            self._fill()
+            while self._pending:
+                path, future = self._pending.popleft()
+                try:
+                    result, error = future.result(), None
+                except Exception as e:
+                    result, error = None, e
+                self._fill()
+                yield path, result, error
+        finally:
+            self.close()
+
+    def batches(self, batch_size):
+        """Lists of up to batch_size (path, result, error) tuples"""
+        batch = []
+        for item in self:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def close(self):
+        for _, future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
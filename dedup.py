@@ -0,0 +1,274 @@
+import os
+import sqlite3
+import threading
+import numpy as np
+from PIL import Image
+from decode_pipeline import PrefetchDecoder
+from tag_cache import get_cache_dir, stat_key
+
+# Near-duplicate detection with perceptual hashes. Every image gets a 64-bit
+# pHash (low frequencies of a DCT) and dHash (brightness gradients); images
+# whose pHashes are within DUPLICATE_DISTANCE bits are candidates, and the
+# dHash has to agree as well so unrelated images that collide on one hash
+# are not grouped.
+
+HASH_CACHE_VERSION = 1
+COMMIT_EVERY = 500
+PHASH_SIZE = 32
+HASH_SIZE = 8
+DUPLICATE_DISTANCE = 6
+# dHash is noisier than pHash for the same edit, so it gets more room
+DHASH_FACTOR = 2
+# Pairwise distances computed at once inside a bucket
+BLOCK_CELLS = 1 << 22
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(1 << 16)], dtype=np.uint8)
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(PHASH_SIZE)
+
+
+def _bits_to_int(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def image_hashes(path):
+    """(phash, dhash, width, height) of an image file"""
+    with Image.open(path) as image:
+        width, height = image.size
+        if image.format == "JPEG":
+            # Let libjpeg decode at a fraction of the resolution
+            image.draft("L", (PHASH_SIZE * 2, PHASH_SIZE * 2))
+        gray = image.convert("L")
+    pixels = np.asarray(gray.resize((PHASH_SIZE, PHASH_SIZE), Image.Resampling.LANCZOS), dtype=np.float32)
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE].ravel()
+    # The DC term is the mean brightness and would skew the median
+    phash = _bits_to_int(low > np.median(low[1:]))
+    small = np.asarray(gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BILINEAR), dtype=np.int16)
+    dhash = _bits_to_int(small[:, 1:] > small[:, :-1])
+    return phash, dhash, width, height
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def _signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class HashCache:
+    """SQLite store of perceptual hashes keyed by image path and mtime/size,
+    so only new or changed images are decoded again"""
+
+    def __init__(self, cache_dir=None):
+        cache_dir = cache_dir or get_cache_dir()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, "hashes.sqlite")
+        self._pending = 0
+        self._lock = threading.Lock()
+        # Shared by the decoder threads
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self._init_schema()
+
+    def _init_schema(self):
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self.conn.execute("SELECT value FROM meta WHERE key='version'").fetchone()
+        if row is None or int(row[0]) != HASH_CACHE_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS hashes")
+            self.conn.execute("DELETE FROM meta")
+            self.conn.execute("INSERT INTO meta VALUES ('version', ?)", (str(HASH_CACHE_VERSION),))
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, "
+            "phash INTEGER, dhash INTEGER, width INTEGER, height INTEGER)"
+        )
+        self.conn.commit()
+
+    def get(self, path, key):
+        """Stored hashes of path if its (mtime_ns, size) is still key"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT mtime_ns, size, phash, dhash, width, height FROM hashes WHERE path=?",
+                (os.path.abspath(path),),
+            ).fetchone()
+        if row is None or (row[0], row[1]) != tuple(key):
+            return None
+        return _unsigned(row[2]), _unsigned(row[3]), row[4], row[5]
+
+    def put(self, path, key, hashes):
+        phash, dhash, width, height = hashes
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(path), key[0], key[1], _signed(phash), _signed(dhash), width, height),
+            )
+            self._pending += 1
+            if self._pending >= COMMIT_EVERY:
+                self.conn.commit()
+                self._pending = 0
+
+    def commit(self):
+        with self._lock:
+            self.conn.commit()
+            self._pending = 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_hash_cache():
+    """Process-wide HashCache, or None if the cache dir is not writable"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = HashCache()
+            except (OSError, sqlite3.Error) as e:
+                print(f"Hash cache disabled: {e}")
+                return None
+        return _cache
+
+
+def compute_hashes(image_paths, on_progress=None, should_stop=None, cache=None):
+    """{path: (phash, dhash, width, height)} for image_paths. Images are
+    decoded on the PrefetchDecoder threads; unchanged ones come from the cache.
+    Images that cannot be read are left out."""
+    cache = cache or get_hash_cache()
+
+    def lookup(path):
+        key = stat_key(path)
+        found = cache.get(path, key) if cache else None
+        if found is None:
+            found = image_hashes(path)
+            if cache: cache.put(path, key, found)
+        return found
+
+    hashes = {}
+    total = len(image_paths)
+    with PrefetchDecoder(image_paths, lookup) as decoder:
+        for i, (path, found, error) in enumerate(decoder):
+            if should_stop and should_stop(): break
+            if on_progress:
+                on_progress(i, total, os.path.basename(path))
+            if error is not None:
+                print(f"Could not hash {path}: {error}")
+                continue
+            hashes[path] = found
+    if cache: cache.commit()
+    return hashes
+
+
+def _chunks(max_distance):
+    """Bit ranges splitting 64 bits into max_distance + 1 parts. Two hashes
+    within max_distance bits are equal in at least one part."""
+    parts = max(1, min(64, max_distance + 1))
+    bounds = [64 * i // parts for i in range(parts + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+
+def _popcount(values):
+    return _POPCOUNT[values.view(np.uint16)].reshape(values.shape + (4,)).sum(axis=-1, dtype=np.uint8)
+
+
+def near_pairs(values, max_distance):
+    """Index pairs (i, j), i < j, of distinct 64-bit values within max_distance bits.
+
+    Multi-index search: the values are bucketed on each chunk of _chunks(), and
+    only values sharing a bucket are compared, with numpy popcounts, instead
+    of comparing every pair.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    pairs = set()
+    for start, end in _chunks(max_distance):
+        keys = (values >> np.uint64(64 - end)) & np.uint64((1 << (end - start)) - 1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        splits = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+        for members in np.split(order, splits):
+            if len(members) < 2:
+                continue
+            bucket = values[members]
+            rows = max(1, BLOCK_CELLS // len(members))
+            for row in range(0, len(members), rows):
+                # Each block only against itself and the values after it
+                block = bucket[row:row + rows]
+                distances = _popcount(block[:, None] ^ bucket[None, row:])
+                for a, b in zip(*np.nonzero(distances <= max_distance)):
+                    if a < b:
+                        i, j = members[row + a], members[row + b]
+                        pairs.add((int(min(i, j)), int(max(i, j))))
+    return pairs
+
+
+def find_duplicates(hashes, max_distance=DUPLICATE_DISTANCE):
+    """Groups of near-duplicate images among hashes from compute_hashes.
+
+    Each group starts with the image to keep (the most pixels, then the path)
+    followed by the others; groups are sorted by that first image.
+    """
+    by_phash = {}
+    for path, found in hashes.items():
+        by_phash.setdefault(found[0], []).append(path)
+    values = list(by_phash)
+    parent = list(range(len(values)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    dhash_distance = max_distance * DHASH_FACTOR
+    for i, j in near_pairs(values, max_distance):
+        if root(i) == root(j):
+            continue
+        if any(hamming(hashes[a][1], hashes[b][1]) <= dhash_distance
+               for a in by_phash[values[i]] for b in by_phash[values[j]]):
+            parent[root(j)] = root(i)
+
+    groups = {}
+    for i, value in enumerate(values):
+        groups.setdefault(root(i), []).extend(by_phash[value])
+    result = []
+    for paths in groups.values():
+        if len(paths) > 1:
+            paths.sort(key=lambda p: (-hashes[p][2] * hashes[p][3], p))
+            result.append([paths[0]] + sorted(paths[1:]))
+    result.sort(key=lambda group: group[0])
+    return result
+
+
+def duplicate_paths(groups):
+    """Every image of groups except the one kept from each"""
+    return {path for group in groups for path in group[1:]}
+
+
+def skip_duplicates(job, max_distance=DUPLICATE_DISTANCE, on_progress=None, should_stop=None):
+    """Mark the images of a BatchJob that duplicate another image of the job
+    as skipped, so only one image of each group goes through the model.
+    Returns the paths skipped by this call."""
+    hashes = compute_hashes(job.image_paths, on_progress, should_stop)
+    if should_stop and should_stop():
+        return []
+    duplicates = duplicate_paths(find_duplicates(hashes, max_distance))
+    skipped = [p for p in job.remaining() if p in duplicates]
+    for path in skipped:
+        job.mark_skipped(path)
+    return skipped
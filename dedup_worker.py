@@ -0,0 +1,25 @@
+import traceback
+from PyQt6.QtCore import QThread, pyqtSignal
+from dedup import compute_hashes, find_duplicates, DUPLICATE_DISTANCE
+
+
+class DuplicateScanWorker(QThread):
+    """Hashes the folder's images (cached by mtime) and groups near-duplicates"""
+    progress = pyqtSignal(int, int, str)
+    finished = pyqtSignal(list, str) # groups of image paths, error_msg
+
+    def __init__(self, image_paths, max_distance=DUPLICATE_DISTANCE):
+        super().__init__()
+        self.image_paths = list(image_paths)
+        self.max_distance = max_distance
+
+    def run(self):
+        try:
+            hashes = compute_hashes(self.image_paths, on_progress=self.progress.emit, should_stop=self.isInterruptionRequested)
+            if self.isInterruptionRequested():
+                self.finished.emit([], "")
+                return
+            self.finished.emit(find_duplicates(hashes, self.max_distance), "")
+        except Exception as e:
+            traceback.print_exc()
+            self.finished.emit([], str(e))
@@ -1,7 +1,39 @@
 import os
-import glob
+import time
+import bisect
+import threading
+from tag_query import TagQueryIndex
+from tag_cache import TagCache, stat_key
+from bulk_edit import BulkEdit, BulkEditHistory, add_tag_edit, remove_tag_edit, replace_tag_edit
+from tag_store import TagStore, StaleImageError
+from tag_suggest import TagSuggestIndex
+from tag_stats import TagStats, co_occurrence
 
 SUPPORTED_IMAGE_EXTS = {'.png', '.jpg', '.jpeg', '.webp'}
+# Streaming folder loads hand out a batch every LOAD_BATCH_SIZE images or
+# LOAD_BATCH_INTERVAL seconds, whichever comes first
+LOAD_BATCH_SIZE = 2000
+LOAD_BATCH_INTERVAL = 0.2
+# Deferred sidecar writes are flushed once a file has had no edits for this long
+WRITE_BEHIND_DELAY = 1.0
+
+
+def write_text_atomic(path, text):
+    """Replace path with text so readers and crashes only ever see the old or the new file"""
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
 
 class FileManager:
     def __init__(self):
@@ -9,44 +41,427 @@ class FileManager:
         self.all_image_files = []
         self.image_files = [] # This will hold filtered files
         self.current_index = -1
+        self.filter_query = ""
+        # Groups of near-duplicate images from the last duplicate scan, see
+        # dedup.py; with duplicates_only the filter lists just those, group by group
+        self.duplicate_groups = []
+        self.duplicates_only = False
+        self.recursive = False
+        self.load_generation = 0
+        # Inverted tag index built once per folder: tag -> set of image paths,
+        # plus the parsed tags of every image so edits can be diffed against it.
+        self.tag_index = {}
+        self.image_tags = {}
+        # Bitset posting lists for the search box, built on first query
+        self._query_index = None
+        # Ranked autocomplete over tag_index, built on first use
+        self._suggest_index = None
+        # Incremental tag statistics, see tag_stats.py, built on first use
+        self._tag_stats = None
+        # (mtime_ns, size) of each image's sidecar as of the last read or write
+        self.sidecar_stats = {}
+        # Persistent per-folder cache of parsed sidecars, see tag_cache.py
+        self.use_cache = True
+        self._tag_cache = None
+        # Write-behind queue for interactive edits: image path -> (tags, last edit time)
+        self.write_delay = WRITE_BEHIND_DELAY
+        self._pending_writes = {}
+        # time.monotonic() of the last sidecar this app wrote
+        self.last_own_write = 0.0
+        # Completed bulk edits that can be undone as a unit, see bulk_edit.py
+        self.bulk_history = BulkEditHistory()
+        # Batch AI workers save from their own thread while the GUI filters
+        self._index_lock = threading.RLock()
+        # Held around each sidecar write of the write-behind queue so two
+        # flushing threads never write the same file out of order
+        self._write_lock = threading.Lock()
+        # Writer thread for tag changes from background workers, see tag_store.py
+        self._tag_store = None
+        # Tag dictionary (tag_vocab.TagVocabulary); when set, aliases are
+        # replaced by their tag whenever tags are saved
+        self.vocabulary = None
+
+    def load_folder(self, path, recursive=None):
+        """Load a folder synchronously; the GUI streams it through FolderLoaderWorker instead"""
+        generation = self.begin_load(path, recursive)
+        if not os.path.isdir(path):
+            return
+        self.finish_load(generation, self.scan_folder(path))
+
+    def begin_load(self, path, recursive=None):
+        """Reset the state for a new folder and open its tag cache.
 
-    def load_folder(self, path):
+        Returns the load generation; batches and results of an older load are
+        ignored by add_loaded_images and finish_load.
+        """
+        self.close()
+        if recursive is not None:
+            self.recursive = recursive
+        self.load_generation += 1
         self.folder_path = path
         self.all_image_files = []
-        
-        if not os.path.exists(path):
-            return
+        self.image_files = []
+        self.current_index = -1
+        self.filter_query = ""
+        self.duplicate_groups = []
+        self.duplicates_only = False
+        self.bulk_history.clear()
+        with self._index_lock:
+            self.tag_index = {}
+            self.image_tags = {}
+            self.sidecar_stats = {}
+            self._query_index = None
+            self._suggest_index = None
+            self._tag_stats = None
+            if self.use_cache and os.path.isdir(path):
+                try:
+                    self._tag_cache = TagCache(path)
+                except Exception as e:
+                    print(f"Tag cache unavailable: {e}")
+                    self._tag_cache = None
+        return self.load_generation
 
-        # Escape path for glob to handle special characters like '[' or ']'
-        escaped_path = glob.escape(path)
-        
-        # Get all files and filter by supported extensions strictly
-        all_files = glob.glob(os.path.join(escaped_path, "*"))
-        for file in all_files:
-            ext = os.path.splitext(file)[1].lower()
-            if ext in SUPPORTED_IMAGE_EXTS:
-                self.all_image_files.append(file)
-        
-        self.all_image_files.sort()
-        self.image_files = list(self.all_image_files)
-        
-        if self.image_files:
-            self.current_index = 0
+    def iter_image_files(self, path, recursive=False):
+        """Yield supported images under path in the order os.scandir returns them"""
+        pending = [path]
+        while pending:
+            folder = pending.pop()
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        try:
+                            ext = os.path.splitext(entry.name)[1].lower()
+                            if ext in SUPPORTED_IMAGE_EXTS and entry.is_file():
+                                yield entry.path
+                            elif recursive and not entry.name.startswith('.') and entry.is_dir(follow_symlinks=False):
+                                pending.append(entry.path)
+                        except OSError:
+                            continue
+            except OSError as e:
+                print(f"Cannot list {folder}: {e}")
+
+    def _list_image_files(self, path):
+        return list(self.iter_image_files(path, self.recursive))
+
+    def scan_folder(self, path, on_batch=None, on_progress=None, should_stop=None):
+        """List the images of path and read their tags without touching the loaded state.
+
+        Meant to run on a worker thread: on_batch(paths) receives unsorted
+        batches while the listing streams in (the first image on its own), and
+        on_progress(done, total) reports sidecar reading. Returns the data for
+        finish_load, or None when should_stop() turned true.
+        """
+        with self._index_lock:
+            cache = self._tag_cache
+            cached_entries = cache.load() if cache else {}
+            cached_listing = cache.get_meta("listing") if cache else None
+
+        # Taken before listing so entries created meanwhile invalidate it.
+        # Subfolder changes do not touch the root mtime, so recursive
+        # listings are never reused.
+        listing_key = "" if self.recursive else str(stat_key(path)[0])
+        if cached_entries and listing_key and cached_listing == listing_key:
+            # No entries were added, removed or renamed since the cache was written
+            image_iter = (os.path.join(path, name) for name in cached_entries)
         else:
-            self.current_index = -1
+            image_iter = self.iter_image_files(path, self.recursive)
+
+        image_files = []
+        batch = []
+        last_emit = time.monotonic()
+        for img_path in image_iter:
+            batch.append(img_path)
+            now = time.monotonic()
+            if not image_files or len(batch) >= LOAD_BATCH_SIZE or now - last_emit >= LOAD_BATCH_INTERVAL:
+                if should_stop and should_stop():
+                    return None
+                image_files.extend(batch)
+                if on_batch:
+                    on_batch(batch)
+                batch = []
+                last_emit = now
+        if batch:
+            image_files.extend(batch)
+            if on_batch:
+                on_batch(batch)
+
+        image_files.sort()
+        data = self.read_index_data(image_files, cached_entries, on_progress, should_stop)
+        if data is not None:
+            data["listing_key"] = listing_key
+        return data
+
+    def add_loaded_images(self, generation, image_paths):
+        """Append a streamed batch so it can be browsed before loading finishes"""
+        if generation != self.load_generation:
+            return False
+        with self._index_lock:
+            self.all_image_files.extend(image_paths)
+            self._query_index = None
+        if not self.filter_query and not self.duplicates_only:
+            self.image_files.extend(image_paths)
+        if self.current_index < 0 and self.image_files:
+            self.current_index = 0
+        return True
+
+    def finish_load(self, generation, data):
+        """Install the sorted file list and tag index produced by scan_folder"""
+        if data is None or generation != self.load_generation:
+            return False
+        current = self.get_current_image_path()
+        with self._index_lock:
+            # Sidecars saved while the worker was reading must not be reverted
+            saved_meanwhile = [
+                p for p, key in self.sidecar_stats.items()
+                if data["sidecar_stats"].get(p) != key
+            ]
+            self.all_image_files = data["image_files"]
+            self.image_tags = data["image_tags"]
+            self.tag_index = data["tag_index"]
+            self.sidecar_stats = data["sidecar_stats"]
+            self._query_index = None
+            self._suggest_index = None
+            self._tag_stats = None
+            if self._tag_cache:
+                self._tag_cache.put_many(data["changed"])
+                self._tag_cache.remove(data["stale"])
+                self._tag_cache.set_meta("listing", data["listing_key"])
+                self._tag_cache.commit()
+            for img_path in saved_meanwhile:
+                self.refresh_image(img_path)
+            # Queued edits are not on disk yet, so the worker read the old tags
+            known = set(self.all_image_files)
+            for img_path, (tags, _) in self._pending_writes.items():
+                if img_path in known:
+                    self._index_tags(img_path, tags)
+        self._refresh_view(current)
+        return True
+
+    def scan_changes(self):
+        """Compare the folder on disk with the loaded state.
+
+        Returns (added, removed, modified) image paths, where modified means the
+        sidecar's mtime or size changed. Only stats files, so it is safe to run
+        from a worker thread.
+        """
+        folder = self.folder_path
+        if not folder or not os.path.isdir(folder):
+            return [], [], []
+        on_disk = set(self._list_image_files(folder))
+        with self._index_lock:
+            known = dict(self.sidecar_stats)
+        added = sorted(on_disk - known.keys())
+        removed = sorted(known.keys() - on_disk)
+        modified = sorted(
+            p for p in on_disk & known.keys()
+            if stat_key(self.get_text_file_path(p)) != known[p]
+        )
+        return added, removed, modified
+
+    def read_sidecars(self, image_paths):
+        """{path: (stat key, tags)} of the sidecars of image_paths, for
+        apply_changes. Safe to run from a worker thread."""
+        result = {}
+        for img_path in image_paths:
+            # Stat first: a write racing the read leaves a stale key, so the
+            # next scan reads the sidecar again
+            key = stat_key(self.get_text_file_path(img_path))
+            result[img_path] = (key, self.read_tags(img_path))
+        return result
+
+    def _sidecar(self, image_path, sidecars):
+        """(key, tags) read ahead by read_sidecars, or None if image_path has
+        a queued write the read could not see"""
+        if not sidecars or image_path in self._pending_writes:
+            return None
+        return sidecars.get(image_path)
+
+    def refresh_image(self, image_path, sidecar=None):
+        """Re-read one sidecar if it changed on disk. Returns True when it did.
+
+        sidecar is an optional (key, tags) from read_sidecars used instead of
+        reading the file here.
+        """
+        with self._index_lock:
+            if image_path not in self.sidecar_stats:
+                return False
+            if sidecar is not None and image_path not in self._pending_writes:
+                key, tags = sidecar
+                if key == self.sidecar_stats[image_path]:
+                    return False
+                self._index_tags(image_path, tags)
+                self._update_cache(image_path, tags, key)
+                return True
+            if stat_key(self.get_text_file_path(image_path)) == self.sidecar_stats[image_path]:
+                return False
+            tags = self.read_tags(image_path)
+            self._index_tags(image_path, tags)
+            self._update_cache(image_path, tags)
+            return True
+
+    def apply_changes(self, added, removed, modified, sidecars=None):
+        """Apply a delta from scan_changes to the file list and tag index.
+
+        sidecars from read_sidecars lets this run without touching the disk.
+        Returns the images whose list membership or tags actually changed.
+        """
+        current = self.get_current_image_path()
+        changed = []
+        with self._index_lock:
+            if removed:
+                removed_set = set(removed) & self.sidecar_stats.keys()
+                self.all_image_files = [p for p in self.all_image_files if p not in removed_set]
+                for img_path in removed_set:
+                    self._index_tags(img_path, [])
+                    self.image_tags.pop(img_path, None)
+                    self.sidecar_stats.pop(img_path, None)
+                if self._tag_cache:
+                    self._tag_cache.remove([self._relative_name(p) for p in removed_set])
+                changed.extend(removed_set)
+            for img_path in added:
+                if img_path in self.sidecar_stats:
+                    continue
+                bisect.insort(self.all_image_files, img_path)
+                sidecar = self._sidecar(img_path, sidecars)
+                if sidecar is not None:
+                    key, tags = sidecar
+                else:
+                    key, tags = None, self.read_tags(img_path)
+                self._index_tags(img_path, tags)
+                self._update_cache(img_path, tags, key)
+                changed.append(img_path)
+            list_changed = bool(changed)
+            for img_path in modified:
+                if self.refresh_image(img_path, self._sidecar(img_path, sidecars)):
+                    changed.append(img_path)
+            if list_changed:
+                # Image ids are list positions, so the bitsets must be rebuilt
+                self._query_index = None
+        if changed:
+            self._refresh_view(current)
+        return changed
+
+    def _refresh_view(self, current_path):
+        """Re-run the active filter and stay on current_path if it is still listed"""
+        index = self.current_index
+        self.apply_filter(self.filter_query)
+        if current_path in self.image_files:
+            self.current_index = self.image_files.index(current_path)
+        elif self.image_files:
+            self.current_index = min(max(index, 0), len(self.image_files) - 1)
+
+    def read_index_data(self, image_files, cached_entries, on_progress=None, should_stop=None):
+        """Read the sidecars of image_files into fresh index structures.
+
+        Sidecars whose mtime and size match cached_entries (from the tag cache)
+        are not read again. Does not modify the loaded state.
+        """
+        image_tags = {}
+        sidecar_stats = {}
+        tag_index = {}
+        changed = []
+        names = set()
+        total = len(image_files)
+        for i, img_path in enumerate(image_files):
+            if i % 1000 == 0:
+                if should_stop and should_stop():
+                    return None
+                if on_progress:
+                    on_progress(i, total)
+            name = self._relative_name(img_path)
+            names.add(name)
+            key = stat_key(self.get_text_file_path(img_path))
+            entry = cached_entries.get(name)
+            if entry is not None and (entry[0], entry[1]) == key:
+                tags = entry[2]
+            else:
+                tags = self.read_tags(img_path)
+                changed.append((name, key[0], key[1], tags))
+            image_tags[img_path] = tags
+            sidecar_stats[img_path] = key
+            for tag in set(tags):
+                tag_index.setdefault(tag, set()).add(img_path)
+        return {
+            "image_files": image_files,
+            "image_tags": image_tags,
+            "tag_index": tag_index,
+            "sidecar_stats": sidecar_stats,
+            "changed": changed,
+            "stale": [name for name in cached_entries if name not in names],
+        }
+
+    def _relative_name(self, image_path):
+        root = os.path.join(self.folder_path, "")
+        if image_path.startswith(root):
+            return image_path[len(root):]
+        return image_path
+
+    def _update_cache(self, image_path, tags, key=None):
+        with self._index_lock:
+            if key is None:
+                key = stat_key(self.get_text_file_path(image_path))
+            self.sidecar_stats[image_path] = key
+            if self._tag_cache:
+                self._tag_cache.put(self._relative_name(image_path), key[0], key[1], tags)
+
+    def close(self):
+        """Flush pending writes and release the tag cache of the current folder"""
+        if self._tag_store is not None:
+            self._tag_store.close()
+        self.flush_writes()
+        self._save_listing()
+        with self._index_lock:
+            if self._tag_cache:
+                self._tag_cache.close()
+                self._tag_cache = None
+
+    def _index_tags(self, image_path, tags):
+        with self._index_lock:
+            old_tags = set(self.image_tags.get(image_path, ()))
+            new_tags = set(tags)
+            if self._tag_stats is not None:
+                self._tag_stats.update(old_tags, new_tags)
+            for tag in old_tags - new_tags:
+                paths = self.tag_index.get(tag)
+                if paths is not None:
+                    paths.discard(image_path)
+                    if not paths:
+                        del self.tag_index[tag]
+                    if self._suggest_index is not None:
+                        self._suggest_index.add(tag, -1)
+            for tag in new_tags - old_tags:
+                self.tag_index.setdefault(tag, set()).add(image_path)
+                if self._suggest_index is not None:
+                    self._suggest_index.add(tag, 1)
+            if self._query_index is not None:
+                self._query_index.update_image(image_path, old_tags, new_tags)
+            self.image_tags[image_path] = list(tags)
+
+    def get_query_index(self):
+        with self._index_lock:
+            if self._query_index is None:
+                self._query_index = TagQueryIndex(self.all_image_files, self.image_tags)
+            return self._query_index
+
+    def get_images_with_tag(self, tag):
+        """Images whose sidecar contains the exact tag, in folder order"""
+        with self._index_lock:
+            paths = self.tag_index.get(tag)
+            if not paths:
+                return []
+            return [p for p in self.all_image_files if p in paths]
 
     def apply_filter(self, query):
-        """Filter images by tag query (case-insensitive)"""
-        if not query:
+        """Filter images by a tag query (case-insensitive, see tag_query.py for the syntax)"""
+        self.filter_query = query or ""
+        if not query or not query.strip():
             self.image_files = list(self.all_image_files)
         else:
-            query = query.lower().strip()
-            filtered = []
-            for img_path in self.all_image_files:
-                tags = [t.lower() for t in self.read_tags(img_path)]
-                if query in tags:
-                    filtered.append(img_path)
-            self.image_files = filtered
+            with self._index_lock:
+                self.image_files = self.get_query_index().search(query)
+        if self.duplicates_only:
+            listed = set(self.image_files)
+            self.image_files = [p for group in self.duplicate_groups for p in group if p in listed]
 
         if self.image_files:
             self.current_index = 0
@@ -54,14 +469,54 @@ class FileManager:
             self.current_index = -1
         return len(self.image_files)
 
+    def set_duplicate_groups(self, groups):
+        """Install the result of dedup.find_duplicates for the duplicates filter"""
+        self.duplicate_groups = groups
+        if self.duplicates_only:
+            self._refresh_view(self.get_current_image_path())
+
+    def set_duplicates_only(self, enabled):
+        """List only images with near-duplicates, keeping each group together"""
+        self.duplicates_only = enabled
+        self._refresh_view(self.get_current_image_path())
+        return len(self.image_files)
+
     def get_all_unique_tags(self):
         """Aggregate all tags from all files in the current folder for autocomplete"""
-        unique_tags = set()
-        for img_path in self.all_image_files:
-            tags = self.read_tags(img_path)
-            for tag in tags:
-                unique_tags.add(tag)
-        return sorted(list(unique_tags))
+        with self._index_lock:
+            return sorted(self.tag_index)
+
+    def suggest_tags(self, text, limit=20):
+        """[(tag, image count)] completing text, most used first, with
+        near misses when few tags start with it"""
+        with self._index_lock:
+            if self._suggest_index is None:
+                self._suggest_index = TagSuggestIndex({tag: len(paths) for tag, paths in self.tag_index.items()})
+            return self._suggest_index.suggest(text, limit)
+
+    def get_tag_stats(self):
+        with self._index_lock:
+            if self._tag_stats is None:
+                self._tag_stats = TagStats(self.image_tags)
+            return self._tag_stats
+
+    def tag_statistics(self, top=50, rare_max=1, rare_limit=200):
+        """Summary, top tags, tags-per-image histogram and rare tags of the folder"""
+        with self._index_lock:
+            stats = self.get_tag_stats()
+            total = len(self.all_image_files)
+            return {
+                **stats.summary(total),
+                "top_tags": stats.top(top),
+                "histogram": stats.histogram(total),
+                "rare_tags": stats.rare(rare_max, rare_limit),
+                "version": stats.version,
+            }
+
+    def tag_co_occurrence(self, tags):
+        """Images sharing each pair of tags, see tag_stats.co_occurrence"""
+        with self._index_lock:
+            return co_occurrence(self.get_query_index(), tags)
 
     def get_current_image_path(self):
         if 0 <= self.current_index < len(self.image_files):
@@ -75,6 +530,10 @@ class FileManager:
         return base + ".txt"
 
     def read_tags(self, image_path):
+        with self._index_lock:
+            pending = self._pending_writes.get(image_path)
+        if pending is not None:
+            return list(pending[0])
         txt_path = self.get_text_file_path(image_path)
         if not txt_path or not os.path.exists(txt_path):
             return []
@@ -89,17 +548,164 @@ class FileManager:
         except Exception:
             return []
 
-    def save_tags(self, image_path, tags):
+    def get_tags(self, image_path):
+        """Tags from the index while the sidecar is unchanged on disk, otherwise read from disk"""
+        with self._index_lock:
+            tags = self.image_tags.get(image_path)
+            key = self.sidecar_stats.get(image_path)
+        if tags is not None and key == stat_key(self.get_text_file_path(image_path)):
+            return list(tags)
+        return self.read_tags(image_path)
+
+    def canonical_tags(self, tags):
+        vocabulary = self.vocabulary
+        if vocabulary is None:
+            return list(tags)
+        try:
+            return vocabulary.canonicalize(tags)
+        except ValueError:
+            # The dictionary was closed by a re-import
+            return list(tags)
+
+    def save_tags(self, image_path, tags, canonicalize=True):
+        if canonicalize:
+            tags = self.canonical_tags(tags)
+        with self._index_lock:
+            # Supersedes any deferred write of the same file
+            self._pending_writes.pop(image_path, None)
+        if not self._write_sidecar(image_path, tags):
+            return False
+        self._index_tags(image_path, tags)
+        self._update_cache(image_path, tags)
+        return True
+
+    def save_tags_deferred(self, image_path, tags):
+        """Queue a sidecar write for flush_writes.
+
+        The index and read_tags see the new tags immediately; repeated edits
+        of the same file within write_delay end up as a single write.
+        """
+        txt_path = self.get_text_file_path(image_path)
+        if not txt_path or os.path.isdir(txt_path):
+            return False
+        tags = self.canonical_tags(tags)
+        with self._index_lock:
+            self._pending_writes[image_path] = (list(tags), time.monotonic())
+            self._index_tags(image_path, tags)
+        return True
+
+    def update_tags(self, image_path, update, due_now=False):
+        """Atomically replace the tags of image_path with update(tags).
+
+        update gets the latest tags, including unsaved edits, and runs under
+        the index lock, so nothing else can change them in between. The
+        result is queued like save_tags_deferred; with due_now it does not
+        wait out write_delay. Returns the new tags, or None when update
+        changed nothing. Raises StaleImageError for an image that is not in
+        the open folder, e.g. from a batch still running when another folder
+        was opened.
+        """
+        txt_path = self.get_text_file_path(image_path)
+        if not txt_path or os.path.isdir(txt_path):
+            return None
+        with self._index_lock:
+            # The list is only searched for images not indexed yet
+            if image_path not in self.sidecar_stats and image_path not in self.all_image_files:
+                raise StaleImageError(f"{image_path} is not in the open folder")
+            tags = self.read_tags(image_path)
+            new_tags = update(list(tags))
+            if new_tags is None:
+                return None
+            new_tags = self.canonical_tags(new_tags)
+            if new_tags == tags:
+                return None
+            edited = time.monotonic() - self.write_delay if due_now else time.monotonic()
+            self._pending_writes[image_path] = (list(new_tags), edited)
+            self._index_tags(image_path, new_tags)
+        return list(new_tags)
+
+    def tag_store(self):
+        """The TagStore that background workers hand their tag changes to"""
+        with self._index_lock:
+            if self._tag_store is None:
+                self._tag_store = TagStore(self)
+            return self._tag_store
+
+    def pending_write_count(self):
+        with self._index_lock:
+            return len(self._pending_writes)
+
+    def flush_writes(self, due_only=False, paths=None):
+        """Write queued sidecars (with due_only, only those idle for write_delay;
+        with paths, only those images).
+
+        Returns the image paths whose write failed; they stay queued.
+        """
+        now = time.monotonic()
+        with self._index_lock:
+            candidates = self._pending_writes if paths is None else [p for p in paths if p in self._pending_writes]
+            items = [
+                p for p in candidates
+                if not due_only or now - self._pending_writes[p][1] >= self.write_delay
+            ]
+        failed = []
+        for image_path in items:
+            with self._write_lock:
+                # Another thread may have written or replaced the entry meanwhile
+                with self._index_lock:
+                    entry = self._pending_writes.get(image_path)
+                if entry is None:
+                    continue
+                tags = entry[0]
+                # Written outside the index lock so the GUI can keep editing; an
+                # entry replaced meanwhile stays queued for the next flush
+                if not self._write_sidecar(image_path, tags):
+                    failed.append(image_path)
+                    continue
+                with self._index_lock:
+                    entry = self._pending_writes.get(image_path)
+                    if entry is not None and entry[0] is tags:
+                        del self._pending_writes[image_path]
+                    self._update_cache(image_path, tags)
+        return failed
+
+    def _write_sidecar(self, image_path, tags):
         txt_path = self.get_text_file_path(image_path)
         if not txt_path or os.path.isdir(txt_path):
             return False
             
         try:
-            with open(txt_path, 'w', encoding='utf-8') as f:
-                f.write(", ".join(tags))
-            return True
+            write_text_atomic(txt_path, ", ".join(tags))
         except Exception:
             return False
+        # Lets the folder watcher ignore the directory event of the rename
+        self.last_own_write = time.monotonic()
+        return True
+
+    def _save_listing(self):
+        """Renew the cached listing key when the loaded images are still
+        exactly the images on disk.
+
+        Every atomic save renames a temp file into the folder and moves its
+        mtime, so the key stored by finish_load goes stale after the first
+        edit. Listing once here is cheaper than checking after every write,
+        and an image another program created meanwhile fails the comparison
+        and drops the key instead of being folded into it.
+        """
+        with self._index_lock:
+            cache = self._tag_cache
+            folder = self.folder_path
+            if not cache or self.recursive or not os.path.isdir(folder):
+                return
+            listing_key = str(stat_key(folder)[0])
+            if cache.get_meta("listing") == listing_key:
+                return
+            loaded = set(self.sidecar_stats)
+        # Taken before listing, like scan_folder, so entries created meanwhile invalidate it
+        on_disk = set(self.iter_image_files(folder))
+        with self._index_lock:
+            current = on_disk == loaded == self.sidecar_stats.keys()
+            cache.set_meta("listing", listing_key if current else "")
 
     def next_image(self):
         if self.current_index < len(self.image_files) - 1:
@@ -113,40 +719,32 @@ class FileManager:
             return True
         return False
 
-    def add_tag_to_all(self, tag, position="end"):
-        count = 0
-        for img_path in self.all_image_files:
-            tags = self.read_tags(img_path)
-            if tag not in tags:
-                if position == "start":
-                    tags.insert(0, tag)
-                else:
-                    tags.append(tag)
-                self.save_tags(img_path, tags)
-                count += 1
+    def bulk_add_tag(self, tag, position="end"):
+        with self._index_lock:
+            tagged = set(self.tag_index.get(tag, ()))
+            candidates = [p for p in self.all_image_files if p not in tagged]
+        return BulkEdit(self, f"Add '{tag}'", add_tag_edit(tag, position), candidates)
+
+    def bulk_remove_tag(self, tag):
+        # Only files the index knows carry the tag can change
+        return BulkEdit(self, f"Remove '{tag}'", remove_tag_edit(tag), self.get_images_with_tag(tag))
+
+    def bulk_replace_tag(self, old_tag, new_tag):
+        return BulkEdit(
+            self, f"Replace '{old_tag}' with '{new_tag}'",
+            replace_tag_edit(old_tag, new_tag), self.get_images_with_tag(old_tag),
+        )
+
+    def run_bulk_edit(self, bulk_edit, kind="do"):
+        count = bulk_edit.run()
+        self.bulk_history.record(bulk_edit, kind)
         return count
 
+    def add_tag_to_all(self, tag, position="end"):
+        return self.run_bulk_edit(self.bulk_add_tag(tag, position))
+
     def remove_tag_from_all(self, tag):
-        count = 0
-        for img_path in self.all_image_files:
-            tags = self.read_tags(img_path)
-            if tag in tags:
-                tags.remove(tag)
-                self.save_tags(img_path, tags)
-                count += 1
-        return count
+        return self.run_bulk_edit(self.bulk_remove_tag(tag))
 
     def replace_tag_in_all(self, old_tag, new_tag):
-        count = 0
-        new_tag = new_tag.strip() if new_tag else ""
-        for img_path in self.all_image_files:
-            tags = self.read_tags(img_path)
-            if old_tag in tags:
-                idx = tags.index(old_tag)
-                if not new_tag or new_tag in tags:
-                    tags.pop(idx)
-                else:
-                    tags[idx] = new_tag
-                self.save_tags(img_path, tags)
-                count += 1
-        return count
+        return self.run_bulk_edit(self.bulk_replace_tag(old_tag, new_tag))
@@ -0,0 +1,192 @@
+import gc
+import time
+import threading
+from PIL import Image
+
+FLORENCE_MODEL_ID = "microsoft/Florence-2-base"
+# Seconds without requests after which the weights are released
+FLORENCE_IDLE_TIMEOUT = 600
+# Images per generate call in batch captioning
+FLORENCE_BATCH_SIZE = 8
+
+
+def is_out_of_memory(error):
+    if isinstance(error, MemoryError):
+        return True
+    return isinstance(error, RuntimeError) and "out of memory" in str(error).lower()
+
+
+def get_torch_device():
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except ImportError:
+        return "cpu"
+
+
+class Florence2Host:
+    """Keeps one Florence-2 model resident and serves caption requests.
+
+    The model is loaded on the first request and shared by the single-image
+    and batch workers, so only the first caption pays for from_pretrained.
+    Requests are serialized on a lock. After idle_timeout seconds without
+    requests the weights are dropped to give the memory back.
+    """
+
+    def __init__(self, model_id=FLORENCE_MODEL_ID, idle_timeout=FLORENCE_IDLE_TIMEOUT):
+        self.model_id = model_id
+        self.idle_timeout = idle_timeout
+        self.model = None
+        self.processor = None
+        self.device = None
+        self.torch_dtype = None
+        self._version = None
+        # Largest batch that fit in memory so far, lowered on OOM
+        self.batch_limit = None
+        self._lock = threading.RLock()
+        self._idle_timer = None
+        self._last_used = 0.0
+
+    def is_loaded(self):
+        return self.model is not None
+
+    def load(self):
+        with self._lock:
+            if self.model is not None:
+                return
+            import torch
+            from transformers import AutoProcessor, AutoModelForCausalLM, AutoConfig
+            from unittest.mock import patch
+            from transformers.dynamic_module_utils import get_imports
+
+            device = get_torch_device()
+            torch_dtype = torch.float16 if device == "cuda" else torch.float32
+            if device == "cuda": torch.cuda.empty_cache()
+
+            def fixed_get_imports(filename):
+                imports = get_imports(filename)
+                if "flash_attn" in imports: imports.remove("flash_attn")
+                return imports
+
+            config = AutoConfig.from_pretrained(self.model_id, trust_remote_code=True)
+            if not hasattr(config, "forced_bos_token_id"): config.forced_bos_token_id = None
+
+            with patch("transformers.dynamic_module_utils.get_imports", fixed_get_imports):
+                model = AutoModelForCausalLM.from_pretrained(self.model_id, config=config, torch_dtype=torch_dtype, trust_remote_code=True).to(device)
+                processor = AutoProcessor.from_pretrained(self.model_id, trust_remote_code=True)
+            model.eval()
+
+            self.model = model
+            self.processor = processor
+            self.device = device
+            self.torch_dtype = torch_dtype
+
+    def version(self):
+        """Hub commit of the model, used to key cached results"""
+        if self._version is None:
+            from transformers import AutoConfig
+            config = AutoConfig.from_pretrained(self.model_id, trust_remote_code=True)
+            self._version = getattr(config, "_commit_hash", None) or "unknown"
+        return self._version
+
+    def input_size(self):
+        """(width, height) the processor resizes every image to, or None"""
+        self.load()
+        size = getattr(self.processor.image_processor, "size", None) or {}
+        if "width" in size and "height" in size:
+            return size["width"], size["height"]
+        return None
+
+    def unload(self):
+        with self._lock:
+            if self.model is None:
+                return
+            self.model = None
+            self.processor = None
+            gc.collect()
+            if self.device == "cuda":
+                import torch
+                torch.cuda.empty_cache()
+            print(f"Florence-2 unloaded after {self.idle_timeout}s idle")
+
+    def caption(self, image, task_prompt="<DETAILED_CAPTION>"):
+        """Run one task prompt on a PIL image or image path and return the parsed answer"""
+        if not isinstance(image, Image.Image):
+            image = Image.open(image).convert("RGB")
+        return self.caption_batch([image], task_prompt)[0]
+
+    def caption_batch(self, images, task_prompt="<DETAILED_CAPTION>", batch_size=FLORENCE_BATCH_SIZE, image_sizes=None):
+        """Parsed answers for a list of PIL images, batch_size images per generate call.
+
+        image_sizes gives the original sizes when the images were already
+        scaled down to input_size(); region tasks need them for coordinates.
+
+        Every image gets the same prompt, so the prompt tokens never need
+        padding and the processor resizes all images to the same shape. When
+        a batch runs out of memory it is retried in halves, and the smaller
+        size is remembered for later calls.
+        """
+        with self._lock:
+            self.load()
+            import torch
+            if image_sizes is None:
+                image_sizes = [image.size for image in images]
+            try:
+                results = []
+                start = 0
+                while start < len(images):
+                    size = max(1, min(batch_size, self.batch_limit or batch_size))
+                    chunk = images[start:start + size]
+                    try:
+                        results.extend(self._generate(chunk, task_prompt, image_sizes[start:start + size]))
+                    except Exception as e:
+                        if not is_out_of_memory(e) or size == 1:
+                            raise
+                        self.batch_limit = size // 2
+                        if self.device == "cuda":
+                            torch.cuda.empty_cache()
+                        print(f"Florence-2 out of memory at batch size {size}, retrying with {self.batch_limit}")
+                        continue
+                    start += len(chunk)
+                return results
+            finally:
+                self._touch()
+
+    def _generate(self, images, task_prompt, image_sizes):
+        import torch
+        inputs = self.processor(text=[task_prompt] * len(images), images=images, return_tensors="pt").to(self.device, self.torch_dtype)
+        with torch.inference_mode():
+            generated_ids = self.model.generate(input_ids=inputs["input_ids"], pixel_values=inputs["pixel_values"], max_new_tokens=1024, num_beams=3)
+        generated_texts = self.processor.batch_decode(generated_ids, skip_special_tokens=False)
+        return [
+            self.processor.post_process_generation(text, task=task_prompt, image_size=image_size).get(task_prompt, "")
+            for text, image_size in zip(generated_texts, image_sizes)
+        ]
+
+    def _touch(self):
+        self._last_used = time.monotonic()
+        if self.idle_timeout is None or self.idle_timeout <= 0:
+            return
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+        self._idle_timer = threading.Timer(self.idle_timeout, self._unload_if_idle)
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+
+    def _unload_if_idle(self):
+        # Waits for a running request; a request that finished meanwhile re-armed the timer
+        with self._lock:
+            if time.monotonic() - self._last_used >= self.idle_timeout:
+                self.unload()
+
+
+_hosts = {}
+_hosts_lock = threading.Lock()
+
+
+def get_florence_host(model_id=FLORENCE_MODEL_ID):
+    """Process-wide Florence2Host for model_id"""
+    with _hosts_lock:
+        if model_id not in _hosts:
+            _hosts[model_id] = Florence2Host(model_id)
+        return _hosts[model_id]
@@ -0,0 +1,33 @@
+import traceback
+from PyQt6.QtCore import QThread, pyqtSignal
+
+
+class FolderLoaderWorker(QThread):
+    """Streams a folder into a FileManager without blocking the GUI.
+
+    The listing arrives in batches (the first image on its own, so it can be
+    shown immediately), then sidecars are read and sorted on this thread and
+    the finished index is handed back in one piece.
+    """
+    batch_ready = pyqtSignal(int, list) # generation, unsorted image paths
+    progress = pyqtSignal(int, int) # sidecars read, total
+    finished = pyqtSignal(int, object) # generation, index data (None if cancelled)
+
+    def __init__(self, file_manager, folder_path, generation):
+        super().__init__()
+        self.file_manager = file_manager
+        self.folder_path = folder_path
+        self.generation = generation
+
+    def run(self):
+        try:
+            data = self.file_manager.scan_folder(
+                self.folder_path,
+                on_batch=lambda batch: self.batch_ready.emit(self.generation, batch),
+                on_progress=self.progress.emit,
+                should_stop=self.isInterruptionRequested,
+            )
+        except Exception:
+            traceback.print_exc()
+            data = None
+        self.finished.emit(self.generation, data)
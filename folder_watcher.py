@@ -0,0 +1,128 @@
+import os
+import time
+from PyQt6.QtCore import QObject, QThread, QTimer, QFileSystemWatcher, pyqtSignal
+
+# Directory events this soon after one of the app's own sidecar writes are
+# taken to be caused by it
+OWN_WRITE_WINDOW = 1.0
+
+
+class FolderScanWorker(QThread):
+    finished = pyqtSignal(str, list, list, list, dict) # folder, added, removed, modified, sidecars
+
+    def __init__(self, file_manager):
+        super().__init__()
+        self.file_manager = file_manager
+
+    def run(self):
+        folder = self.file_manager.folder_path
+        try:
+            added, removed, modified = self.file_manager.scan_changes()
+            # Read the changed sidecars here rather than on the GUI thread
+            sidecars = self.file_manager.read_sidecars(added + modified)
+        except Exception as e:
+            print(f"Folder scan failed: {e}")
+            added, removed, modified, sidecars = [], [], [], {}
+        self.finished.emit(folder, added, removed, modified, sidecars)
+
+
+class FolderWatcher(QObject):
+    """Keeps a FileManager in sync with files written by other programs.
+
+    QFileSystemWatcher (inotify on Linux) reports entries being created,
+    removed or renamed in the folder, and in-place edits of the current
+    image's sidecar. Bursts of events are debounced into one scan on a
+    worker thread. Directory events caused by the app's own atomic saves are
+    ignored. In-place edits of other sidecars, external changes that coincide
+    with a save and file systems whose events never arrive (SMB/NFS, where
+    adding the watch still succeeds) are covered by a periodic polling scan.
+    """
+    changes_applied = pyqtSignal(list) # images whose membership or tags changed
+
+    def __init__(self, file_manager, parent=None, debounce_ms=500, poll_interval_ms=10000):
+        super().__init__(parent)
+        self.file_manager = file_manager
+        self.folder_path = ""
+        self.watched_file = ""
+        self._scan_worker = None
+        self._rescan_requested = False
+
+        self.fs_watcher = QFileSystemWatcher(self)
+        self.fs_watcher.directoryChanged.connect(self.on_directory_changed)
+        self.fs_watcher.fileChanged.connect(self.on_file_changed)
+
+        self.debounce_timer = QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.setInterval(debounce_ms)
+        self.debounce_timer.timeout.connect(self.start_scan)
+
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(poll_interval_ms)
+        self.poll_timer.timeout.connect(self.schedule_scan)
+
+    def watch(self, folder_path):
+        self.stop()
+        self.folder_path = folder_path
+        if folder_path and os.path.isdir(folder_path):
+            if not self.fs_watcher.addPath(folder_path):
+                print(f"No change notifications for {folder_path}, polling only")
+            self.poll_timer.start()
+
+    def watch_file(self, path):
+        """Watch one sidecar (the current image's) for in-place edits"""
+        if path == self.watched_file and path in self.fs_watcher.files():
+            return
+        if self.watched_file:
+            self.fs_watcher.removePath(self.watched_file)
+        self.watched_file = path or ""
+        if path and os.path.exists(path):
+            self.fs_watcher.addPath(path)
+
+    def stop(self):
+        self.poll_timer.stop()
+        self.debounce_timer.stop()
+        paths = self.fs_watcher.files() + self.fs_watcher.directories()
+        if paths:
+            self.fs_watcher.removePaths(paths)
+        self.folder_path = ""
+        self.watched_file = ""
+
+    def on_file_changed(self, path):
+        # Files replaced by rename drop out of the watch list; re-arm it
+        if path == self.watched_file and os.path.exists(path) and path not in self.fs_watcher.files():
+            self.fs_watcher.addPath(path)
+        img_path = self.file_manager.get_current_image_path()
+        if img_path and self.file_manager.get_text_file_path(img_path) == path:
+            if self.file_manager.refresh_image(img_path):
+                self.changes_applied.emit([img_path])
+        else:
+            self.schedule_scan()
+
+    def on_directory_changed(self, path):
+        # Every save renames a temp file into the folder
+        if time.monotonic() - self.file_manager.last_own_write < OWN_WRITE_WINDOW:
+            return
+        self.schedule_scan()
+
+    def schedule_scan(self, *args):
+        # Restarting the single-shot timer coalesces bursts of events
+        if self.folder_path:
+            self.debounce_timer.start()
+
+    def start_scan(self):
+        if self._scan_worker is not None and self._scan_worker.isRunning():
+            self._rescan_requested = True
+            return
+        self._rescan_requested = False
+        self._scan_worker = FolderScanWorker(self.file_manager)
+        self._scan_worker.finished.connect(self.on_scan_finished)
+        self._scan_worker.start()
+
+    def on_scan_finished(self, folder, added, removed, modified, sidecars):
+        # Drop results for a folder that was closed while scanning
+        if folder == self.folder_path == self.file_manager.folder_path and (added or removed or modified):
+            changed = self.file_manager.apply_changes(added, removed, modified, sidecars)
+            if changed:
+                self.changes_applied.emit(changed)
+        if self._rescan_requested:
+            self.schedule_scan()
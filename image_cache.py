@@ -0,0 +1,173 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtCore import Qt, QObject, QSize, pyqtSignal
+from PyQt6.QtGui import QImage, QImageReader, QImageIOHandler
+from tag_cache import stat_key
+from thumbnail_cache import ThumbnailCache
+
+IMAGE_CACHE_BYTES = 512 * 1024 * 1024
+PREFETCH_NEIGHBORS = 2
+IMAGE_DECODE_WORKERS = 2
+# Formats whose decoders can produce a smaller image without decoding every pixel
+# (libjpeg DCT scaling, libwebp scaled output)
+SCALED_DECODE_FORMATS = {b"jpeg", b"jpg", b"webp"}
+
+
+def fit_size(size, bound):
+    """size scaled down to fit inside bound, keeping its aspect ratio"""
+    if size.width() <= bound.width() and size.height() <= bound.height():
+        return QSize(size)
+    return size.scaled(bound, Qt.AspectRatioMode.KeepAspectRatio)
+
+
+def decode_image(path, bound=None, fast=False):
+    """Decode path, scaled down in the decoder to fit bound (a QSize) when
+    given. Returns (image, original size). fast trades quality for speed."""
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    original = reader.size()
+    rotated = bool(reader.transformation() & QImageIOHandler.Transformation.TransformationRotate90)
+    if bound is not None and original.isValid():
+        raw_bound = bound.transposed() if rotated else QSize(bound)
+        # The scaled size applies before the EXIF rotation
+        target = fit_size(original, raw_bound)
+        if target != original:
+            reader.setScaledSize(target)
+    reader.setQuality(0 if fast else 100)
+    image = reader.read()
+    if image.isNull():
+        raise OSError(f"{os.path.basename(path)}: {reader.errorString()}")
+    if not original.isValid():
+        return image, image.size()
+    return image, original.transposed() if rotated else original
+
+
+class ImageCache(QObject):
+    """Decoded images for the viewer, in an LRU bounded by bytes.
+
+    Images are decoded at the size they are displayed at rather than at full
+    resolution, so an 8K scan costs a few MB instead of a few hundred. Each
+    entry remembers the file's mtime and size and the original image size;
+    a reduced entry only counts as a hit for bounds it still covers. Decodes
+    run on a small thread pool in request order; image_ready and
+    image_failed are delivered on the GUI thread.
+    """
+    image_ready = pyqtSignal(str)
+    image_failed = pyqtSignal(str, str)
+
+    def __init__(self, max_bytes=IMAGE_CACHE_BYTES, workers=IMAGE_DECODE_WORKERS, parent=None):
+        super().__init__(parent)
+        self.max_bytes = max_bytes
+        self._images = OrderedDict() # path -> (stat key, QImage, original QSize)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self.thumbnails = ThumbnailCache()
+
+    def get(self, path, bound=None):
+        """The cached image for path if it is sharp enough for bound
+        (any cached image when bound is None), or None"""
+        try:
+            key = stat_key(path)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._images.get(path)
+            if entry is None:
+                return None
+            stored_key, image, original = entry
+            if stored_key != key:
+                self._drop(path)
+                return None
+            if bound is not None and image.size() != original:
+                needed = fit_size(original, bound)
+                if image.width() < needed.width() - 1 and image.height() < needed.height() - 1:
+                    return None
+            self._images.move_to_end(path)
+            return image
+
+    def preview(self, path, bound):
+        """A quick low quality image to show while the real decode runs: a
+        fast scaled decode for JPEG/WebP, otherwise the grid thumbnail if one
+        is on disk. None when neither is cheap."""
+        try:
+            if bytes(QImageReader(path).format()).lower() in SCALED_DECODE_FORMATS:
+                return decode_image(path, bound, fast=True)[0]
+            thumbnail_path = self.thumbnails.find(path)
+        except OSError:
+            return None
+        if thumbnail_path:
+            image = QImage(thumbnail_path)
+            if not image.isNull():
+                return image
+        return None
+
+    def request(self, paths, bound):
+        """Decode paths at bound in the background, first path first. Queued
+        decodes that have not started are dropped or re-queued in this order."""
+        wanted = [p for p in paths if p and self.get(p, bound) is None]
+        with self._lock:
+            for path, future in list(self._futures.items()):
+                if future.cancel():
+                    del self._futures[path]
+            for path in wanted:
+                if path not in self._futures:
+                    self._futures[path] = self._pool.submit(self._decode, path, QSize(bound))
+
+    def _decode(self, path, bound):
+        try:
+            image, original = decode_image(path, bound)
+            self._store(path, image, original)
+        except Exception as e:
+            self.image_failed.emit(path, str(e))
+            return
+        finally:
+            with self._lock:
+                self._futures.pop(path, None)
+        self.image_ready.emit(path)
+
+    def _store(self, path, image, original):
+        try:
+            key = stat_key(path)
+        except OSError:
+            return
+        size = image.sizeInBytes()
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(path)
+            self._images[path] = (key, image, original)
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._images) > 1:
+                _, (_, evicted, _) = self._images.popitem(last=False)
+                self._bytes -= evicted.sizeInBytes()
+
+    def _drop(self, path):
+        entry = self._images.pop(path, None)
+        if entry is not None:
+            self._bytes -= entry[1].sizeInBytes()
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._bytes = 0
+
+    def shutdown(self):
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def neighbor_paths(image_files, index, count=PREFETCH_NEIGHBORS):
+    """Paths around index in display order: next, previous, next+1, ..."""
+    paths = []
+    for step in range(1, count + 1):
+        for i in (index + step, index - step):
+            if 0 <= i < len(image_files):
+                paths.append(image_files[i])
+    return paths
@@ -0,0 +1,149 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from tag_cache import get_cache_dir, stat_key
+
+INFERENCE_CACHE_VERSION = 1
+COMMIT_EVERY = 200
+# Tagger probabilities below this are stored as 0; no useful threshold is that low
+SCORE_FLOOR = 0.01
+
+
+def content_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class InferenceCache:
+    """SQLite store of model outputs keyed by image content.
+
+    Tagger rows keep the raw per-tag probabilities (sparse, float16) for a
+    (content hash, model, version), so a different threshold can be applied
+    without running the model again. Caption rows are keyed by the task prompt
+    as well. Content hashes are memoized by path and mtime/size, so unchanged
+    files are hashed once. Renamed or copied images still hit the cache.
+    """
+
+    def __init__(self, cache_dir=None):
+        cache_dir = cache_dir or get_cache_dir()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, "inference.sqlite")
+        self._pending = 0
+        self._lock = threading.Lock()
+        # Shared by the decoder threads of the batch workers
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._init_schema()
+
+    def _init_schema(self):
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self.conn.execute("SELECT value FROM meta WHERE key='version'").fetchone()
+        if row is None or int(row[0]) != INFERENCE_CACHE_VERSION:
+            for table in ("files", "scores", "results"):
+                self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self.conn.execute("DELETE FROM meta")
+            self.conn.execute("INSERT INTO meta VALUES ('version', ?)", (str(INFERENCE_CACHE_VERSION),))
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, hash TEXT)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "hash TEXT, model TEXT, version TEXT, n_tags INTEGER, indices BLOB, scores BLOB, "
+            "PRIMARY KEY (hash, model, version))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "hash TEXT, model TEXT, version TEXT, task TEXT, result TEXT, "
+            "PRIMARY KEY (hash, model, version, task))"
+        )
+        self.conn.commit()
+
+    def image_hash(self, path):
+        """Content hash of an image file, reusing the stored one while mtime/size match"""
+        path = os.path.abspath(path)
+        mtime_ns, size = stat_key(path)
+        with self._lock:
+            row = self.conn.execute("SELECT mtime_ns, size, hash FROM files WHERE path=?", (path,)).fetchone()
+        if row is not None and row[0] == mtime_ns and row[1] == size:
+            return row[2]
+        digest = content_hash(path)
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (path, mtime_ns, size, digest))
+            self._mark_dirty()
+        return digest
+
+    def get_scores(self, digest, model, version):
+        """float32 probability vector stored for digest, or None"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT n_tags, indices, scores FROM scores WHERE hash=? AND model=? AND version=?",
+                (digest, model, version),
+            ).fetchone()
+        if row is None:
+            return None
+        n_tags, indices, values = row
+        scores = np.zeros(n_tags, dtype=np.float32)
+        scores[np.frombuffer(indices, dtype=np.int32)] = np.frombuffer(values, dtype=np.float16)
+        return scores
+
+    def put_scores(self, digest, model, version, scores):
+        scores = np.asarray(scores, dtype=np.float32)
+        indices = np.flatnonzero(scores >= SCORE_FLOOR).astype(np.int32)
+        values = scores[indices].astype(np.float16)
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, model, version, len(scores), indices.tobytes(), values.tobytes()),
+            )
+            self._mark_dirty()
+
+    def get_result(self, digest, model, version, task):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT result FROM results WHERE hash=? AND model=? AND version=? AND task=?",
+                (digest, model, version, task),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put_result(self, digest, model, version, task, result):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (digest, model, version, task, result),
+            )
+            self._mark_dirty()
+
+    def _mark_dirty(self):
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.conn.commit()
+            self._pending = 0
+
+    def commit(self):
+        with self._lock:
+            self.conn.commit()
+            self._pending = 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_inference_cache():
+    """Process-wide InferenceCache, or None if the cache dir is not writable"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = InferenceCache()
+            except (OSError, sqlite3.Error) as e:
+                print(f"Inference cache disabled: {e}")
+                return None
+        return _cache
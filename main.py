@@ -1,4 +1,5 @@
 import sys
+import multiprocessing
 from PyQt6.QtWidgets import QApplication
 from ui_main import MainWindow
 
@@ -14,4 +15,6 @@ def main():
     sys.exit(app.exec())
 
 if __name__ == '__main__':
+    # Needed by the CPU tagging process pool in frozen Windows builds
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,346 @@
+import os
+import csv
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from PIL import Image
+
+TAGGER_BATCH_SIZE = 16
+# onnxruntime intra-op threads per process in the CPU process pool. A few
+# threads per session scale well; beyond that more processes win.
+CPU_THREADS_PER_PROCESS = 4
+
+# Danbooru tag categories used in selected_tags.csv
+CATEGORY_GENERAL = 0
+CATEGORY_CHARACTER = 4
+
+# Hugging Face ONNX exports the batch tagger can run directly. Input size and
+# layout (NCHW/NHWC) are read from the session, and the score output is the
+# one as wide as the tag list (an "output_name" entry pins it); the rest
+# describes how the model was trained to see images.
+TAGGER_MODELS = {
+    "v0.9": {
+        "repo_id": "deepghs/pixai-tagger-v0.9-onnx",
+        "model_file": "model.onnx",
+        "tags_file": "selected_tags.csv",
+        "channel_order": "RGB",
+        "scale": 1 / 255.0,
+        "mean": (0.5, 0.5, 0.5),
+        "std": (0.5, 0.5, 0.5),
+        "pad_square": False,
+    },
+    "SwinV2": {
+        "repo_id": "SmilingWolf/wd-v1-4-swinv2-tagger-v2",
+        "model_file": "model.onnx",
+        "tags_file": "selected_tags.csv",
+        "channel_order": "BGR",
+        "scale": 1.0,
+        "mean": (0.0, 0.0, 0.0),
+        "std": (1.0, 1.0, 1.0),
+        "pad_square": True,
+    },
+}
+
+
+def get_onnx_device():
+    try:
+        import onnxruntime as rt
+        available_providers = rt.get_available_providers()
+        if 'CUDAExecutionProvider' in available_providers:
+            return "GPU (CUDA)", available_providers
+        elif 'DmlExecutionProvider' in available_providers:
+            return "GPU (DirectML)", available_providers
+        else:
+            return "CPU", available_providers
+    except ImportError:
+        return None, []
+
+
+def execution_providers(available_providers):
+    preferred = [p for p in ('CUDAExecutionProvider', 'DmlExecutionProvider') if p in available_providers]
+    return preferred + ['CPUExecutionProvider']
+
+
+def to_rgb(image):
+    """RGB copy of a PIL image with transparency flattened onto white"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+class OnnxTagger:
+    """Danbooru tagger running its own onnxruntime session on batches.
+
+    Images are preprocessed into float32 arrays (safe to do on decoder
+    threads), stacked into one NCHW/NHWC batch per session.run call, and the
+    general/character thresholds are applied to the whole score matrix with
+    NumPy instead of per image.
+    """
+
+    def __init__(self, model_name="v0.9", providers=None, intra_op_threads=None):
+        self.model_name = model_name
+        self.spec = TAGGER_MODELS[model_name]
+        self.providers = providers
+        self.intra_op_threads = intra_op_threads
+        self.session = None
+        self.model_path = None
+        self.tags_path = None
+        self.version = None
+        self.input_name = None
+        self.output_name = None
+        self.input_size = 448
+        self.layout = "NCHW"
+        self.max_batch = TAGGER_BATCH_SIZE
+        self.tag_names = []
+        self.general_mask = None
+        self.character_mask = None
+        self._lock = threading.RLock()
+
+    def load_labels(self):
+        """Fetch the model files and read the tag list, without starting a session"""
+        with self._lock:
+            if self.version is not None:
+                return
+            model_path, tags_path = self.download()
+            self._load_tags(tags_path)
+            self.model_path = model_path
+            self.tags_path = tags_path
+            # Hub snapshots live in snapshots/<commit>/, which identifies the weights
+            self.version = os.path.basename(os.path.dirname(model_path))
+
+    def load(self):
+        with self._lock:
+            if self.session is not None:
+                return
+            import onnxruntime as rt
+
+            self.load_labels()
+            providers = self.providers
+            if providers is None:
+                providers = execution_providers(rt.get_available_providers())
+            options = rt.SessionOptions()
+            if self.intra_op_threads:
+                options.intra_op_num_threads = self.intra_op_threads
+                options.inter_op_num_threads = 1
+            session = rt.InferenceSession(self.model_path, sess_options=options, providers=providers)
+
+            model_input = session.get_inputs()[0]
+            shape = model_input.shape
+            if len(shape) == 4 and shape[1] == 3:
+                self.layout = "NCHW"
+                size = shape[2]
+            else:
+                self.layout = "NHWC"
+                size = shape[1]
+            if isinstance(size, int) and size > 0:
+                self.input_size = size
+            # Exports with a fixed batch dimension can only take one image per run
+            if isinstance(shape[0], int) and shape[0] > 0:
+                self.max_batch = shape[0]
+            self.input_name = model_input.name
+            # Raises for a model that does not match its tag list, so callers
+            # fall back to imgutils instead of failing every batch
+            self.output_name = self._score_output(session)
+            self.session = session
+
+    def _score_output(self, session):
+        """Name of the output holding one score per tag of the tag list"""
+        outputs = session.get_outputs()
+        width = len(self.tag_names)
+        if self.spec.get("output_name"):
+            outputs = [o for o in outputs if o.name == self.spec["output_name"]]
+        matching = [o for o in outputs if o.shape and o.shape[-1] == width]
+        # Exports may also return embeddings or logits; prefer the probabilities
+        named = [o for o in matching if "pred" in o.name.lower() or "prob" in o.name.lower()]
+        if named or matching:
+            return (named or matching)[0].name
+        # A symbolic width is checked by scoring one blank image
+        batch = session.get_inputs()[0].shape[0]
+        batch = batch if isinstance(batch, int) and batch > 0 else 1
+        shape = (batch, 3, self.input_size, self.input_size) if self.layout == "NCHW" else (batch, self.input_size, self.input_size, 3)
+        probe = np.zeros(shape, dtype=np.float32)
+        for output in outputs:
+            if output.shape and not isinstance(output.shape[-1], int):
+                scores = session.run([output.name], {self.input_name: probe})[0]
+                if scores.ndim == 2 and scores.shape[1] == width:
+                    return output.name
+        shapes = ", ".join(f"{o.name} {o.shape}" for o in session.get_outputs())
+        raise ValueError(f"No output of {self.model_name} has {width} scores to match {self.spec['tags_file']} ({shapes})")
+
+    def download(self):
+        """Local paths of the model and tag list, fetched from the Hub if needed"""
+        from huggingface_hub import hf_hub_download
+        model_path = hf_hub_download(self.spec["repo_id"], self.spec["model_file"])
+        tags_path = hf_hub_download(self.spec["repo_id"], self.spec["tags_file"])
+        return model_path, tags_path
+
+    def _load_tags(self, tags_path):
+        names = []
+        categories = []
+        with open(tags_path, "r", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                names.append(row["name"])
+                categories.append(int(row.get("category") or CATEGORY_GENERAL))
+        categories = np.asarray(categories)
+        self.tag_names = np.asarray(names, dtype=object)
+        self.general_mask = categories == CATEGORY_GENERAL
+        self.character_mask = categories == CATEGORY_CHARACTER
+
+    def preprocess(self, image):
+        """float32 model input for one PIL image or image path"""
+        if not isinstance(image, Image.Image):
+            with Image.open(image) as opened:
+                if opened.format == "JPEG":
+                    opened.draft("RGB", (self.input_size * 2, self.input_size * 2))
+                image = to_rgb(opened)
+        else:
+            image = to_rgb(image)
+
+        if self.spec["pad_square"]:
+            side = max(image.size)
+            square = Image.new("RGB", (side, side), (255, 255, 255))
+            square.paste(image, ((side - image.width) // 2, (side - image.height) // 2))
+            image = square
+        image = image.resize((self.input_size, self.input_size), Image.Resampling.BICUBIC)
+
+        array = np.asarray(image, dtype=np.float32)
+        if self.spec["channel_order"] == "BGR":
+            array = array[:, :, ::-1]
+        array = array * self.spec["scale"]
+        array = (array - np.asarray(self.spec["mean"], dtype=np.float32)) / np.asarray(self.spec["std"], dtype=np.float32)
+        if self.layout == "NCHW":
+            array = array.transpose(2, 0, 1)
+        return np.ascontiguousarray(array, dtype=np.float32)
+
+    def predict(self, batch):
+        """Score matrix (images x tags) for a stacked batch of preprocessed inputs"""
+        self.load()
+        outputs = []
+        for start in range(0, len(batch), self.max_batch):
+            chunk = batch[start:start + self.max_batch]
+            outputs.append(self.session.run([self.output_name], {self.input_name: chunk})[0])
+        scores = np.concatenate(outputs, axis=0).astype(np.float32)
+        if scores.ndim != 2 or scores.shape[1] != len(self.tag_names):
+            raise ValueError(f"{self.model_name} returned scores of shape {scores.shape} for {len(self.tag_names)} tags")
+        # Some exports return logits instead of probabilities
+        if scores.size and (scores.min() < 0.0 or scores.max() > 1.0):
+            scores = 1.0 / (1.0 + np.exp(-scores))
+        return scores
+
+    def tags_from_scores(self, scores, general_threshold=0.35, character_threshold=0.35):
+        """(general_tags, character_tags) dicts of tag -> score for every row,
+        each sorted by descending score"""
+        self.load_labels()
+        scores = np.atleast_2d(scores)
+        general_hits = (scores >= general_threshold) & self.general_mask
+        character_hits = (scores >= character_threshold) & self.character_mask
+        results = []
+        for row, general_row, character_row in zip(scores, general_hits, character_hits):
+            results.append((self._row_tags(row, general_row), self._row_tags(row, character_row)))
+        return results
+
+    def _row_tags(self, row, hits):
+        indices = np.flatnonzero(hits)
+        indices = indices[np.argsort(-row[indices], kind="stable")]
+        return {self.tag_names[i]: float(row[i]) for i in indices}
+
+    def tag_images(self, images, general_threshold=0.35, character_threshold=0.35):
+        batch = np.stack([self.preprocess(image) for image in images])
+        return self.tags_from_scores(self.predict(batch), general_threshold, character_threshold)
+
+
+_taggers = {}
+_taggers_lock = threading.Lock()
+
+
+def get_tagger(model_name="v0.9"):
+    """Process-wide OnnxTagger for model_name; the session is created on first use"""
+    with _taggers_lock:
+        if model_name not in _taggers:
+            _taggers[model_name] = OnnxTagger(model_name)
+        return _taggers[model_name]
+
+
+def default_cpu_processes():
+    """Worker processes for CPU tagging, 0 when the machine is too small to benefit"""
+    processes = (os.cpu_count() or 1) // CPU_THREADS_PER_PROCESS
+    return processes if processes >= 2 else 0
+
+
+# State of a pool worker process; set up once by _init_pool_worker
+_pool_tagger = None
+
+
+def _init_pool_worker(model_name, intra_op_threads):
+    global _pool_tagger
+    _pool_tagger = OnnxTagger(model_name, providers=['CPUExecutionProvider'], intra_op_threads=intra_op_threads)
+    _pool_tagger.load()
+
+
+def _score_chunk(image_paths):
+    inputs, paths, results = [], [], []
+    for path in image_paths:
+        try:
+            inputs.append(_pool_tagger.preprocess(path))
+            paths.append(path)
+        except Exception as e:
+            results.append((path, None, str(e)))
+    if inputs:
+        scores = _pool_tagger.predict(np.stack(inputs))
+        results.extend((path, row, None) for path, row in zip(paths, scores))
+    return results
+
+
+class TaggerProcessPool:
+    """Tags images on several CPU processes, each with its own session.
+
+    Images are sharded into chunks of chunk_size; every process decodes,
+    preprocesses and runs its chunk with intra_op_threads onnxruntime
+    threads. Only a couple of chunks per process are in flight, so a
+    cancelled run stops after the chunks already started.
+    """
+
+    def __init__(self, model_name="v0.9", processes=None, intra_op_threads=CPU_THREADS_PER_PROCESS):
+        self.model_name = model_name
+        self.processes = processes or max(1, default_cpu_processes())
+        self.intra_op_threads = intra_op_threads
+
+    def scores(self, image_paths, chunk_size=TAGGER_BATCH_SIZE, should_stop=None):
+        """Yields (path, probabilities, error) as chunks finish"""
+        # Download once here so the workers don't race on the Hub cache
+        OnnxTagger(self.model_name).download()
+        chunks = [image_paths[i:i + chunk_size] for i in range(0, len(image_paths), chunk_size)]
+        chunks.reverse()
+        # Forking would copy the GUI's threads and the locks they hold
+        pool = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_pool_worker,
+            initargs=(self.model_name, self.intra_op_threads),
+        )
+        running = {}
+        try:
+            while chunks or running:
+                while chunks and len(running) < self.processes * 2 and not (should_stop and should_stop()):
+                    chunk = chunks.pop()
+                    running[pool.submit(_score_chunk, chunk)] = chunk
+                if not running:
+                    break
+                done, _ = wait(running, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk = running.pop(future)
+                    try:
+                        results = future.result()
+                    except BrokenProcessPool:
+                        # Workers could not start a session; let the caller fall back
+                        raise
+                    except Exception as e:
+                        results = [(path, None, str(e)) for path in chunk]
+                    yield from results
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,340 @@
+import os
+import json
+import threading
+import numpy as np
+from tag_cache import get_cache_dir, folder_key
+from bulk_edit import BulkEdit, RestoreEdit
+
+# Score resolution of the threshold slider and the count histograms
+SCORE_BINS = 100
+INITIAL_ROWS = 1024
+HISTOGRAM_CHUNK = 4096
+
+
+def score_bins(scores):
+    """Histogram bin (0..SCORE_BINS) of every score"""
+    bins = (np.asarray(scores, dtype=np.float32) * SCORE_BINS + 1e-3).astype(np.int16)
+    return np.minimum(bins, SCORE_BINS)
+
+
+def threshold_bin(threshold):
+    return int(round(threshold * SCORE_BINS))
+
+
+class ScoreStore:
+    """Per-folder matrix of tagger probabilities, one float16 row per image.
+
+    The matrix is a memory-mapped .npy in the user cache dir next to a JSON
+    index (image name -> row, tag names, model and the threshold the folder
+    was last tagged with). Rows are appended as the batch tagger runs; when
+    the file is full it is copied into one twice the size. Re-deriving tags
+    for another threshold only compares this matrix, so no model is needed.
+
+    A boolean matrix of the same shape records which tags the tagger (or a
+    re-threshold) actually added to each sidecar. Raising the threshold only
+    removes those, never tags typed by hand or present before tagging.
+    """
+
+    def __init__(self, folder_path, cache_dir=None):
+        self.folder_path = os.path.abspath(folder_path)
+        cache_dir = cache_dir or get_cache_dir()
+        os.makedirs(cache_dir, exist_ok=True)
+        base = os.path.join(cache_dir, f"scores_{folder_key(self.folder_path)}")
+        self.array_path = base + ".npy"
+        self.applied_path = base + "_applied.npy"
+        self.index_path = base + ".json"
+        self.model = None
+        self.version = None
+        self.threshold = None
+        self.tag_names = []
+        self.taggable = np.zeros(0, dtype=bool)
+        self.rows = {}
+        self.scores = None
+        self.applied = None
+        self._columns = None
+        self._histogram = None
+        self._applied_histogram = None
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            scores = np.load(self.array_path, mmap_mode="r+")
+            applied = np.load(self.applied_path, mmap_mode="r+")
+        except (OSError, ValueError):
+            return
+        tag_names = index.get("tag_names", [])
+        rows = index.get("rows", {})
+        if scores.ndim != 2 or scores.shape[1] != len(tag_names) or len(rows) > scores.shape[0]:
+            return
+        if applied.shape != scores.shape:
+            return
+        self.model = index.get("model")
+        self.version = index.get("version")
+        self.threshold = index.get("threshold")
+        self.tag_names = tag_names
+        self.taggable = np.zeros(len(tag_names), dtype=bool)
+        self.taggable[index.get("taggable", [])] = True
+        self.rows = rows
+        self.scores = scores
+        self.applied = applied
+
+    def is_empty(self):
+        return not self.rows
+
+    def ensure_model(self, model, version, tag_names, taggable):
+        """Start over unless the stored scores come from the same model"""
+        with self._lock:
+            if self.scores is not None and self.model == model and self.version == version and list(tag_names) == self.tag_names:
+                return
+            self.model = model
+            self.version = version
+            self.threshold = None
+            self.tag_names = list(tag_names)
+            self.taggable = np.asarray(taggable, dtype=bool)
+            self.rows = {}
+            self._columns = None
+            self._histogram = None
+            self._applied_histogram = None
+            self.scores = None
+            self.applied = None
+            self._allocate(INITIAL_ROWS)
+
+    def _allocate(self, capacity):
+        self.scores = self._grow(self.scores, self.array_path, np.float16, capacity)
+        self.applied = self._grow(self.applied, self.applied_path, np.bool_, capacity)
+
+    def _grow(self, old, path, dtype, capacity):
+        tmp_path = path + ".tmp"
+        new = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=(capacity, len(self.tag_names)))
+        if old is not None:
+            new[:len(self.rows)] = old[:len(self.rows)]
+        new.flush()
+        # Windows cannot replace a file that is still mapped
+        del old, new
+        os.replace(tmp_path, path)
+        return np.load(path, mmap_mode="r+")
+
+    def name_for(self, image_path):
+        return os.path.relpath(os.path.abspath(image_path), self.folder_path)
+
+    def put(self, image_path, scores):
+        with self._lock:
+            name = self.name_for(image_path)
+            row = self.rows.get(name)
+            if row is None:
+                row = len(self.rows)
+                if row >= self.scores.shape[0]:
+                    self._allocate(self.scores.shape[0] * 2)
+                self.rows[name] = row
+            self.scores[row] = np.asarray(scores, dtype=np.float16)
+            self._histogram = None
+            self._applied_histogram = None
+
+    def _column(self, tag):
+        if self._columns is None:
+            self._columns = {name: i for i, name in enumerate(self.tag_names)}
+        return self._columns.get(tag)
+
+    def mark_applied(self, image_path, tags):
+        """Record that the tagger added tags to image_path's sidecar"""
+        self.update_applied([(image_path, [], tags)])
+
+    def update_applied(self, changes):
+        """Follow (image_path, before, after) tag changes: tags that were
+        added become applied, tags that were removed stop being applied"""
+        with self._lock:
+            for image_path, before, after in changes:
+                row = self.rows.get(self.name_for(image_path))
+                if row is None:
+                    continue
+                before, after = set(before), set(after)
+                for tags, value in ((after - before, True), (before - after, False)):
+                    for tag in tags:
+                        column = self._column(tag)
+                        if column is not None:
+                            self.applied[row, column] = value
+            self._applied_histogram = None
+
+    def set_threshold(self, threshold):
+        with self._lock:
+            self.threshold = threshold
+            self.save()
+
+    def save(self):
+        with self._lock:
+            if self.scores is None:
+                return
+            self.scores.flush()
+            self.applied.flush()
+            index = {
+                "model": self.model,
+                "version": self.version,
+                "threshold": self.threshold,
+                "tag_names": self.tag_names,
+                "taggable": np.flatnonzero(self.taggable).tolist(),
+                "rows": self.rows,
+            }
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+
+    def matrix(self):
+        return self.scores[:len(self.rows)] if self.scores is not None else np.zeros((0, 0), dtype=np.float16)
+
+    def histogram(self):
+        """Number of taggable scores in each bin over the whole folder"""
+        with self._lock:
+            if self._histogram is None:
+                counts = np.zeros(SCORE_BINS + 1, dtype=np.int64)
+                matrix = self.matrix()
+                for start in range(0, len(matrix), HISTOGRAM_CHUNK):
+                    chunk = matrix[start:start + HISTOGRAM_CHUNK][:, self.taggable]
+                    counts += np.bincount(score_bins(chunk).ravel(), minlength=SCORE_BINS + 1)
+                self._histogram = counts
+            return self._histogram
+
+    def applied_histogram(self):
+        """Like histogram, counting only the scores of applied tags"""
+        with self._lock:
+            if self._applied_histogram is None:
+                counts = np.zeros(SCORE_BINS + 1, dtype=np.int64)
+                matrix = self.matrix()
+                for start in range(0, len(matrix), HISTOGRAM_CHUNK):
+                    chunk = matrix[start:start + HISTOGRAM_CHUNK][:, self.taggable]
+                    applied = self.applied[start:start + len(chunk)][:, self.taggable]
+                    counts += np.bincount(score_bins(chunk[applied]), minlength=SCORE_BINS + 1)
+                self._applied_histogram = counts
+            return self._applied_histogram
+
+    def count_tags(self, threshold):
+        """Tags the whole folder gets at threshold"""
+        return int(self.histogram()[threshold_bin(threshold):].sum())
+
+    def threshold_delta(self, new_threshold):
+        """(added, removed) tag counts when moving from the stored threshold to new_threshold"""
+        if self.threshold is None:
+            return self.count_tags(new_threshold), 0
+        old_bin, new_bin = threshold_bin(self.threshold), threshold_bin(new_threshold)
+        counts = self.histogram()
+        if new_bin < old_bin:
+            return int(counts[new_bin:old_bin].sum()), 0
+        # Only tags the tagger added are removed
+        return 0, int(self.applied_histogram()[old_bin:new_bin].sum())
+
+    def tag_changes(self, old_threshold, new_threshold):
+        """image name -> (tags to add, tags to remove) between two thresholds.
+        Tags are added in descending score order; only applied tags are removed."""
+        lo, hi = sorted((threshold_bin(old_threshold), threshold_bin(new_threshold)))
+        adding = new_threshold < old_threshold
+        names = {row: name for name, row in self.rows.items()}
+        columns = np.flatnonzero(self.taggable)
+        changes = {}
+        with self._lock:
+            matrix = self.matrix()
+            for start in range(0, len(matrix), HISTOGRAM_CHUNK):
+                chunk = matrix[start:start + HISTOGRAM_CHUNK][:, columns]
+                bins = score_bins(chunk)
+                band = (bins >= lo) & (bins < hi)
+                if not adding:
+                    band &= self.applied[start:start + len(chunk)][:, columns]
+                band_rows, band_cols = np.nonzero(band)
+                if not len(band_rows):
+                    continue
+                # Highest scores first within every row
+                order = np.lexsort((-chunk[band_rows, band_cols].astype(np.float32), band_rows))
+                for r, c in zip(band_rows[order], band_cols[order]):
+                    add, remove = changes.setdefault(names[start + r], ([], set()))
+                    tag = self.tag_names[columns[c]]
+                    if adding:
+                        add.append(tag)
+                    else:
+                        remove.add(tag)
+        return changes
+
+
+class RethresholdEdit(BulkEdit):
+    """Bulk edit that moves a folder's tagger tags from one threshold to another.
+
+    Lowering the threshold appends the tags that now pass; raising it removes
+    the tags the tagger added whose score falls between the two thresholds.
+    Undo restores the exact previous tags and the store's threshold with them.
+    """
+
+    def __init__(self, file_manager, store, old_threshold, new_threshold):
+        super().__init__(file_manager, f"Threshold {old_threshold:.2f} -> {new_threshold:.2f}", None, [])
+        self.store = store
+        self.old_threshold = old_threshold
+        self.new_threshold = new_threshold
+        self.tag_changes = {}
+
+    def plan(self):
+        changes = self.store.tag_changes(self.old_threshold, self.new_threshold)
+        self.tag_changes = {}
+        for image_path in self.file_manager.all_image_files:
+            name = self.store.name_for(image_path)
+            if name in changes:
+                self.tag_changes[image_path] = changes[name]
+        self.image_paths = list(self.tag_changes)
+        return super().plan()
+
+    def _plan_one(self, image_path):
+        tags = self.file_manager.get_tags(image_path)
+        add, remove = self.tag_changes[image_path]
+        new_tags = [t for t in tags if t not in remove]
+        new_tags += [t for t in add if t not in new_tags]
+        return tags, new_tags
+
+    def run(self, on_progress=None, should_stop=None):
+        count = super().run(on_progress, should_stop)
+        if not self.cancelled:
+            self.store.update_applied(self.changes)
+            self.store.set_threshold(self.new_threshold)
+        return count
+
+    def inverse(self):
+        return ThresholdRestoreEdit(
+            self.file_manager, self.description,
+            [(p, after, before) for p, before, after in self.changes],
+            self.store, self.old_threshold, self.new_threshold,
+        )
+
+
+class ThresholdRestoreEdit(RestoreEdit):
+    """Undo/redo of a RethresholdEdit: restores the recorded tags, then the threshold"""
+
+    def __init__(self, file_manager, description, changes, store, threshold, other_threshold):
+        super().__init__(file_manager, description, changes)
+        self.store = store
+        self.threshold = threshold
+        self.other_threshold = other_threshold
+
+    def run(self, on_progress=None, should_stop=None):
+        count = super().run(on_progress, should_stop)
+        if not self.cancelled:
+            self.store.update_applied(self.changes)
+            self.store.set_threshold(self.threshold)
+        return count
+
+    def inverse(self):
+        return ThresholdRestoreEdit(
+            self.file_manager, self.description,
+            [(p, after, before) for p, before, after in self.changes],
+            self.store, self.other_threshold, self.threshold,
+        )
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_score_store(folder_path):
+    """Process-wide ScoreStore for folder_path"""
+    key = os.path.abspath(folder_path)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ScoreStore(key)
+        return _stores[key]
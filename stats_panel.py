@@ -0,0 +1,140 @@
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QSpinBox, QTabWidget,
+    QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView, QWidget
+)
+
+HISTOGRAM_BAR_WIDTH = 40
+
+
+def _table(headers):
+    table = QTableWidget(0, len(headers))
+    table.setHorizontalHeaderLabels(headers)
+    table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+    table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+    table.verticalHeader().setVisible(False)
+    table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+    return table
+
+
+def _fill(table, rows):
+    table.setUpdatesEnabled(False)
+    table.setRowCount(len(rows))
+    for r, row in enumerate(rows):
+        for c, value in enumerate(row):
+            item = QTableWidgetItem(str(value))
+            if isinstance(value, (int, float)):
+                item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+            table.setItem(r, c, item)
+    table.setUpdatesEnabled(True)
+
+
+class StatsDialog(QDialog):
+    """Tag statistics of the open folder.
+
+    Everything is read from FileManager's incremental TagStats and search
+    bitsets, so refreshing is cheap; while the dialog is open it polls the
+    stats version and only redraws after an edit.
+    """
+
+    def __init__(self, file_manager, parent=None):
+        super().__init__(parent)
+        self.file_manager = file_manager
+        self.shown_version = None
+        self.setWindowTitle("Tag Statistics")
+        self.resize(560, 640)
+        layout = QVBoxLayout(self)
+
+        self.summary_label = QLabel()
+        self.summary_label.setWordWrap(True)
+        layout.addWidget(self.summary_label)
+
+        tabs = QTabWidget()
+        layout.addWidget(tabs, stretch=1)
+
+        top_tab = QWidget()
+        top_layout = QVBoxLayout(top_tab)
+        top_controls = QHBoxLayout()
+        top_controls.addWidget(QLabel("Show top:"))
+        self.top_spin = QSpinBox()
+        self.top_spin.setRange(10, 5000)
+        self.top_spin.setValue(100)
+        self.top_spin.valueChanged.connect(lambda _: self.refresh(force=True))
+        top_controls.addWidget(self.top_spin)
+        top_controls.addStretch()
+        top_layout.addLayout(top_controls)
+        self.top_table = _table(["Tag", "Images", "%"])
+        top_layout.addWidget(self.top_table)
+        tabs.addTab(top_tab, "Top Tags")
+
+        self.histogram_table = _table(["Tags per image", "Images", ""])
+        self.histogram_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
+        self.histogram_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
+        tabs.addTab(self.histogram_table, "Tags per Image")
+
+        co_tab = QWidget()
+        co_layout = QVBoxLayout(co_tab)
+        self.co_input = QLineEdit()
+        self.co_input.setPlaceholderText("Tags to compare, comma separated")
+        self.co_input.editingFinished.connect(self.refresh_co_occurrence)
+        co_layout.addWidget(self.co_input)
+        self.co_table = QTableWidget()
+        self.co_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        co_layout.addWidget(self.co_table)
+        tabs.addTab(co_tab, "Co-occurrence")
+
+        rare_tab = QWidget()
+        rare_layout = QVBoxLayout(rare_tab)
+        rare_controls = QHBoxLayout()
+        rare_controls.addWidget(QLabel("Used by at most:"))
+        self.rare_spin = QSpinBox()
+        self.rare_spin.setRange(1, 1000)
+        self.rare_spin.setSuffix(" images")
+        self.rare_spin.valueChanged.connect(lambda _: self.refresh(force=True))
+        rare_controls.addWidget(self.rare_spin)
+        rare_controls.addStretch()
+        rare_layout.addLayout(rare_controls)
+        self.rare_table = _table(["Tag", "Images"])
+        rare_layout.addWidget(self.rare_table)
+        tabs.addTab(rare_tab, "Rare Tags")
+
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(1000)
+        self.poll_timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh(force=True)
+        self.poll_timer.start()
+
+    def hideEvent(self, event):
+        self.poll_timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self, force=False):
+        stats = self.file_manager.get_tag_stats()
+        version = (id(stats), stats.version, len(self.file_manager.all_image_files))
+        if not force and version == self.shown_version:
+            return
+        self.shown_version = version
+        data = self.file_manager.tag_statistics(top=self.top_spin.value(), rare_max=self.rare_spin.value(), rare_limit=5000)
+        images = data["images"]
+        self.summary_label.setText(
+            f"{images} images, {data['tagged_images']} tagged, {data['unique_tags']} unique tags, "
+            f"{data['total_tags']} tags in total ({data['tags_per_image']} per image)")
+        _fill(self.top_table, [(tag, count, round(100 * count / images, 1) if images else 0) for tag, count in data["top_tags"]])
+        peak = max((count for _, count in data["histogram"]), default=0)
+        _fill(self.histogram_table, [
+            (n, count, "█" * max(1, round(HISTOGRAM_BAR_WIDTH * count / peak)) if peak else "")
+            for n, count in data["histogram"]
+        ])
+        _fill(self.rare_table, data["rare_tags"])
+        self.refresh_co_occurrence()
+
+    def refresh_co_occurrence(self):
+        tags = [t.strip() for t in self.co_input.text().split(",") if t.strip()]
+        matrix = self.file_manager.tag_co_occurrence(tags) if tags else []
+        self.co_table.setColumnCount(len(tags))
+        self.co_table.setHorizontalHeaderLabels(tags)
+        self.co_table.setVerticalHeaderLabels(tags)
+        _fill(self.co_table, matrix)
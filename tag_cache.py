@@ -0,0 +1,120 @@
+import os
+import sys
+import json
+import sqlite3
+import hashlib
+
+CACHE_VERSION = 1
+COMMIT_EVERY = 500
+
+
+def get_cache_dir():
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "tag_editor")
+
+
+def folder_key(folder_path):
+    """Short stable id of a folder, used to name its files in the cache dir"""
+    return hashlib.sha1(os.path.abspath(folder_path).encode("utf-8")).hexdigest()[:16]
+
+
+def stat_key(path):
+    """(mtime_ns, size) of a file, or (-1, -1) when it does not exist"""
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return -1, -1
+
+
+class TagCache:
+    """Per-folder SQLite cache of parsed sidecar tags.
+
+    Rows are keyed by the image file name relative to the folder and carry
+    the mtime/size of its .txt, so only sidecars that changed since the last
+    session have to be read again. The cache lives in the user cache dir to
+    keep dataset folders clean; deleting it is always safe.
+    """
+
+    def __init__(self, folder_path, cache_dir=None):
+        self.folder_path = os.path.abspath(folder_path)
+        cache_dir = cache_dir or get_cache_dir()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, f"tags_{folder_key(self.folder_path)}.sqlite")
+        self._pending = 0
+        # FileManager serializes access; workers may save from their own thread
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Every row is validated against the file system, so losing the
+        # last writes in a crash only costs a re-read
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self._init_schema()
+
+    def _init_schema(self):
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self.conn.execute("SELECT value FROM meta WHERE key='version'").fetchone()
+        if row is None or int(row[0]) != CACHE_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS sidecars")
+            self.conn.execute("DELETE FROM meta")
+            self.conn.execute("INSERT INTO meta VALUES ('version', ?)", (str(CACHE_VERSION),))
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sidecars ("
+            "name TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, tags TEXT)"
+        )
+        self.conn.commit()
+
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+        self._mark_dirty()
+
+    def load(self):
+        """name -> (mtime_ns, size, tags) for every cached image"""
+        entries = {}
+        for name, mtime_ns, size, tags in self.conn.execute("SELECT name, mtime_ns, size, tags FROM sidecars"):
+            try:
+                entries[name] = (mtime_ns, size, json.loads(tags))
+            except ValueError:
+                continue
+        return entries
+
+    def put(self, name, mtime_ns, size, tags):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sidecars VALUES (?, ?, ?, ?)",
+            (name, mtime_ns, size, json.dumps(list(tags), ensure_ascii=False)),
+        )
+        self._mark_dirty()
+
+    def put_many(self, rows):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO sidecars VALUES (?, ?, ?, ?)",
+            [(name, mtime_ns, size, json.dumps(list(tags), ensure_ascii=False))
+             for name, mtime_ns, size, tags in rows],
+        )
+        self.commit()
+
+    def remove(self, names):
+        self.conn.executemany("DELETE FROM sidecars WHERE name=?", [(n,) for n in names])
+        self._mark_dirty()
+
+    def _mark_dirty(self):
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self._pending = 0
+
+    def close(self):
+        try:
+            self.commit()
+            self.conn.close()
+        except sqlite3.Error:
+            pass
@@ -0,0 +1,326 @@
+"""Command line interface for headless machines.
+
+    python -m tag_editor tag FOLDER [--threshold 0.35]
+    python -m tag_editor caption FOLDER [--task "<DETAILED_CAPTION>"]
+    python -m tag_editor add|remove FOLDER TAG
+    python -m tag_editor replace FOLDER OLD NEW
+    python -m tag_editor stats FOLDER
+    python -m tag_editor duplicates FOLDER [--distance 6]
+    python -m tag_editor vocab import TAGS.csv [--aliases A.csv] [--implications I.csv]
+    python -m tag_editor vocab lookup TAG...
+
+Progress and results are written to stdout as one JSON object per line.
+Nothing from Qt is imported, and the model stacks are only imported by the
+commands that need them.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+
+PROGRESS_INTERVAL = 0.5
+
+
+class JsonReporter:
+    def __init__(self, interval=PROGRESS_INTERVAL):
+        self.interval = interval
+        self._last = 0.0
+
+    def emit(self, event, **fields):
+        sys.stdout.write(json.dumps({"event": event, **fields}, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+
+    def progress(self, current, total, filename):
+        now = time.monotonic()
+        if now - self._last >= self.interval or current + 1 >= total:
+            self._last = now
+            self.emit("progress", current=current, total=total, file=filename)
+
+
+def install_stop_handler():
+    """Event set by the first Ctrl+C so running work can stop cleanly; a
+    second Ctrl+C exits right away"""
+    stop = threading.Event()
+
+    def handle(signum, frame):
+        if stop.is_set():
+            raise KeyboardInterrupt
+        stop.set()
+
+    signal.signal(signal.SIGINT, handle)
+    return stop
+
+
+def open_folder(args, reporter):
+    from file_manager import FileManager
+    from bulk_edit import pending_journal
+
+    if not os.path.isdir(args.folder):
+        raise SystemExit(f"Not a folder: {args.folder}")
+    file_manager = FileManager()
+    if args.canonicalize:
+        from tag_vocab import get_vocabulary
+        file_manager.vocabulary = get_vocabulary()
+        if file_manager.vocabulary is None:
+            raise SystemExit("No tag dictionary. Import one with the vocab import command first.")
+    file_manager.load_folder(args.folder, recursive=args.recursive)
+    if getattr(args, "query", None):
+        file_manager.apply_filter(args.query)
+    reporter.emit("loaded", folder=os.path.abspath(args.folder), images=len(file_manager.all_image_files), selected=len(file_manager.image_files))
+
+    description = pending_journal(file_manager.folder_path)
+    if description and args.command != "rollback":
+        file_manager.close()
+        raise SystemExit(f"The bulk edit \"{description}\" did not finish in this folder. Run the rollback command first.")
+    return file_manager
+
+
+def cmd_tag(args, reporter, stop):
+    from batch_job import BatchJob
+    from batch_tagging import BatchTagger
+
+    file_manager = open_folder(args, reporter)
+    try:
+        job = None if args.restart else BatchJob.load(file_manager.folder_path, "pixai")
+        if job is not None and not job.is_complete():
+            done, failed, remaining = job.counts()
+            reporter.emit("resume", done=done, failed=failed, remaining=remaining, params=job.params)
+            tagger = BatchTagger(file_manager, None, job.params.get("threshold", args.threshold), args.batch_size, args.processes, job)
+        else:
+            if job is not None:
+                job.discard()
+            tagger = BatchTagger(file_manager, file_manager.image_files, args.threshold, args.batch_size, args.processes, skip_duplicates=args.skip_duplicates)
+        done, total = tagger.run(on_progress=reporter.progress, should_stop=stop.is_set)
+        _, failed, remaining = tagger.job.counts()
+        reporter.emit("done", done=done, failed=failed, remaining=remaining, skipped=tagger.job.skipped_count(), total=total, interrupted=stop.is_set())
+    finally:
+        file_manager.close()
+    return 130 if stop.is_set() else 0
+
+
+def cmd_caption(args, reporter, stop):
+    from batch_job import BatchJob
+    from batch_tagging import BatchCaptioner
+
+    file_manager = open_folder(args, reporter)
+    try:
+        job = None if args.restart else BatchJob.load(file_manager.folder_path, "florence")
+        if job is not None and not job.is_complete():
+            done, failed, remaining = job.counts()
+            reporter.emit("resume", done=done, failed=failed, remaining=remaining, params=job.params)
+            captioner = BatchCaptioner(file_manager, None, job.params.get("task", args.task), args.batch_size, job)
+        else:
+            if job is not None:
+                job.discard()
+            captioner = BatchCaptioner(file_manager, file_manager.image_files, args.task, args.batch_size, skip_duplicates=args.skip_duplicates)
+        done, total = captioner.run(on_progress=reporter.progress, should_stop=stop.is_set)
+        _, failed, remaining = captioner.job.counts()
+        reporter.emit("done", done=done, failed=failed, remaining=remaining, skipped=captioner.job.skipped_count(), total=total, interrupted=stop.is_set())
+    finally:
+        file_manager.close()
+    return 130 if stop.is_set() else 0
+
+
+def run_bulk_edit(args, reporter, stop, make_edit):
+    from bulk_edit import BulkEditError
+
+    file_manager = open_folder(args, reporter)
+    try:
+        bulk_edit = make_edit(file_manager)
+        if args.dry_run:
+            changes = bulk_edit.plan()
+            reporter.emit("plan", description=bulk_edit.description, files=len(changes),
+                          sample=[os.path.relpath(p, file_manager.folder_path) for p, _, _ in changes[:20]])
+            return 0
+        try:
+            count = bulk_edit.run(on_progress=reporter.progress, should_stop=stop.is_set)
+        except BulkEditError as e:
+            reporter.emit("error", message=str(e))
+            return 1
+        reporter.emit("done", description=bulk_edit.description, changed=count, cancelled=bulk_edit.cancelled)
+    finally:
+        file_manager.close()
+    return 130 if bulk_edit.cancelled else 0
+
+
+def cmd_add(args, reporter, stop):
+    return run_bulk_edit(args, reporter, stop, lambda fm: fm.bulk_add_tag(args.tag, args.position))
+
+
+def cmd_remove(args, reporter, stop):
+    return run_bulk_edit(args, reporter, stop, lambda fm: fm.bulk_remove_tag(args.tag))
+
+
+def cmd_replace(args, reporter, stop):
+    return run_bulk_edit(args, reporter, stop, lambda fm: fm.bulk_replace_tag(args.old_tag, args.new_tag))
+
+
+def cmd_rollback(args, reporter, stop):
+    from bulk_edit import rollback_journal
+
+    file_manager = open_folder(args, reporter)
+    try:
+        reporter.emit("done", restored=rollback_journal(file_manager))
+    finally:
+        file_manager.close()
+    return 0
+
+
+def cmd_stats(args, reporter, stop):
+    from tag_stats import TagStats, co_occurrence
+    from tag_query import bits_from_ids
+
+    file_manager = open_folder(args, reporter)
+    try:
+        images = file_manager.image_files
+        if args.query:
+            stats = TagStats({p: file_manager.image_tags.get(p, ()) for p in images})
+        else:
+            stats = file_manager.get_tag_stats()
+        reporter.emit(
+            "stats", **stats.summary(len(images)),
+            top_tags=[{"tag": t, "count": c} for t, c in stats.top(args.top)],
+            histogram=[{"tags": n, "images": c} for n, c in stats.histogram(len(images))],
+            rare_tags=[{"tag": t, "count": c} for t, c in stats.rare(args.rare, args.top)],
+        )
+        if args.co_occurrence:
+            tags = [t.strip() for t in args.co_occurrence.split(",") if t.strip()]
+            index = file_manager.get_query_index()
+            # With --query only the selected images are counted
+            within = bits_from_ids(sorted(index.image_ids[p] for p in images)) if args.query else None
+            reporter.emit("co_occurrence", tags=tags, matrix=co_occurrence(index, tags, within))
+    finally:
+        file_manager.close()
+    return 0
+
+
+def cmd_duplicates(args, reporter, stop):
+    from dedup import compute_hashes, find_duplicates
+
+    file_manager = open_folder(args, reporter)
+    try:
+        hashes = compute_hashes(file_manager.image_files, on_progress=reporter.progress, should_stop=stop.is_set)
+        if stop.is_set():
+            return 130
+        groups = find_duplicates(hashes, args.distance)
+        for group in groups:
+            reporter.emit("group", keep=os.path.relpath(group[0], file_manager.folder_path),
+                          duplicates=[os.path.relpath(p, file_manager.folder_path) for p in group[1:]])
+        reporter.emit("done", hashed=len(hashes), groups=len(groups), duplicates=sum(len(g) - 1 for g in groups))
+    finally:
+        file_manager.close()
+    return 0
+
+
+def cmd_vocab_import(args, reporter, stop):
+    from tag_vocab import import_vocabulary
+
+    tags, aliases, implications = import_vocabulary(args.tags_csv, args.aliases, args.implications)
+    reporter.emit("done", tags=tags, aliases=aliases, implications=implications)
+    return 0
+
+
+def cmd_vocab_lookup(args, reporter, stop):
+    from tag_vocab import get_vocabulary, CATEGORY_NAMES
+
+    vocabulary = get_vocabulary()
+    if vocabulary is None:
+        raise SystemExit("No tag dictionary. Import one with the vocab import command first.")
+    for tag in args.tags:
+        found = vocabulary.lookup(tag)
+        if found is None:
+            reporter.emit("tag", tag=tag, known=False)
+            continue
+        name, category, count = found
+        reporter.emit("tag", tag=tag, known=True, canonical=name, category=CATEGORY_NAMES.get(category, category),
+                      count=count, implies=vocabulary.implications(tag))
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="tag_editor", description="Headless tag editing and AI tagging")
+    parser.add_argument("--progress-interval", type=float, default=PROGRESS_INTERVAL, help="Seconds between progress lines")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def folder_command(name, handler, help_text):
+        sub = commands.add_parser(name, help=help_text)
+        sub.add_argument("folder")
+        sub.add_argument("-r", "--recursive", action="store_true", help="Include images in subfolders")
+        sub.add_argument("--canonicalize", action="store_true", help="Replace tag aliases using the tag dictionary when saving")
+        sub.set_defaults(handler=handler)
+        return sub
+
+    sub = folder_command("tag", cmd_tag, "Tag images with PixAI")
+    sub.add_argument("--threshold", type=float, default=0.35)
+    sub.add_argument("--batch-size", type=int, default=16)
+    sub.add_argument("--processes", type=int, default=None, help="CPU worker processes when there is no GPU (0 disables)")
+    sub.add_argument("--query", help="Only images matching this tag query")
+    sub.add_argument("--restart", action="store_true", help="Discard an unfinished job instead of resuming it")
+    sub.add_argument("--skip-duplicates", action="store_true", help="Tag only one image of each group of near-duplicates")
+
+    sub = folder_command("caption", cmd_caption, "Caption images with Florence-2")
+    sub.add_argument("--task", default="<DETAILED_CAPTION>")
+    sub.add_argument("--batch-size", type=int, default=8)
+    sub.add_argument("--query", help="Only images matching this tag query")
+    sub.add_argument("--restart", action="store_true", help="Discard an unfinished job instead of resuming it")
+    sub.add_argument("--skip-duplicates", action="store_true", help="Caption only one image of each group of near-duplicates")
+
+    sub = folder_command("add", cmd_add, "Add a tag to every image")
+    sub.add_argument("tag")
+    sub.add_argument("--position", choices=("start", "end"), default="end")
+    sub.add_argument("--dry-run", action="store_true")
+
+    sub = folder_command("remove", cmd_remove, "Remove a tag from every image")
+    sub.add_argument("tag")
+    sub.add_argument("--dry-run", action="store_true")
+
+    sub = folder_command("replace", cmd_replace, "Replace a tag in every image")
+    sub.add_argument("old_tag")
+    sub.add_argument("new_tag")
+    sub.add_argument("--dry-run", action="store_true")
+
+    folder_command("rollback", cmd_rollback, "Roll back a bulk edit that was interrupted")
+
+    sub = folder_command("stats", cmd_stats, "Print tag statistics")
+    sub.add_argument("--top", type=int, default=50)
+    sub.add_argument("--rare", type=int, default=1, help="List tags used by at most this many images")
+    sub.add_argument("--co-occurrence", metavar="TAGS", help="Comma separated tags to cross-count")
+    sub.add_argument("--query", help="Only images matching this tag query")
+
+    sub = folder_command("duplicates", cmd_duplicates, "List groups of near-duplicate images")
+    sub.add_argument("--distance", type=int, default=6, help="Most pHash bits two duplicates may differ in")
+    sub.add_argument("--query", help="Only images matching this tag query")
+
+    vocab = commands.add_parser("vocab", help="Manage the offline tag dictionary").add_subparsers(dest="vocab_command", required=True)
+    sub = vocab.add_parser("import", help="Build the dictionary from a tag list CSV (e.g. selected_tags.csv)")
+    sub.add_argument("tags_csv")
+    sub.add_argument("--aliases", help="CSV of alias pairs (antecedent_name,consequent_name)")
+    sub.add_argument("--implications", help="CSV of implication pairs (antecedent_name,consequent_name)")
+    sub.set_defaults(handler=cmd_vocab_import)
+    sub = vocab.add_parser("lookup", help="Show the canonical tag, category and implications of tags")
+    sub.add_argument("tags", nargs="+")
+    sub.set_defaults(handler=cmd_vocab_lookup)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    reporter = JsonReporter(args.progress_interval)
+    stop = install_stop_handler()
+    try:
+        return args.handler(args, reporter, stop)
+    except SystemExit as e:
+        if isinstance(e.code, str):
+            reporter.emit("error", message=e.code)
+            return 2
+        raise
+    except Exception as e:
+        reporter.emit("error", message=str(e))
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+import re
+import bisect
+import fnmatch
+
+# Search box syntax:
+#   long hair AND (smile OR open mouth)    boolean operators (also & and |)
+#   1girl, solo                            comma is AND
+#   NOT monochrome / !monochrome           negation
+#   hat*  *hair*  *_eyes                   prefix / substring / wildcard
+#   tags<10  tags>=25  tags=0              filter on the number of tags
+#   ":|"  "!?"  \;\)  "tags<10"           quotes or backslashes make a tag literal
+# Keywords must be upper case so tags such as "black and white" still work,
+# and parentheses inside a tag ("saber (fate)") are kept as part of the tag.
+# A term with a quoted or escaped part is matched exactly, without wildcards
+# or tag count filters; an unclosed quote runs to the end of the query.
+
+_KEYWORD_RE = re.compile(r'(AND|OR|NOT)(?=[\s()]|$)')
+_COUNT_RE = re.compile(r'^tags\s*(<=|>=|!=|==|<|>|=)\s*(\d+)$', re.IGNORECASE)
+_OPERATORS = {'&': 'AND', ',': 'AND', '|': 'OR', '!': 'NOT'}
+
+# Set bit positions of every byte value, used to turn a bitset into ids
+_BYTE_BITS = [tuple(b for b in range(8) if value >> b & 1) for value in range(256)]
+
+
+def bits_from_ids(ids):
+    """Bitset for an ascending list of image ids"""
+    if not ids:
+        return 0
+    buf = bytearray(ids[-1] // 8 + 1)
+    for i in ids:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, 'little')
+
+
+def ids_from_bits(bits):
+    """Ascending image ids set in a bitset"""
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    ids = []
+    for byte_index, byte in enumerate(data):
+        if byte:
+            base = byte_index * 8
+            ids.extend(base + b for b in _BYTE_BITS[byte])
+    return ids
+
+
+def tokenize(query):
+    tokens = []
+    term = []
+    exact = []
+    depth = 0
+
+    def flush():
+        text = ' '.join(''.join(term).split())
+        if text:
+            tokens.append(('EXACT' if exact else 'TERM', text))
+        term.clear()
+        exact.clear()
+
+    i = 0
+    while i < len(query):
+        c = query[i]
+        if c == '\\':
+            term.append(query[i + 1] if i + 1 < len(query) else c)
+            exact.append(True)
+            i += 2
+            continue
+        if c == '"':
+            end = query.find('"', i + 1)
+            if end < 0:
+                end = len(query)
+            term.append(query[i + 1:end])
+            exact.append(True)
+            i = end + 1
+            continue
+        at_term_start = not ''.join(term).strip()
+        at_boundary = at_term_start or query[i - 1].isspace()
+        keyword = _KEYWORD_RE.match(query, i) if at_boundary else None
+        if keyword:
+            flush()
+            tokens.append((keyword.group(1), None))
+            i = keyword.end()
+            continue
+        if c == '(' and at_term_start:
+            flush()
+            tokens.append(('(', None))
+        elif c == ')' and depth == 0:
+            flush()
+            tokens.append((')', None))
+        elif c in '&,|' or (c == '!' and at_term_start):
+            flush()
+            tokens.append((_OPERATORS[c], None))
+        else:
+            if c == '(':
+                depth += 1
+            elif c == ')':
+                depth -= 1
+            term.append(c)
+        i += 1
+    flush()
+    return tokens
+
+
+class _Parser:
+    """Forgiving recursive descent parser: the query is re-run on every
+    keystroke, so unbalanced parentheses and dangling operators are ignored
+    instead of raising."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos][0]
+        return None
+
+    def parse(self):
+        node = None
+        while self.peek() is not None:
+            part = self.parse_or()
+            if part is not None:
+                node = part if node is None else ('and', node, part)
+            elif self.peek() is not None:
+                self.pos += 1  # stray ')' or operator
+        return node if node is not None else ('all',)
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.peek() == 'OR':
+            self.pos += 1
+            right = self.parse_and()
+            if right is not None:
+                node = right if node is None else ('or', node, right)
+        return node
+
+    def parse_and(self):
+        node = self.parse_unary()
+        while self.peek() in ('AND', 'NOT', 'TERM', 'EXACT', '('):
+            if self.peek() == 'AND':
+                self.pos += 1
+            right = self.parse_unary()
+            if right is not None:
+                node = right if node is None else ('and', node, right)
+        return node
+
+    def parse_unary(self):
+        if self.peek() == 'NOT':
+            self.pos += 1
+            operand = self.parse_unary()
+            return ('not', operand) if operand is not None else None
+        return self.parse_primary()
+
+    def parse_primary(self):
+        kind = self.peek()
+        if kind == '(':
+            self.pos += 1
+            node = self.parse_or()
+            if self.peek() == ')':
+                self.pos += 1
+            return node
+        if kind in ('TERM', 'EXACT'):
+            text = self.tokens[self.pos][1]
+            self.pos += 1
+            return ('term' if kind == 'TERM' else 'tag', text)
+        return None
+
+
+def parse_query(query):
+    return _Parser(tokenize(query or "")).parse()
+
+
+class TagQueryIndex:
+    """Posting lists over the folder's image list.
+
+    Image ids are positions in the image list and every posting list is a
+    Python int used as a bitset, so AND/OR/NOT are single big-int operations.
+    Tags are matched case-insensitively.
+    """
+
+    def __init__(self, image_paths, image_tags):
+        self.image_paths = list(image_paths)
+        self.image_ids = {path: i for i, path in enumerate(self.image_paths)}
+        self.universe = (1 << len(self.image_paths)) - 1
+        # Collect sorted id lists first; OR-ing bits into growing ints one
+        # image at a time would be quadratic in the folder size.
+        tag_ids = {}
+        count_ids = {}
+        for i, path in enumerate(self.image_paths):
+            tags = {t.lower() for t in image_tags.get(path, ())}
+            for tag in tags:
+                tag_ids.setdefault(tag, []).append(i)
+            count_ids.setdefault(len(tags), []).append(i)
+        self.postings = {tag: bits_from_ids(ids) for tag, ids in tag_ids.items()}
+        self.count_buckets = {count: bits_from_ids(ids) for count, ids in count_ids.items()}
+        self.sorted_tags = sorted(self.postings)
+
+    def update_image(self, image_path, old_tags, new_tags):
+        image_id = self.image_ids.get(image_path)
+        if image_id is None:
+            return
+        bit = 1 << image_id
+        old_tags = {t.lower() for t in old_tags}
+        new_tags = {t.lower() for t in new_tags}
+        for tag in old_tags - new_tags:
+            bits = self.postings.get(tag, 0) & ~bit
+            if bits:
+                self.postings[tag] = bits
+            elif tag in self.postings:
+                del self.postings[tag]
+                idx = bisect.bisect_left(self.sorted_tags, tag)
+                if idx < len(self.sorted_tags) and self.sorted_tags[idx] == tag:
+                    self.sorted_tags.pop(idx)
+        for tag in new_tags - old_tags:
+            if tag not in self.postings:
+                bisect.insort(self.sorted_tags, tag)
+            self.postings[tag] = self.postings.get(tag, 0) | bit
+        if len(old_tags) != len(new_tags):
+            self._move_count(bit, len(old_tags), len(new_tags))
+
+    def _move_count(self, bit, old_count, new_count):
+        bits = self.count_buckets.get(old_count, 0) & ~bit
+        if bits:
+            self.count_buckets[old_count] = bits
+        else:
+            self.count_buckets.pop(old_count, None)
+        self.count_buckets[new_count] = self.count_buckets.get(new_count, 0) | bit
+
+    def matching_tags(self, pattern):
+        """Lower-cased tags matched by a tag*, *tag* or wildcard pattern"""
+        pattern = pattern.lower()
+        body = pattern.strip('*')
+        if '*' not in body and '?' not in body and not any(c in body for c in '[]'):
+            if pattern.startswith('*') and pattern.endswith('*'):
+                return [t for t in self.sorted_tags if body in t]
+            if pattern.endswith('*'):
+                start = bisect.bisect_left(self.sorted_tags, body)
+                end = bisect.bisect_left(self.sorted_tags, body + '\uffff')
+                return self.sorted_tags[start:end]
+            if pattern.startswith('*'):
+                return [t for t in self.sorted_tags if t.endswith(body)]
+        return [t for t in self.sorted_tags if fnmatch.fnmatchcase(t, pattern)]
+
+    def term_bits(self, text):
+        count_match = _COUNT_RE.match(text)
+        if count_match:
+            op, value = count_match.group(1), int(count_match.group(2))
+            compare = {
+                '<': lambda n: n < value, '<=': lambda n: n <= value,
+                '>': lambda n: n > value, '>=': lambda n: n >= value,
+                '=': lambda n: n == value, '==': lambda n: n == value,
+                '!=': lambda n: n != value,
+            }[op]
+            bits = 0
+            for count, bucket in self.count_buckets.items():
+                if compare(count):
+                    bits |= bucket
+            return bits
+        if '*' in text:
+            bits = 0
+            for tag in self.matching_tags(text):
+                bits |= self.postings[tag]
+            return bits
+        return self.postings.get(text.lower(), 0)
+
+    def evaluate(self, node):
+        kind = node[0]
+        if kind == 'all':
+            return self.universe
+        if kind == 'term':
+            return self.term_bits(node[1])
+        if kind == 'tag':
+            return self.postings.get(node[1].lower(), 0)
+        if kind == 'not':
+            return self.universe & ~self.evaluate(node[1])
+        left = self.evaluate(node[1])
+        if kind == 'and':
+            # Skip the right side entirely once nothing is left to intersect
+            return left & self.evaluate(node[2]) if left else 0
+        return left | self.evaluate(node[2])
+
+    def search(self, query):
+        """Image paths matching the query, in image list order"""
+        bits = self.evaluate(parse_query(query))
+        return [self.image_paths[i] for i in ids_from_bits(bits)]
@@ -0,0 +1,103 @@
+class TagStats:
+    """Folder-wide tag statistics kept up to date edit by edit.
+
+    Tags are bucketed by how many images use them (count -> tags), so top-N
+    and rare tags are read off the buckets, and the number of images per
+    tags-per-image value is kept as a histogram. update() is called with an
+    image's old and new tag sets; nothing is ever rescanned. version goes up
+    with every change so views can tell when to redraw. Tags are counted
+    case-insensitively, like the search index co_occurrence reads, so
+    "Smile" and "smile" are one tag everywhere in the panel.
+    """
+
+    def __init__(self, image_tags=None):
+        self.tag_counts = {}
+        self.by_count = {} # images -> set of tags used by that many images
+        self.per_image = {} # tags on an image -> images, for images with tags
+        self.version = 0
+        for tags in (image_tags or {}).values():
+            self.update((), set(tags))
+
+    def update(self, old_tags, new_tags):
+        old_tags = {t.lower() for t in old_tags}
+        new_tags = {t.lower() for t in new_tags}
+        for tag in old_tags - new_tags:
+            self._move(tag, -1)
+        for tag in new_tags - old_tags:
+            self._move(tag, 1)
+        if len(old_tags) != len(new_tags):
+            self._bump(self.per_image, len(old_tags), -1)
+            self._bump(self.per_image, len(new_tags), 1)
+        self.version += 1
+
+    def _move(self, tag, delta):
+        old = self.tag_counts.get(tag, 0)
+        new = old + delta
+        if old:
+            bucket = self.by_count[old]
+            bucket.discard(tag)
+            if not bucket:
+                del self.by_count[old]
+        if new > 0:
+            self.tag_counts[tag] = new
+            self.by_count.setdefault(new, set()).add(tag)
+        else:
+            self.tag_counts.pop(tag, None)
+
+    def _bump(self, counter, key, delta):
+        if key == 0:
+            # Untagged images are derived from the folder size instead
+            return
+        value = counter.get(key, 0) + delta
+        if value > 0:
+            counter[key] = value
+        else:
+            counter.pop(key, None)
+
+    def top(self, n=50):
+        """[(tag, images)] of the n most used tags"""
+        result = []
+        for count in sorted(self.by_count, reverse=True) if n else ():
+            for tag in sorted(self.by_count[count]):
+                result.append((tag, count))
+                if len(result) >= n:
+                    return result
+        return result
+
+    def rare(self, max_images=1, limit=200):
+        """[(tag, images)] of tags used by at most max_images images, rarest first"""
+        result = []
+        for count in sorted(c for c in self.by_count if c <= max_images):
+            for tag in sorted(self.by_count[count]):
+                result.append((tag, count))
+                if len(result) >= limit:
+                    return result
+        return result
+
+    def histogram(self, total_images):
+        """[(tags on an image, images)] in ascending order, untagged images included"""
+        tagged = sum(self.per_image.values())
+        result = sorted(self.per_image.items())
+        if total_images > tagged:
+            result.insert(0, (0, total_images - tagged))
+        return result
+
+    def summary(self, total_images):
+        tag_total = sum(n * images for n, images in self.per_image.items())
+        return {
+            "images": total_images,
+            "tagged_images": sum(self.per_image.values()),
+            "unique_tags": len(self.tag_counts),
+            "total_tags": tag_total,
+            "tags_per_image": round(tag_total / total_images, 2) if total_images else 0,
+        }
+
+
+def co_occurrence(query_index, tags, within=None):
+    """Matrix of how many images carry both tags[i] and tags[j]; the diagonal
+    is each tag's own count. Uses the search index bitsets, so each cell is
+    one AND and a popcount. within is an optional bitset of images to count."""
+    postings = [query_index.postings.get(tag.lower(), 0) for tag in tags]
+    if within is not None:
+        postings = [bits & within for bits in postings]
+    return [[(a & b).bit_count() for b in postings] for a in postings]
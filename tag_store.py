@@ -0,0 +1,165 @@
+import time
+import queue
+import threading
+import traceback
+
+# The writer takes up to this many operations per batch, waiting at most
+# STORE_BATCH_WAIT seconds for more once the first has arrived
+STORE_BATCH_SIZE = 256
+STORE_BATCH_WAIT = 0.05
+
+
+class StaleImageError(Exception):
+    """The image is not part of the folder that is open now"""
+
+
+def append_missing(tags, new_tags):
+    """tags with every tag of new_tags it does not have yet appended"""
+    merged = list(tags)
+    seen = set(merged)
+    for tag in new_tags:
+        tag = str(tag).strip()
+        if tag and tag not in seen:
+            merged.append(tag)
+            seen.add(tag)
+    return merged
+
+
+class TagStore:
+    """Single writer for tag changes coming from background workers.
+
+    Workers call merge() and move on; a writer thread takes the queued
+    operations in batches, applies all operations on the same image in the
+    order they were submitted on top of its latest tags (including unsaved
+    GUI edits) with FileManager.update_tags, writes each changed sidecar
+    once and then calls the listeners with the image paths that changed.
+    Listeners and on_done callbacks run on the writer thread. Operations
+    submitted while close() is shutting the writer down are rejected through
+    their on_done callback.
+    """
+
+    def __init__(self, file_manager, batch_size=STORE_BATCH_SIZE, batch_wait=STORE_BATCH_WAIT):
+        self.file_manager = file_manager
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.listeners = []
+        self._queue = queue.Queue()
+        self._thread = None
+        self._closing = False
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def merge(self, image_path, new_tags, on_done=None):
+        """Append the tags image_path does not have yet"""
+        new_tags = list(new_tags)
+        self.submit(image_path, lambda tags: append_missing(tags, new_tags), on_done)
+
+    def submit(self, image_path, update, on_done=None):
+        """Queue update(tags) -> new tags for image_path. on_done(image_path,
+        error) is called once the result is on disk, or with the error when
+        the update or the write failed."""
+        with self._lock:
+            # Queued under the lock so nothing lands behind close()'s sentinel
+            if not self._closing:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="TagStore", daemon=True)
+                    self._thread.start()
+                self._queue.put((image_path, update, on_done))
+                return
+        if on_done is not None:
+            on_done(image_path, RuntimeError("The tag store is closing"))
+
+    def drain(self):
+        """Wait until everything submitted so far has been written"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Write everything queued and stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._closing = True
+            self._queue.put(None)
+        try:
+            thread.join()
+        finally:
+            with self._lock:
+                self._closing = False
+
+    def _next_batch(self):
+        first = self._queue.get()
+        batch = [first]
+        if first is None:
+            return batch
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is None:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                stop = batch[-1] is None
+                self._apply([item for item in batch if item is not None])
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _apply(self, batch):
+        # Operations on the same image are applied in submission order
+        updates = {}
+        callbacks = {}
+        for image_path, update, on_done in batch:
+            updates.setdefault(image_path, []).append(update)
+            if on_done is not None:
+                callbacks.setdefault(image_path, []).append(on_done)
+        changed = []
+        errors = {}
+        for image_path, funcs in updates.items():
+            def apply_all(tags, funcs=funcs):
+                for update in funcs:
+                    tags = update(tags)
+                return tags
+            try:
+                if self.file_manager.update_tags(image_path, apply_all, due_now=True) is not None:
+                    changed.append(image_path)
+            except StaleImageError as e:
+                errors[image_path] = e
+            except Exception as e:
+                traceback.print_exc()
+                errors[image_path] = e
+        # Files that could not be written stay in the write-behind queue and
+        # are retried by the next flush
+        for image_path in self.file_manager.flush_writes(paths=changed) if changed else ():
+            errors[image_path] = OSError(f"Could not write the tags of {image_path}")
+        for image_path, funcs in callbacks.items():
+            for on_done in funcs:
+                try:
+                    on_done(image_path, errors.get(image_path))
+                except Exception:
+                    traceback.print_exc()
+        if not changed:
+            return
+        for listener in list(self.listeners):
+            try:
+                listener(changed)
+            except Exception:
+                traceback.print_exc()
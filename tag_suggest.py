@@ -0,0 +1,192 @@
+import bisect
+import heapq
+
+# Keys sort below this, so key + _END bounds every key starting with key
+_END = "\U0010ffff"
+# Prefixes matching more keys than this have their ranking memoized
+MEMO_RANGE = 512
+# One typo or swapped pair of letters; two made long queries walk most of the index
+FUZZY_DISTANCE = 1
+
+
+def normalize_tag(tag):
+    """Comparison key: case, underscores and repeated spaces don't matter"""
+    return " ".join(tag.lower().replace("_", " ").split())
+
+
+def _next_row(row, char, query, prev_row=None, prev_char=None):
+    """Next row of the edit distance table between query and a key growing by
+    char; swapping two neighbouring letters counts as one edit"""
+    left = row[0] + 1
+    new_row = [left]
+    for j, query_char in enumerate(query, 1):
+        left = min(left + 1, row[j] + 1, row[j - 1] + (query_char != char))
+        if prev_row is not None and j > 1 and query_char == prev_char and query[j - 2] == char:
+            left = min(left, prev_row[j - 2] + 1)
+        new_row.append(left)
+    return new_row
+
+
+class TagSuggestIndex:
+    """Autocomplete over the folder's tags, ranked by how many images use them.
+
+    Normalized tag keys are kept in a sorted array, which doubles as an
+    implicit trie: a prefix is a bisect range. One-edit fuzzy lookups turn
+    every single edit of the query into a prefix range, trying only the
+    letters that actually follow in the trie; larger distances walk the
+    array sharing Levenshtein rows between neighbouring keys and skipping
+    whole ranges once a prefix is too far from the query. Spellings that
+    only differ in case or underscores share a key; the most used one is
+    suggested. Counts are updated incrementally with add().
+    """
+
+    def __init__(self, counts=None):
+        self.keys = []
+        self.variants = {} # key -> {tag: images}
+        self.freq = {} # key -> images over all variants
+        self._memo = {}
+        if counts:
+            for tag, count in counts.items():
+                if count > 0:
+                    key = normalize_tag(tag)
+                    if key:
+                        self.variants.setdefault(key, {})[tag] = count
+                        self.freq[key] = self.freq.get(key, 0) + count
+            self.keys = sorted(self.freq)
+
+    def add(self, tag, delta):
+        """Change the number of images using tag by delta"""
+        key = normalize_tag(tag)
+        if not key or not delta:
+            return
+        variants = self.variants.setdefault(key, {})
+        count = variants.get(tag, 0) + delta
+        if count > 0:
+            variants[tag] = count
+        else:
+            variants.pop(tag, None)
+        if key not in self.freq:
+            bisect.insort(self.keys, key)
+        self.freq[key] = self.freq.get(key, 0) + delta
+        if not variants:
+            del self.variants[key]
+            del self.freq[key]
+            del self.keys[bisect.bisect_left(self.keys, key)]
+        self._memo.clear()
+
+    def tag_for(self, key):
+        variants = self.variants[key]
+        return max(variants, key=variants.get)
+
+    def _range(self, prefix):
+        return bisect.bisect_left(self.keys, prefix), bisect.bisect_left(self.keys, prefix + _END)
+
+    def _top(self, lo, hi, limit):
+        if hi - lo <= limit:
+            return sorted(self.keys[lo:hi], key=lambda k: -self.freq[k])
+        return heapq.nlargest(limit, self.keys[lo:hi], key=self.freq.get)
+
+    def prefix_matches(self, prefix, limit=20):
+        """Keys starting with prefix, most used first"""
+        lo, hi = self._range(prefix)
+        if hi - lo <= MEMO_RANGE:
+            return self._top(lo, hi, limit)
+        memo = self._memo.get(prefix)
+        if memo is None or len(memo) < limit:
+            memo = self._memo[prefix] = self._top(lo, hi, max(limit, 50))
+        return memo[:limit]
+
+    def _children(self, prefix):
+        """Letters that follow prefix in some key"""
+        keys = self.keys
+        depth = len(prefix)
+        i, hi = self._range(prefix)
+        letters = []
+        while i < hi:
+            if len(keys[i]) == depth:
+                i += 1
+                continue
+            letter = keys[i][depth]
+            letters.append(letter)
+            i = bisect.bisect_left(keys, prefix + letter + _END, i, hi)
+        return letters
+
+    def _one_edit_matches(self, query, limit):
+        found = {}
+
+        def collect(prefix, dist):
+            for key in self.prefix_matches(prefix, limit):
+                if found.get(key, dist + 1) > dist:
+                    found[key] = dist
+
+        collect(query, 0)
+        for i in range(1, len(query)):
+            head = query[:i]
+            lo, hi = self._range(head)
+            if lo == hi:
+                # Every variant below starts with head
+                break
+            collect(head + query[i + 1:], 1)
+            if i + 1 < len(query) and query[i] != query[i + 1]:
+                collect(head + query[i + 1] + query[i] + query[i + 2:], 1)
+            for letter in self._children(head):
+                if letter != query[i]:
+                    collect(head + letter + query[i + 1:], 1)
+                collect(head + letter + query[i:], 1)
+        return sorted(((dist, key) for key, dist in found.items()), key=lambda item: (item[0], -self.freq[item[1]]))[:limit]
+
+    def fuzzy_matches(self, query, max_dist, limit=20):
+        """(distance, key) of keys with a prefix within max_dist edits of query.
+        Typos in the first letter are rare, so only keys sharing it are walked."""
+        if max_dist == 1:
+            return self._one_edit_matches(query, limit)
+        keys = self.keys
+        found = []
+        rows = [list(range(len(query) + 1))]
+        prev = ""
+        i, end = self._range(query[0])
+        while i < end:
+            key = keys[i]
+            common = 0
+            limit_common = min(len(prev), len(key), len(rows) - 1)
+            while common < limit_common and prev[common] == key[common]:
+                common += 1
+            del rows[common + 1:]
+            prev = key
+            next_i = i + 1
+            for depth in range(common, len(key)):
+                if depth:
+                    row = _next_row(rows[-1], key[depth], query, rows[-2], key[depth - 1])
+                else:
+                    row = _next_row(rows[-1], key[depth], query)
+                rows.append(row)
+                if row[-1] <= max_dist:
+                    # Every key under this prefix completes a close enough prefix
+                    _, hi = self._range(key[:depth + 1])
+                    found.extend((row[-1], k) for k in self._top(i, hi, limit))
+                    next_i = hi
+                    break
+                if min(row) > max_dist:
+                    # No key under this prefix can get close again
+                    _, next_i = self._range(key[:depth + 1])
+                    break
+            i = next_i
+        found.sort(key=lambda item: (item[0], -self.freq[item[1]]))
+        return found[:limit]
+
+    def suggest(self, text, limit=20):
+        """[(tag, images)] completing text: prefix matches by frequency, then
+        fuzzy matches when there are not enough of those"""
+        query = normalize_tag(text)
+        if not query:
+            return []
+        keys = self.prefix_matches(query, limit)
+        if len(keys) < limit and len(query) >= 3:
+            seen = set(keys)
+            for _, key in self.fuzzy_matches(query, FUZZY_DISTANCE, limit):
+                if key not in seen:
+                    keys.append(key)
+                    seen.add(key)
+                    if len(keys) >= limit:
+                        break
+        return [(self.tag_for(key), self.freq[key]) for key in keys]
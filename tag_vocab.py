@@ -0,0 +1,344 @@
+import os
+import csv
+import mmap
+import struct
+import threading
+from tag_cache import get_cache_dir
+
+# Local tag dictionary: categories, post counts, aliases and implications of
+# Danbooru-style tags, imported from CSV files and kept in one binary file in
+# the cache dir that is memory-mapped and searched in place.
+#
+# Layout (little endian):
+#   header   magic, version, tag count, key count, implication count, blob size
+#   tags     TAG_RECORD per tag: name offset/length in blob, category, post
+#            count, start/end of its implications
+#   keys     KEY_RECORD per spelling (tag names and aliases), sorted by the
+#            UTF-8 bytes of the normalized key: key offset/length, tag id
+#   implies  uint32 tag ids
+#   blob     UTF-8 text of names and keys
+
+VOCAB_FILE = "vocabulary.bin"
+VOCAB_MAGIC = b"TVOC"
+VOCAB_VERSION = 1
+HEADER = struct.Struct("<4sIIIII")
+TAG_RECORD = struct.Struct("<IHBxIII")
+KEY_RECORD = struct.Struct("<IHxxI")
+IMPLIES = struct.Struct("<I")
+# Resolved spellings kept per vocabulary so bulk edits don't search again
+MEMO_SIZE = 200000
+
+CATEGORY_NAMES = {0: "general", 1: "artist", 3: "copyright", 4: "character", 5: "meta", 9: "rating"}
+
+
+class VocabularyError(Exception):
+    pass
+
+
+def vocab_key(tag):
+    """Lookup key: case, underscores and repeated spaces don't matter"""
+    return "_".join(tag.lower().replace("_", " ").split())
+
+
+def vocabulary_path():
+    return os.path.join(get_cache_dir(), VOCAB_FILE)
+
+
+def _rows(path):
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.reader(f):
+            if row and any(cell.strip() for cell in row):
+                yield [cell.strip() for cell in row]
+
+
+def read_tags_csv(path):
+    """Tags from a tagger's selected_tags.csv (tag_id,name,category,count), a
+    CSV with a header naming name/category/count/aliases columns, or a
+    headerless autocomplete list (name,category,count,"alias,alias").
+    Returns ({name: (category, count)}, [(alias, name)])."""
+    tags = {}
+    aliases = []
+    rows = _rows(path)
+    first = next(rows, None)
+    if first is None:
+        return tags, aliases
+    header = [cell.lower() for cell in first]
+    if "name" in header:
+        columns = {name: header.index(name) for name in ("name", "category", "count", "aliases") if name in header}
+        body = rows
+    else:
+        columns = {"name": 0, "category": 1, "count": 2, "aliases": 3}
+        body = _chain([first], rows)
+
+    def cell(row, name):
+        index = columns.get(name)
+        return row[index] if index is not None and index < len(row) else ""
+
+    for row in body:
+        name = cell(row, "name")
+        if not name:
+            continue
+        try:
+            category = int(cell(row, "category") or 0)
+            count = int(float(cell(row, "count") or 0))
+        except ValueError:
+            raise VocabularyError(f"{os.path.basename(path)}: bad row {row}")
+        tags[name] = (category, count)
+        for alias in cell(row, "aliases").split(","):
+            alias = alias.strip()
+            if alias:
+                aliases.append((alias, name))
+    return tags, aliases
+
+
+def read_pairs_csv(path):
+    """(antecedent, consequent) pairs from a Danbooru alias or implication
+    export (antecedent_name,consequent_name columns) or a two column CSV"""
+    pairs = []
+    rows = _rows(path)
+    first = next(rows, None)
+    if first is None:
+        return pairs
+    header = [cell.lower() for cell in first]
+    if "antecedent_name" in header and "consequent_name" in header:
+        a, c = header.index("antecedent_name"), header.index("consequent_name")
+        status = header.index("status") if "status" in header else None
+        for row in rows:
+            if status is not None and status < len(row) and row[status] not in ("", "active"):
+                continue
+            if max(a, c) < len(row) and row[a] and row[c]:
+                pairs.append((row[a], row[c]))
+        return pairs
+    for row in _chain([first], rows):
+        if len(row) >= 2 and row[0] and row[1]:
+            pairs.append((row[0], row[1]))
+    return pairs
+
+
+def _chain(head, rest):
+    yield from head
+    yield from rest
+
+
+def build_vocabulary(tags, aliases=(), implications=(), path=None):
+    """Write the binary dictionary for tags {name: (category, count)}, alias
+    pairs (alias, tag) and implication pairs (tag, implied tag)"""
+    path = path or vocabulary_path()
+    names = list(tags)
+    ids = {vocab_key(name): i for i, name in enumerate(names)}
+
+    # Alias chains (a -> b -> c) resolve to the final tag
+    alias_map = {vocab_key(alias): vocab_key(target) for alias, target in aliases}
+    keys = dict(ids)
+    for alias in alias_map:
+        target = alias_map[alias]
+        seen = {alias}
+        while target in alias_map and target not in seen:
+            seen.add(target)
+            target = alias_map[target]
+        if alias not in ids and target in ids:
+            keys[alias] = ids[target]
+
+    implied = [[] for _ in names]
+    for tag, implied_tag in implications:
+        tag_id = keys.get(vocab_key(tag))
+        implied_id = keys.get(vocab_key(implied_tag))
+        if tag_id is not None and implied_id is not None and implied_id != tag_id and implied_id not in implied[tag_id]:
+            implied[tag_id].append(implied_id)
+
+    blob = bytearray()
+    tag_records = []
+    implies = []
+    for i, name in enumerate(names):
+        encoded = name.encode("utf-8")
+        category, count = tags[name]
+        start = len(implies)
+        implies.extend(implied[i])
+        tag_records.append(TAG_RECORD.pack(len(blob), len(encoded), category & 0xFF, max(0, count), start, len(implies)))
+        blob += encoded
+    key_records = []
+    for key in sorted(keys, key=lambda k: k.encode("utf-8")):
+        encoded = key.encode("utf-8")
+        key_records.append(KEY_RECORD.pack(len(blob), len(encoded), keys[key]))
+        blob += encoded
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(VOCAB_MAGIC, VOCAB_VERSION, len(tag_records), len(key_records), len(implies), len(blob)))
+        f.write(b"".join(tag_records))
+        f.write(b"".join(key_records))
+        f.write(b"".join(IMPLIES.pack(i) for i in implies))
+        f.write(blob)
+    os.replace(tmp_path, path)
+    return len(tag_records), len(key_records) - len(tag_records), len(implies)
+
+
+def import_vocabulary(tags_csv, aliases_csv=None, implications_csv=None, path=None):
+    """Build the dictionary from CSV files; returns (tags, aliases, implications)"""
+    tags, aliases = read_tags_csv(tags_csv)
+    if not tags:
+        raise VocabularyError(f"No tags found in {tags_csv}")
+    if aliases_csv:
+        aliases += read_pairs_csv(aliases_csv)
+    implications = read_pairs_csv(implications_csv) if implications_csv else []
+    # The mapped file can't be replaced on Windows while it is open
+    reset_vocabulary()
+    return build_vocabulary(tags, aliases, implications, path)
+
+
+class TagVocabulary:
+    """Read-only view of the binary dictionary, searched in the mapped file"""
+
+    def __init__(self, path=None):
+        self.path = path or vocabulary_path()
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, self.tag_count, self.key_count, implies_count, blob_size = HEADER.unpack_from(self._mm, 0)
+        except struct.error:
+            raise VocabularyError("Tag dictionary is truncated")
+        if magic != VOCAB_MAGIC or version != VOCAB_VERSION:
+            raise VocabularyError("Tag dictionary has an unknown format, import it again")
+        self._tags_at = HEADER.size
+        self._keys_at = self._tags_at + self.tag_count * TAG_RECORD.size
+        self._implies_at = self._keys_at + self.key_count * KEY_RECORD.size
+        self._blob_at = self._implies_at + implies_count * IMPLIES.size
+        if self._blob_at + blob_size > len(self._mm):
+            raise VocabularyError("Tag dictionary is truncated")
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def _text(self, offset, length):
+        start = self._blob_at + offset
+        return self._mm[start:start + length]
+
+    def _find(self, key):
+        """Tag id of a normalized key, or None"""
+        target = key.encode("utf-8")
+        lo, hi = 0, self.key_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset, length, tag_id = KEY_RECORD.unpack_from(self._mm, self._keys_at + mid * KEY_RECORD.size)
+            probe = self._text(offset, length)
+            if probe < target:
+                lo = mid + 1
+            elif probe > target:
+                hi = mid
+            else:
+                return tag_id
+        return None
+
+    def _record(self, tag_id):
+        return TAG_RECORD.unpack_from(self._mm, self._tags_at + tag_id * TAG_RECORD.size)
+
+    def name(self, tag_id):
+        offset, length, _, _, _, _ = self._record(tag_id)
+        return self._text(offset, length).decode("utf-8")
+
+    def tag_id(self, tag):
+        key = vocab_key(tag)
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+        tag_id = self._find(key)
+        with self._lock:
+            if len(self._memo) >= MEMO_SIZE:
+                self._memo.clear()
+            self._memo[key] = tag_id
+        return tag_id
+
+    def lookup(self, tag):
+        """(canonical name, category, post count) of tag or one of its aliases, or None"""
+        tag_id = self.tag_id(tag)
+        if tag_id is None:
+            return None
+        offset, length, category, count, _, _ = self._record(tag_id)
+        return self._text(offset, length).decode("utf-8"), category, count
+
+    def canonical(self, tag):
+        """The tag an alias stands for, or tag itself"""
+        tag_id = self.tag_id(tag)
+        return tag if tag_id is None else self.name(tag_id)
+
+    def implications(self, tag):
+        """Every tag implied by tag, following chains of implications"""
+        start_id = self.tag_id(tag)
+        if start_id is None:
+            return []
+        result = []
+        seen = {start_id}
+        todo = [start_id]
+        while todo:
+            _, _, _, _, start, end = self._record(todo.pop())
+            for i in range(start, end):
+                (implied_id,) = IMPLIES.unpack_from(self._mm, self._implies_at + i * IMPLIES.size)
+                if implied_id not in seen:
+                    seen.add(implied_id)
+                    todo.append(implied_id)
+                    result.append(self.name(implied_id))
+        return result
+
+    def canonicalize(self, tags):
+        """tags with aliases replaced by their tag and duplicates dropped.
+
+        Tags that are already canonical keep their spelling. Replacements use
+        spaces instead of underscores when the other tags of the list do, so
+        captions keep their style; unknown tags are left alone.
+        """
+        spaced = sum(1 for t in tags if " " in t and "_" not in t)
+        underscored = sum(1 for t in tags if "_" in t)
+        use_spaces = spaced > underscored
+        result = []
+        seen = set()
+        for tag in tags:
+            tag_id = self.tag_id(tag)
+            if tag_id is not None:
+                name = self.name(tag_id)
+                if vocab_key(name) != vocab_key(tag):
+                    tag = name.replace("_", " ") if use_spaces else name
+            key = vocab_key(tag)
+            if key not in seen:
+                seen.add(key)
+                result.append(tag)
+        return result
+
+    def close(self):
+        self._mm.close()
+
+
+_vocabulary = None
+_vocabulary_lock = threading.Lock()
+
+
+def get_vocabulary():
+    """The imported tag dictionary, or None when there is none"""
+    global _vocabulary
+    with _vocabulary_lock:
+        if _vocabulary is None and os.path.exists(vocabulary_path()):
+            try:
+                _vocabulary = TagVocabulary()
+            except (OSError, ValueError, VocabularyError) as e:
+                print(f"Tag dictionary unavailable: {e}")
+        return _vocabulary
+
+
+def reset_vocabulary():
+    """Close the loaded dictionary so the next get_vocabulary() maps the file again"""
+    global _vocabulary
+    with _vocabulary_lock:
+        if _vocabulary is not None:
+            _vocabulary.close()
+        _vocabulary = None
+
+
+def ensure_vocabulary(tags_csv):
+    """Import a tagger's selected_tags.csv when no dictionary exists yet"""
+    if os.path.exists(vocabulary_path()) or not tags_csv or not os.path.exists(tags_csv):
+        return False
+    try:
+        import_vocabulary(tags_csv)
+    except (OSError, VocabularyError) as e:
+        print(f"Could not import tag dictionary: {e}")
+        return False
+    return True
@@ -0,0 +1,61 @@
+import os
+import hashlib
+from PIL import Image
+from tag_cache import get_cache_dir, stat_key
+
+THUMBNAIL_SIZE = 160
+
+
+def thumbnail_key(image_path, size):
+    """Cache key of an image's thumbnail; changes when the file is modified"""
+    mtime_ns, file_size = stat_key(image_path)
+    raw = f"{os.path.abspath(image_path)}|{mtime_ns}|{file_size}|{size}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class ThumbnailCache:
+    """Thumbnails on disk under the user cache dir.
+
+    Files are named by a hash of the image path, mtime, size and thumbnail
+    size, so a modified image simply gets a new entry. Opaque images are
+    stored as JPEG and images with transparency as PNG. Safe to use from
+    several threads; a thumbnail is written to a temp file and renamed into
+    place.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.root = os.path.join(cache_dir or get_cache_dir(), "thumbs")
+
+    def _paths(self, key):
+        folder = os.path.join(self.root, key[:2])
+        return os.path.join(folder, key + ".jpg"), os.path.join(folder, key + ".png")
+
+    def find(self, image_path, size=THUMBNAIL_SIZE):
+        """Path of an existing thumbnail for image_path, or None"""
+        for path in self._paths(thumbnail_key(image_path, size)):
+            if os.path.exists(path):
+                return path
+        return None
+
+    def get(self, image_path, size=THUMBNAIL_SIZE):
+        """Path of the thumbnail file for image_path, created if needed"""
+        return self.find(image_path, size) or self._create(image_path, size, thumbnail_key(image_path, size))
+
+    def _create(self, image_path, size, key):
+        jpg_path, png_path = self._paths(key)
+        with Image.open(image_path) as image:
+            if image.format == "JPEG":
+                image.draft("RGB", (size * 2, size * 2))
+            has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+            image = image.convert("RGBA" if has_alpha else "RGB")
+        image.thumbnail((size, size), Image.Resampling.BICUBIC)
+
+        path = png_path if has_alpha else jpg_path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{id(image)}.tmp"
+        if has_alpha:
+            image.save(tmp_path, "PNG")
+        else:
+            image.save(tmp_path, "JPEG", quality=85)
+        os.replace(tmp_path, path)
+        return path
@@ -0,0 +1,198 @@
+import os
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtCore import Qt, QSize, QObject, QAbstractListModel, QModelIndex, pyqtSignal
+from PyQt6.QtGui import QImage, QPixmap, QColor
+from PyQt6.QtWidgets import QListView, QAbstractItemView
+from thumbnail_cache import ThumbnailCache, THUMBNAIL_SIZE
+
+THUMBNAIL_WORKERS = min(4, os.cpu_count() or 2)
+# Requests beyond this many are for rows that were scrolled past long ago
+MAX_PENDING_THUMBNAILS = 256
+PIXMAP_CACHE_BYTES = 96 * 1024 * 1024
+
+
+class ThumbnailSignals(QObject):
+    loaded = pyqtSignal(str, QImage)
+
+
+class ThumbnailModel(QAbstractListModel):
+    """List model of image paths whose decoration is a lazily loaded thumbnail.
+
+    The view only asks for the rows it paints, so only those are requested.
+    Requests go to a small thread pool newest first, which loads the thumbnail
+    from the disk cache (creating it if needed) into a QImage; the GUI thread
+    turns it into a QPixmap kept in an LRU bounded by PIXMAP_CACHE_BYTES.
+    """
+
+    def __init__(self, thumb_size=THUMBNAIL_SIZE, parent=None):
+        super().__init__(parent)
+        self.thumb_size = thumb_size
+        self.image_paths = []
+        self.rows = {}
+        self._source = None
+        self.disk_cache = ThumbnailCache()
+        self.pixmaps = OrderedDict()
+        self.pixmap_bytes = 0
+        self.failed = set()
+
+        self.placeholder = QPixmap(thumb_size, thumb_size)
+        self.placeholder.fill(QColor("#2a2a2a"))
+
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()
+        self._in_flight = set()
+        self._runners = 0
+        self._pool = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+        self.signals = ThumbnailSignals()
+        self.signals.loaded.connect(self.on_loaded)
+
+    def set_image_paths(self, image_paths):
+        """Show image_paths; appended paths become inserted rows, anything else resets"""
+        if image_paths is self._source and len(image_paths) == len(self.image_paths):
+            return
+        old = self.image_paths
+        self._source = image_paths
+        if len(image_paths) > len(old) and image_paths[:len(old)] == old:
+            self.beginInsertRows(QModelIndex(), len(old), len(image_paths) - 1)
+            self.image_paths = list(image_paths)
+            for row in range(len(old), len(image_paths)):
+                self.rows[image_paths[row]] = row
+            self.endInsertRows()
+        elif image_paths != old:
+            self.beginResetModel()
+            self.image_paths = list(image_paths)
+            self.rows = {p: i for i, p in enumerate(self.image_paths)}
+            with self._lock:
+                self._pending.clear()
+            self.endResetModel()
+
+    def invalidate(self, image_paths):
+        """Drop cached thumbnails of images that changed on disk"""
+        for path in image_paths:
+            pixmap = self.pixmaps.pop(path, None)
+            if pixmap is not None:
+                self.pixmap_bytes -= self._pixmap_size(pixmap)
+            self.failed.discard(path)
+            row = self.rows.get(path)
+            if row is not None:
+                index = self.index(row)
+                self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.image_paths)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.image_paths):
+            return None
+        path = self.image_paths[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return os.path.basename(path)
+        if role == Qt.ItemDataRole.DecorationRole:
+            pixmap = self.pixmaps.get(path)
+            if pixmap is not None:
+                self.pixmaps.move_to_end(path)
+                return pixmap
+            if path not in self.failed:
+                self.request(path)
+            return self.placeholder
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return path
+        if role == Qt.ItemDataRole.UserRole:
+            return path
+        return None
+
+    def request(self, path):
+        with self._lock:
+            if path in self._in_flight:
+                return
+            self._pending[path] = None
+            self._pending.move_to_end(path)
+            while len(self._pending) > MAX_PENDING_THUMBNAILS:
+                self._pending.popitem(last=False)
+            if self._runners < THUMBNAIL_WORKERS:
+                self._runners += 1
+                self._pool.submit(self._drain)
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._runners -= 1
+                    return
+                # Newest request first: those are the rows on screen now
+                path, _ = self._pending.popitem(last=True)
+                self._in_flight.add(path)
+            image = QImage()
+            try:
+                image = QImage(self.disk_cache.get(path, self.thumb_size))
+            except Exception:
+                traceback.print_exc()
+            finally:
+                with self._lock:
+                    self._in_flight.discard(path)
+            self.signals.loaded.emit(path, image)
+
+    def on_loaded(self, path, image):
+        row = self.rows.get(path)
+        if image.isNull():
+            self.failed.add(path)
+            return
+        pixmap = QPixmap.fromImage(image)
+        old = self.pixmaps.pop(path, None)
+        if old is not None:
+            self.pixmap_bytes -= self._pixmap_size(old)
+        self.pixmaps[path] = pixmap
+        self.pixmap_bytes += self._pixmap_size(pixmap)
+        while self.pixmap_bytes > PIXMAP_CACHE_BYTES and len(self.pixmaps) > 1:
+            _, evicted = self.pixmaps.popitem(last=False)
+            self.pixmap_bytes -= self._pixmap_size(evicted)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+    def _pixmap_size(self, pixmap):
+        return pixmap.width() * pixmap.height() * max(1, pixmap.depth() // 8)
+
+    def shutdown(self):
+        with self._lock:
+            self._pending.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ThumbnailGrid(QListView):
+    image_selected = pyqtSignal(int)
+    image_opened = pyqtSignal(int)
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        size = model.thumb_size
+        self.setModel(model)
+        self.setViewMode(QListView.ViewMode.IconMode)
+        self.setIconSize(QSize(size, size))
+        self.setGridSize(QSize(size + 16, size + 32))
+        # Every cell has the same size, so the view can lay out 100k rows without asking for them
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QListView.LayoutMode.Batched)
+        self.setBatchSize(500)
+        self.setResizeMode(QListView.ResizeMode.Adjust)
+        self.setMovement(QListView.Movement.Static)
+        self.setWordWrap(False)
+        self.setTextElideMode(Qt.TextElideMode.ElideMiddle)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setStyleSheet("QListView { background-color: #111; border: 1px solid #333; border-radius: 8px; }")
+        self.selectionModel().currentRowChanged.connect(lambda current, _: self.image_selected.emit(current.row()))
+        self.activated.connect(lambda index: self.image_opened.emit(index.row()))
+
+    def select_row(self, row):
+        if row < 0 or row >= self.model().rowCount():
+            return
+        index = self.model().index(row)
+        if self.currentIndex() != index:
+            self.blockSignals(True)
+            self.setCurrentIndex(index)
+            self.blockSignals(False)
+        self.scrollTo(index)
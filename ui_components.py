@@ -1,5 +1,5 @@
 # pyre-ignore-all-errors[21]
-from PyQt6.QtWidgets import QLayout, QLayoutItem, QSizePolicy, QPushButton, QLabel, QStyle, QWidget
+from PyQt6.QtWidgets import QLayout, QLayoutItem, QWidgetItem, QSizePolicy, QPushButton, QLabel, QStyle, QWidget
 from PyQt6.QtCore import Qt, QSize, QPoint, QRect, pyqtSignal
 
 class FlowLayout(QLayout):
@@ -18,6 +18,21 @@ class FlowLayout(QLayout):
     def addItem(self, item):
         self.itemList.append(item)
 
+    def set_widgets(self, widgets):
+        """Replace the layout's items with widgets in one go, keeping the
+        items of widgets that stay, and relayout once. Widgets that are
+        dropped are left to the caller (hidden or deleted)."""
+        items = {id(item.widget()): item for item in self.itemList if item.widget()}
+        new_items = []
+        for widget in widgets:
+            item = items.get(id(widget))
+            if item is None:
+                self.addChildWidget(widget)
+                item = QWidgetItem(widget)
+            new_items.append(item)
+        self.itemList = new_items
+        self.invalidate()
+
     def horizontalSpacing(self):
         if self.m_hSpace >= 0:
             return self.m_hSpace
@@ -73,29 +88,33 @@ class FlowLayout(QLayout):
         x = rect.x()
         y = rect.y()
         lineHeight = 0
+        # The layout's own spacing is the same for every item, so look it up once per pass
+        hSpace = self.horizontalSpacing()
+        vSpace = self.verticalSpacing()
 
         for item in self.itemList:
             wid = item.widget()
-            spaceX = self.horizontalSpacing()
+            spaceX = hSpace
             if spaceX == -1:
                 spaceX = wid.style().layoutSpacing(QSizePolicy.ControlType.PushButton, QSizePolicy.ControlType.PushButton, Qt.Orientation.Horizontal) if wid else 0
                 
-            spaceY = self.verticalSpacing()
+            spaceY = vSpace
             if spaceY == -1:
                 spaceY = wid.style().layoutSpacing(QSizePolicy.ControlType.PushButton, QSizePolicy.ControlType.PushButton, Qt.Orientation.Vertical) if wid else 0
 
-            nextX = x + item.sizeHint().width() + spaceX
+            hint = item.sizeHint()
+            nextX = x + hint.width() + spaceX
             if nextX - spaceX > rect.right() and lineHeight > 0:
                 x = rect.x()
                 y = y + lineHeight + spaceY
-                nextX = x + item.sizeHint().width() + spaceX
+                nextX = x + hint.width() + spaceX
                 lineHeight = 0
 
             if not testOnly:
-                item.setGeometry(QRect(QPoint(x, y), item.sizeHint()))
+                item.setGeometry(QRect(QPoint(x, y), hint))
 
             x = nextX
-            lineHeight = max(lineHeight, item.sizeHint().height())
+            lineHeight = max(lineHeight, hint.height())
 
         return y + lineHeight - rect.y()
 
@@ -108,6 +127,25 @@ class FlowLayout(QLayout):
         else:
             return parent.spacing()
 
+# Shared by every TagButton through the window stylesheet; a stylesheet per
+# button made Qt parse and polish it again for each of hundreds of tags
+TAG_BUTTON_STYLE = """
+    QPushButton#tagButton { 
+        border-radius: 12px; 
+        background-color: #3e3e42; 
+        color: #cccccc; 
+        padding: 4px 12px; 
+        font-size: 11px;
+        font-weight: normal;
+        border: 1px solid #444;
+    } 
+    QPushButton#tagButton:hover { 
+        background-color: #e74c3c; 
+        color: white;
+        border: 1px solid #c0392b;
+    }
+"""
+
 class TagButton(QPushButton):
     deleted = pyqtSignal(str)
     edit_requested = pyqtSignal(str)
@@ -115,28 +153,21 @@ class TagButton(QPushButton):
     def __init__(self, tag_text, parent=None):
         super().__init__(tag_text, parent) # type: ignore
         self.tag_text = tag_text
-        self.setStyleSheet("""
-            QPushButton { 
-                border-radius: 12px; 
-                background-color: #3e3e42; 
-                color: #cccccc; 
-                padding: 4px 12px; 
-                font-size: 11px;
-                border: 1px solid #444;
-            } 
-            QPushButton:hover { 
-                background-color: #e74c3c; 
-                color: white;
-                border: 1px solid #c0392b;
-            }
-        """)
+        self.setObjectName("tagButton")
         self.setCursor(Qt.CursorShape.PointingHandCursor)
         self.setToolTip("Click to remove | Right-click to edit")
 
+    def set_tag(self, tag_text):
+        """Reuse the button for another tag"""
+        self.tag_text = tag_text
+        self.setText(tag_text)
+
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
+            # The panel hides the button for reuse once the tag is removed
             self.deleted.emit(self.tag_text)
-            self.deleteLater()
+            event.accept()
+            return
         elif event.button() == Qt.MouseButton.RightButton:
             self.edit_requested.emit(self.tag_text)
         super().mousePressEvent(event)
@@ -162,6 +193,11 @@ class FlowContainer(QWidget):
         super().setLayout(layout)
         self._layout = layout
 
+    def relayout(self):
+        """Resize to the layout's height after its items changed"""
+        if self._layout:
+            self.setMinimumHeight(self._layout.heightForWidth(self.width()))
+
     def resizeEvent(self, event):
         super().resizeEvent(event)
         if self._layout:
@@ -2,15 +2,29 @@ import sys
 import os
 import traceback
 from PyQt6.QtGui import QPixmap, QAction, QIntValidator, QGuiApplication
-from PyQt6.QtCore import Qt, QSize, QStringListModel
+from PyQt6.QtCore import Qt, QSize, QStringListModel, QTimer, QSettings, pyqtSignal
 from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, 
     QLabel, QSplitter, QScrollArea, QLineEdit, QFileDialog, QMessageBox, 
-    QMenuBar, QInputDialog, QSizePolicy, QComboBox, QProgressBar
+    QMenuBar, QInputDialog, QSizePolicy, QComboBox, QProgressBar, QSpinBox, QSlider,
+    QStackedWidget, QCompleter
 )
-from ui_components import FlowLayout, TagButton, ClickableImageLabel, FlowContainer
-from file_manager import FileManager
+from ui_components import FlowLayout, TagButton, ClickableImageLabel, FlowContainer, TAG_BUTTON_STYLE
+from file_manager import FileManager, SUPPORTED_IMAGE_EXTS
+from folder_watcher import FolderWatcher
+from folder_loader import FolderLoaderWorker
+from bulk_edit import pending_journal, rollback_journal, discard_journal
+from bulk_edit_worker import BulkEditWorker
+from batch_job import BatchJob
 from ai_tagger import PixAITaggerWorker, Florence2Worker, BatchPixAITaggerWorker, BatchFlorence2Worker
+from florence_model import FLORENCE_BATCH_SIZE
+from score_store import get_score_store, RethresholdEdit
+from thumbnail_view import ThumbnailModel, ThumbnailGrid
+from image_cache import ImageCache, neighbor_paths
+from tag_store import append_missing
+from tag_vocab import get_vocabulary, import_vocabulary, VocabularyError
+from stats_panel import StatsDialog
+from dedup_worker import DuplicateScanWorker
 
 # Modern Dark Theme Colors
 COLORS = {
@@ -29,12 +43,38 @@ COLORS = {
 }
 
 class MainWindow(QMainWindow):
+    # Images whose tags the batch workers' tag store wrote, emitted from its thread
+    tags_stored = pyqtSignal(list)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("PixAI Tag Editor Premium")
         self.resize(1200, 800)
         self.file_manager = FileManager()
+        self.settings = QSettings("tag_editor", "tag_editor")
         self.tag_clipboard = []
+        self.displayed_image_path = None
+        self.pending_select_path = None
+        self.loader_workers = set()
+        self.folder_watcher = FolderWatcher(self.file_manager, self)
+        self.folder_watcher.changes_applied.connect(self.on_folder_changed)
+        self.tags_stored.connect(self.on_tags_stored)
+        self.file_manager.tag_store().add_listener(self.tags_stored.emit)
+        
+        # Flushes interactive edits once they have been idle for the write-behind delay
+        self.write_timer = QTimer(self)
+        self.write_timer.setInterval(250)
+        self.write_timer.timeout.connect(lambda: self.flush_pending_writes(due_only=True))
+
+        # Decoded images for the viewer; neighbours along the filtered order are decoded ahead
+        self.image_cache = ImageCache(parent=self)
+        self.image_cache.image_ready.connect(self.on_image_ready)
+        self.image_cache.image_failed.connect(self.on_image_failed)
+        # Window resizes rescale from the cached image once they settle
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(60)
+        self.resize_timer.timeout.connect(self.load_image_pixmap)
         
         self.setup_ui()
         self.apply_dark_theme()
@@ -58,7 +98,7 @@ class MainWindow(QMainWindow):
             QPushButton:hover {{
                 background-color: {COLORS['primary']};
             }}
-            QLineEdit, QComboBox {{
+            QLineEdit, QComboBox, QSpinBox {{
                 background-color: {COLORS['inactive']};
                 border: 1px solid #333;
                 border-radius: 3px;
@@ -84,7 +124,7 @@ class MainWindow(QMainWindow):
             QProgressBar::chunk {{
                 background-color: {COLORS['primary']};
             }}
-        """)
+        """ + TAG_BUTTON_STYLE)
 
     def setup_ui(self):
         central_widget = QWidget()
@@ -104,7 +144,7 @@ class MainWindow(QMainWindow):
         search_layout = QHBoxLayout()
         search_layout.addWidget(QLabel("🔍 Filter:"))
         self.search_input = QLineEdit()
-        self.search_input.setPlaceholderText("Search by tag...")
+        self.search_input.setPlaceholderText("Search: tag, a AND (b OR c*), NOT d, *hair*, tags<10")
         self.search_input.textChanged.connect(self.filter_images)
         search_layout.addWidget(self.search_input)
         left_layout.addLayout(search_layout)
@@ -112,6 +152,16 @@ class MainWindow(QMainWindow):
         self.image_label = ClickableImageLabel()
         self.image_label.setMinimumSize(400, 400)
         self.image_label.setStyleSheet("background-color: #111; border: 1px solid #333; border-radius: 8px;")
+
+        # The grid shows the filtered images; only the rows on screen get thumbnails
+        self.thumbnail_model = ThumbnailModel(parent=self)
+        self.thumbnail_grid = ThumbnailGrid(self.thumbnail_model)
+        self.thumbnail_grid.image_selected.connect(self.on_grid_selected)
+        self.thumbnail_grid.image_opened.connect(self.on_grid_opened)
+
+        self.view_stack = QStackedWidget()
+        self.view_stack.addWidget(self.image_label)
+        self.view_stack.addWidget(self.thumbnail_grid)
         
         # Navigation & Info Header
         info_layout = QHBoxLayout()
@@ -146,7 +196,7 @@ class MainWindow(QMainWindow):
         nav_layout.addWidget(self.next_btn)
         
         left_layout.addLayout(info_layout)
-        left_layout.addWidget(self.image_label, stretch=1)
+        left_layout.addWidget(self.view_stack, stretch=1)
         left_layout.addLayout(nav_layout)
         
         # Right Side (Tags Editor)
@@ -166,6 +216,9 @@ class MainWindow(QMainWindow):
         self.tags_container.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.MinimumExpanding)
         self.tags_layout = FlowLayout()
         self.tags_container.setLayout(self.tags_layout)
+        # Buttons currently shown, in tag order, and hidden ones kept for reuse
+        self.tag_buttons = []
+        self.spare_tag_buttons = []
         self.scroll_area.setWidget(self.tags_container)
         right_layout.addWidget(self.scroll_area, stretch=1)
         
@@ -184,6 +237,25 @@ class MainWindow(QMainWindow):
         ai_single_layout.addWidget(self.florence_btn)
         ai_layout.addLayout(ai_single_layout)
         
+        # PixAI threshold; re-applies stored scores to the folder without running the model
+        threshold_layout = QHBoxLayout()
+        threshold_layout.addWidget(QLabel("Threshold:"))
+        self.threshold_slider = QSlider(Qt.Orientation.Horizontal)
+        self.threshold_slider.setRange(5, 95)
+        self.threshold_slider.setValue(35)
+        self.threshold_slider.valueChanged.connect(self.on_threshold_changed)
+        threshold_layout.addWidget(self.threshold_slider, stretch=1)
+        self.threshold_value_label = QLabel("0.35")
+        threshold_layout.addWidget(self.threshold_value_label)
+        self.threshold_delta_label = QLabel()
+        threshold_layout.addWidget(self.threshold_delta_label)
+        self.apply_threshold_btn = QPushButton("Apply to Folder")
+        self.apply_threshold_btn.setEnabled(False)
+        self.apply_threshold_btn.setToolTip("Re-derive PixAI tags for all tagged images from their stored scores")
+        self.apply_threshold_btn.clicked.connect(self.apply_threshold)
+        threshold_layout.addWidget(self.apply_threshold_btn)
+        ai_layout.addLayout(threshold_layout)
+        
         # Florence-2 Task Selection
         flo_task_layout = QHBoxLayout()
         flo_task_layout.addWidget(QLabel("Florence-2 Task:"))
@@ -196,6 +268,12 @@ class MainWindow(QMainWindow):
             "<REGION_PROPOSAL>"
         ])
         flo_task_layout.addWidget(self.flo_task_combo)
+        flo_task_layout.addWidget(QLabel("Batch:"))
+        self.flo_batch_spin = QSpinBox()
+        self.flo_batch_spin.setRange(1, 64)
+        self.flo_batch_spin.setValue(FLORENCE_BATCH_SIZE)
+        self.flo_batch_spin.setToolTip("Images per Florence-2 generate call (lowered automatically if the GPU runs out of memory)")
+        flo_task_layout.addWidget(self.flo_batch_spin)
         ai_layout.addLayout(flo_task_layout)
         
         # Batch AI Tagging
@@ -234,6 +312,14 @@ class MainWindow(QMainWindow):
         self.tag_input = QLineEdit()
         self.tag_input.setPlaceholderText("Enter new tag...")
         self.tag_input.returnPressed.connect(self.add_tag)
+        # Suggestions are ranked (and fuzzy matched) by the folder index, so the
+        # completer shows the model as is instead of filtering it again
+        self.tag_completer_model = QStringListModel(self)
+        self.tag_completer = QCompleter(self.tag_completer_model, self)
+        self.tag_completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.tag_completer.setMaxVisibleItems(12)
+        self.tag_input.setCompleter(self.tag_completer)
+        self.tag_input.textEdited.connect(self.update_tag_suggestions)
         self.add_btn = QPushButton("Add Tag")
         self.add_btn.clicked.connect(self.add_tag)
         input_layout.addWidget(self.tag_input)
@@ -278,6 +364,11 @@ class MainWindow(QMainWindow):
         self.splitter.addWidget(self.right_widget)
         self.splitter.setSizes([750, 450])
 
+        self.pending_writes_label = QLabel()
+        self.pending_writes_label.setStyleSheet(f"color: {COLORS['orange']};")
+        self.pending_writes_label.setVisible(False)
+        self.statusBar().addPermanentWidget(self.pending_writes_label)
+
     def setup_menu(self):
         menubar = self.menuBar()
         file_menu = menubar.addMenu("File")
@@ -286,21 +377,275 @@ class MainWindow(QMainWindow):
         open_action.triggered.connect(self.open_folder)
         file_menu.addAction(open_action)
 
+        self.recursive_action = QAction("Include Subfolders", self)
+        self.recursive_action.setCheckable(True)
+        self.recursive_action.toggled.connect(self.toggle_recursive)
+        file_menu.addAction(self.recursive_action)
+
+        import_vocab_action = QAction("Import Tag Dictionary...", self)
+        import_vocab_action.triggered.connect(self.import_tag_dictionary)
+        file_menu.addAction(import_vocab_action)
+
+        edit_menu = menubar.addMenu("Edit")
+        self.undo_action = QAction("Undo Bulk Edit", self)
+        self.undo_action.setShortcut("Ctrl+Z")
+        self.undo_action.triggered.connect(self.undo_bulk_edit)
+        edit_menu.addAction(self.undo_action)
+        self.redo_action = QAction("Redo Bulk Edit", self)
+        self.redo_action.setShortcut("Ctrl+Shift+Z")
+        self.redo_action.triggered.connect(self.redo_bulk_edit)
+        edit_menu.addAction(self.redo_action)
+        self.update_undo_actions()
+
+        edit_menu.addSeparator()
+        self.canonicalize_action = QAction("Replace Tag Aliases on Save", self)
+        self.canonicalize_action.setCheckable(True)
+        # Off until the user turns it on; the choice is kept across sessions
+        self.canonicalize_action.setChecked(self.settings.value("canonicalize_tags", False, type=bool))
+        self.canonicalize_action.triggered.connect(self.toggle_canonicalize)
+        edit_menu.addAction(self.canonicalize_action)
+        self.refresh_vocabulary()
+
+        self.skip_duplicates_action = QAction("Skip Duplicates in Batch AI", self)
+        self.skip_duplicates_action.setCheckable(True)
+        self.skip_duplicates_action.setToolTip("Batch tagging and captioning run on one image of each group of near-duplicates")
+        edit_menu.addAction(self.skip_duplicates_action)
+
+        view_menu = menubar.addMenu("View")
+        self.grid_action = QAction("Thumbnail Grid", self)
+        self.grid_action.setCheckable(True)
+        self.grid_action.setShortcut("Ctrl+G")
+        self.grid_action.toggled.connect(self.toggle_grid)
+        view_menu.addAction(self.grid_action)
+
+        stats_action = QAction("Tag Statistics...", self)
+        stats_action.setShortcut("Ctrl+I")
+        stats_action.triggered.connect(self.show_tag_statistics)
+        view_menu.addAction(stats_action)
+        self.stats_dialog = None
+
+        view_menu.addSeparator()
+        self.find_duplicates_action = QAction("Find Duplicates", self)
+        self.find_duplicates_action.triggered.connect(self.find_duplicates)
+        view_menu.addAction(self.find_duplicates_action)
+        # triggered only fires for the user, so resetting it on folder loads doesn't refilter
+        self.duplicates_action = QAction("Show Duplicates Only", self)
+        self.duplicates_action.setCheckable(True)
+        self.duplicates_action.setEnabled(False)
+        self.duplicates_action.triggered.connect(self.toggle_duplicates_only)
+        view_menu.addAction(self.duplicates_action)
+
+    def refresh_vocabulary(self):
+        """Pick up a tag dictionary imported since the last check"""
+        self.canonicalize_action.setEnabled(get_vocabulary() is not None)
+        self.apply_canonicalize()
+
+    def toggle_canonicalize(self, checked):
+        self.settings.setValue("canonicalize_tags", checked)
+        self.apply_canonicalize()
+
+    def apply_canonicalize(self):
+        checked = self.canonicalize_action.isChecked()
+        self.file_manager.vocabulary = get_vocabulary() if checked else None
+
+    def import_tag_dictionary(self):
+        paths, _ = QFileDialog.getOpenFileNames(
+            self, "Import Tag Dictionary (tags CSV, optionally alias and implication CSVs)", "", "CSV Files (*.csv);;All Files (*)")
+        if not paths:
+            return
+        # Danbooru exports are named tag_aliases.csv / tag_implications.csv
+        aliases = [p for p in paths if "alias" in os.path.basename(p).lower()]
+        implications = [p for p in paths if "implication" in os.path.basename(p).lower()]
+        tags = [p for p in paths if p not in aliases and p not in implications]
+        if len(tags) != 1 or len(aliases) > 1 or len(implications) > 1:
+            QMessageBox.warning(self, "Import Tag Dictionary", "Select one tag list CSV, plus at most one alias CSV and one implication CSV.")
+            return
+        self.file_manager.vocabulary = None
+        try:
+            tag_count, alias_count, implication_count = import_vocabulary(
+                tags[0], aliases[0] if aliases else None, implications[0] if implications else None)
+        except (OSError, VocabularyError) as e:
+            QMessageBox.critical(self, "Import Tag Dictionary", str(e))
+            self.refresh_vocabulary()
+            return
+        self.refresh_vocabulary()
+        self.statusBar().showMessage(f"Imported {tag_count} tags, {alias_count} aliases and {implication_count} implications", 5000)
+
     def open_folder(self):
         folder_path = QFileDialog.getExistingDirectory(self, "Select Image Folder")
         if folder_path:
-            self.file_manager.load_folder(folder_path)
+            self.load_folder(folder_path)
+
+    def toggle_recursive(self, checked):
+        self.file_manager.recursive = checked
+        if self.file_manager.folder_path:
+            self.load_folder(self.file_manager.folder_path)
+
+    def load_folder(self, folder_path, select_path=None):
+        """Start streaming a folder in; select_path is shown as soon as it is listed"""
+        self.flush_pending_writes()
+        self.folder_watcher.stop()
+        for worker in self.loader_workers:
+            worker.requestInterruption()
+        generation = self.file_manager.begin_load(folder_path)
+        self.duplicates_action.setChecked(False)
+        self.duplicates_action.setEnabled(False)
+        self.pending_select_path = os.path.normpath(select_path) if select_path else None
+        self.update_ui()
+        self.statusBar().showMessage(f"Loading folder: {folder_path}")
+
+        worker = FolderLoaderWorker(self.file_manager, folder_path, generation)
+        worker.batch_ready.connect(self.on_folder_batch)
+        worker.progress.connect(self.on_folder_load_progress)
+        worker.finished.connect(self.on_folder_loaded)
+        # Keep superseded loaders referenced until their thread has exited
+        worker.finished.connect(lambda *args, w=worker: self.loader_workers.discard(w))
+        self.loader_workers.add(worker)
+        worker.start()
+
+    def select_pending_image(self, candidates):
+        if not self.pending_select_path:
+            return False
+        for img in candidates:
+            if os.path.normpath(img) == self.pending_select_path:
+                if img in self.file_manager.image_files:
+                    self.file_manager.current_index = self.file_manager.image_files.index(img)
+                    return True
+        return False
+
+    def on_folder_batch(self, generation, image_paths):
+        if not self.file_manager.add_loaded_images(generation, image_paths):
+            return
+        if self.select_pending_image(image_paths):
+            self.pending_select_path = None
+        if self.file_manager.get_current_image_path() != self.displayed_image_path:
+            self.update_ui()
+        else:
+            self.update_counter()
+        self.statusBar().showMessage(f"Loading folder... {len(self.file_manager.all_image_files)} images")
+
+    def on_folder_load_progress(self, done, total):
+        self.statusBar().showMessage(f"Reading tags {done}/{total}...")
+
+    def on_folder_loaded(self, generation, data):
+        if not self.file_manager.finish_load(generation, data):
+            return
+        self.select_pending_image(self.file_manager.image_files)
+        self.pending_select_path = None
+        if self.file_manager.get_current_image_path() != self.displayed_image_path:
+            self.update_ui()
+        else:
+            self.update_counter()
+        self.folder_watcher.watch(self.file_manager.folder_path)
+        self.update_undo_actions()
+        self.statusBar().showMessage(f"Loaded {len(self.file_manager.all_image_files)} images", 3000)
+        self.update_threshold_delta()
+        self.check_interrupted_bulk_edit()
+
+    def update_counter(self):
+        total = len(self.file_manager.image_files)
+        current = self.file_manager.current_index + 1 if total else 0
+        self.counter_label.setText(f"{current} / {total}")
+        self.sync_grid()
+
+    def grid_visible(self):
+        return self.view_stack.currentWidget() is self.thumbnail_grid
+
+    def show_tag_statistics(self):
+        if self.stats_dialog is None:
+            self.stats_dialog = StatsDialog(self.file_manager, self)
+        self.stats_dialog.show()
+        self.stats_dialog.raise_()
+        self.stats_dialog.activateWindow()
+
+    def find_duplicates(self):
+        if not self.file_manager.all_image_files:
+            QMessageBox.warning(self, "Warning", "No images loaded in the folder.")
+            return
+        self.dedup_generation = self.file_manager.load_generation
+        self.dedup_worker = DuplicateScanWorker(self.file_manager.all_image_files)
+        self.show_batch_progress(len(self.dedup_worker.image_paths))
+        self.dedup_worker.progress.connect(self.update_batch_progress)
+        self.dedup_worker.finished.connect(self.on_duplicates_found)
+        self.dedup_worker.start()
+
+    def on_duplicates_found(self, groups, error_msg):
+        self.hide_batch_progress()
+        if error_msg:
+            QMessageBox.critical(self, "Duplicate Scan Error", error_msg)
+            return
+        if self.dedup_worker.isInterruptionRequested():
+            self.statusBar().showMessage("Duplicate scan cancelled", 3000)
+            return
+        if self.dedup_generation != self.file_manager.load_generation:
+            # Another folder was opened meanwhile
+            return
+        self.file_manager.set_duplicate_groups(groups)
+        self.duplicates_action.setEnabled(bool(groups))
+        if not groups:
+            self.statusBar().showMessage("No duplicates found", 3000)
+            if self.duplicates_action.isChecked():
+                self.duplicates_action.setChecked(False)
+                self.toggle_duplicates_only(False)
+            return
+        images = sum(len(group) for group in groups)
+        self.statusBar().showMessage(f"Found {len(groups)} groups of near-duplicates ({images} images)", 5000)
+        self.duplicates_action.setChecked(True)
+        self.toggle_duplicates_only(True)
+
+    def toggle_duplicates_only(self, checked):
+        self.flush_pending_writes()
+        self.file_manager.set_duplicates_only(checked)
+        self.update_ui()
+
+    def toggle_grid(self, checked):
+        self.view_stack.setCurrentWidget(self.thumbnail_grid if checked else self.image_label)
+        if checked:
+            self.sync_grid()
+            self.thumbnail_grid.setFocus()
+        else:
+            self.load_image_pixmap()
+
+    def sync_grid(self):
+        self.thumbnail_model.set_image_paths(self.file_manager.image_files)
+        if self.grid_visible():
+            self.thumbnail_grid.select_row(self.file_manager.current_index)
+
+    def on_grid_selected(self, row):
+        if row < 0 or row == self.file_manager.current_index or row >= len(self.file_manager.image_files):
+            return
+        self.flush_pending_writes()
+        self.file_manager.current_index = row
+        self.update_ui()
+
+    def on_grid_opened(self, row):
+        self.on_grid_selected(row)
+        self.grid_action.setChecked(False)
+
+    def on_folder_changed(self, changed_paths):
+        self.thumbnail_model.invalidate(changed_paths)
+        img_path = self.file_manager.get_current_image_path()
+        if img_path != self.displayed_image_path:
+            # The current image was deleted or filtered out
             self.update_ui()
+            return
+        if img_path:
+            self.update_counter()
+            if img_path in changed_paths:
+                self.load_tags()
 
     def filter_images(self, text):
         count = self.file_manager.apply_filter(text)
         self.update_ui()
         if text:
-            self.statusBar().showMessage(f"Found {count} images with tag '{text}'", 2000)
+            self.statusBar().showMessage(f"Found {count} images matching '{text}'", 2000)
 
     def update_ui(self):
         img_path = self.file_manager.get_current_image_path()
         total = len(self.file_manager.image_files)
+        self.displayed_image_path = img_path
+        self.folder_watcher.watch_file(self.file_manager.get_text_file_path(img_path))
+        self.sync_grid()
         if not img_path:
             self.image_label.clear()
             self.filename_label.setText("No image loaded")
@@ -311,44 +656,105 @@ class MainWindow(QMainWindow):
         current = self.file_manager.current_index + 1
         self.filename_label.setText(os.path.basename(img_path))
         self.counter_label.setText(f"{current} / {total}")
-        self.load_image_pixmap(img_path)
+        if self.grid_visible():
+            # The full image is loaded when the single view is shown again
+            self.image_label.clear()
+        else:
+            self.load_image_pixmap(img_path)
         self.load_tags()
 
     def load_image_pixmap(self, img_path=None):
         if img_path is None:
             img_path = self.file_manager.get_current_image_path()
-        if not img_path:
+        if not img_path or self.grid_visible():
             return
             
-        # Load and scale image
-        pixmap = QPixmap(img_path)
-        if not pixmap.isNull():
-            # Scale to fit label while keeping aspect ratio
-            scaled_pixmap = pixmap.scaled(
-                self.image_label.size(), 
-                Qt.AspectRatioMode.KeepAspectRatio, 
-                Qt.TransformationMode.SmoothTransformation
-            )
-            self.image_label.setPixmap(scaled_pixmap)
+        bound = self.image_bound()
+        neighbors = neighbor_paths(self.file_manager.image_files, self.file_manager.current_index)
+        image = self.image_cache.get(img_path, bound)
+        if image is not None:
+            self.show_image(image)
+            self.image_cache.request(neighbors, bound)
+            return
+        # Show something right away and let the decode at display size land later
+        preview = self.image_cache.get(img_path) or self.image_cache.preview(img_path, bound)
+        if preview is not None:
+            self.show_image(preview, smooth=False)
+        else:
+            self.image_label.clear()
+        self.image_cache.request([img_path] + neighbors, bound)
+
+    def image_bound(self):
+        # Decode for the label's physical pixels, not the image's
+        ratio = self.image_label.devicePixelRatioF()
+        size = self.image_label.size()
+        return QSize(max(1, round(size.width() * ratio)), max(1, round(size.height() * ratio)))
+
+    def show_image(self, image, smooth=True):
+        # Scale to fit label while keeping aspect ratio
+        mode = Qt.TransformationMode.SmoothTransformation if smooth else Qt.TransformationMode.FastTransformation
+        scaled = image.scaled(self.image_bound(), Qt.AspectRatioMode.KeepAspectRatio, mode)
+        pixmap = QPixmap.fromImage(scaled)
+        pixmap.setDevicePixelRatio(self.image_label.devicePixelRatioF())
+        self.image_label.setPixmap(pixmap)
+
+    def on_image_ready(self, img_path):
+        if img_path == self.displayed_image_path and not self.grid_visible():
+            self.load_image_pixmap(img_path)
+
+    def on_image_failed(self, img_path, error_msg):
+        if img_path == self.displayed_image_path:
+            self.statusBar().showMessage(f"Could not load image: {error_msg}", 3000)
 
     def load_tags(self):
-        self.clear_tags()
         img_path = self.file_manager.get_current_image_path()
         if not img_path:
+            self.clear_tags()
             return
-            
-        tags = self.file_manager.read_tags(img_path)
-        for tag in tags:
-            btn = TagButton(tag)
-            btn.deleted.connect(self.remove_tag)
-            btn.edit_requested.connect(self.edit_tag)
-            self.tags_layout.addWidget(btn)
+        self.show_tag_buttons(self.file_manager.read_tags(img_path))
 
     def clear_tags(self):
-        for i in reversed(range(self.tags_layout.count())):
-            item = self.tags_layout.takeAt(i)
-            if item and item.widget():
-                item.widget().deleteLater()
+        self.show_tag_buttons([])
+
+    def show_tag_buttons(self, tags):
+        """Show one button per tag, reusing the buttons of tags that are already
+        shown, then spare buttons, and relayout the panel once"""
+        if [btn.tag_text for btn in self.tag_buttons] == list(tags):
+            return
+        current = {}
+        for btn in self.tag_buttons:
+            current.setdefault(btn.tag_text, []).append(btn)
+        buttons = []
+        missing = []
+        for i, tag in enumerate(tags):
+            same = current.get(tag)
+            btn = same.pop(0) if same else None
+            buttons.append(btn)
+            if btn is None:
+                missing.append(i)
+        unused = [btn for same in current.values() for btn in same]
+        for i in missing:
+            if unused:
+                btn = unused.pop()
+            elif self.spare_tag_buttons:
+                btn = self.spare_tag_buttons.pop()
+            else:
+                btn = TagButton(tags[i])
+                btn.deleted.connect(self.remove_tag)
+                btn.edit_requested.connect(self.edit_tag)
+            btn.set_tag(tags[i])
+            buttons[i] = btn
+
+        self.tags_container.setUpdatesEnabled(False)
+        for btn in unused:
+            btn.hide()
+        self.spare_tag_buttons.extend(unused)
+        self.tags_layout.set_widgets(buttons)
+        for btn in buttons:
+            btn.show()
+        self.tag_buttons = buttons
+        self.tags_container.relayout()
+        self.tags_container.setUpdatesEnabled(True)
 
     def add_tag(self):
         tag = self.tag_input.text().strip()
@@ -359,13 +765,18 @@ class MainWindow(QMainWindow):
         if not img_path:
             return
             
-        tags = self.file_manager.read_tags(img_path)
-        if tag not in tags:
-            tags.append(tag)
-            self.file_manager.save_tags(img_path, tags)
+        if self.edit_tags(img_path, lambda tags: tags + [tag] if tag not in tags else None) is not None:
             self.tag_input.clear()
             self.load_tags()
 
+    def update_tag_suggestions(self, text):
+        suggestions = [tag for tag, _ in self.file_manager.suggest_tags(text.strip())] if text.strip() else []
+        self.tag_completer_model.setStringList(suggestions)
+        if suggestions:
+            self.tag_completer.complete()
+        else:
+            self.tag_completer.popup().hide()
+
     def edit_tag(self, old_tag):
         img_path = self.file_manager.get_current_image_path()
         if not img_path:
@@ -379,16 +790,18 @@ class MainWindow(QMainWindow):
             
             tags = self.file_manager.read_tags(img_path)
             if old_tag in tags:
-                # Replace the old tag with the new one at the same position
-                idx = tags.index(old_tag)
-                
                 # Check if the new tag already exists elsewhere
-                if new_tag in tags and tags.index(new_tag) != idx:
+                if new_tag in tags:
                     QMessageBox.warning(self, "Warning", "This tag already exists.")
                     return
-                    
-                tags[idx] = new_tag
-                self.file_manager.save_tags(img_path, tags)
+
+                def rename(tags):
+                    if old_tag not in tags or new_tag in tags:
+                        return None
+                    # Replace the old tag with the new one at the same position
+                    tags[tags.index(old_tag)] = new_tag
+                    return tags
+                self.edit_tags(img_path, rename)
                 self.load_tags()
 
     def remove_tag(self, tag):
@@ -396,20 +809,54 @@ class MainWindow(QMainWindow):
         if not img_path:
             return
             
-        tags = self.file_manager.read_tags(img_path)
-        if tag in tags:
+        def remove(tags):
+            if tag not in tags:
+                return None
             tags.remove(tag)
-            self.file_manager.save_tags(img_path, tags)
-            # TagButton deletes itself via deleteLater in its on_click method
-            # We just need to remove it from layout visually or let layout handle it
-            # To be clean, reloading tags ensures correctness layout
+            return tags
+        if self.edit_tags(img_path, remove) is not None:
             self.load_tags()
 
+    def save_tags_deferred(self, img_path, tags):
+        self.file_manager.save_tags_deferred(img_path, tags)
+        self.write_timer.start()
+        self.update_pending_writes_label()
+
+    def edit_tags(self, img_path, update):
+        """Apply update(tags) on top of the latest tags, atomically with respect
+        to the batch workers' tag store. Returns the new tags or None."""
+        tags = self.file_manager.update_tags(img_path, update)
+        if tags is not None:
+            self.write_timer.start()
+            self.update_pending_writes_label()
+        return tags
+
+    def on_tags_stored(self, image_paths):
+        if self.displayed_image_path in image_paths:
+            self.load_tags()
+        self.update_pending_writes_label()
+
+    def flush_pending_writes(self, due_only=False):
+        failed = self.file_manager.flush_writes(due_only)
+        if failed:
+            self.statusBar().showMessage(f"Could not write tags for {len(failed)} images, will retry", 3000)
+        if not self.file_manager.pending_write_count():
+            self.write_timer.stop()
+        self.update_pending_writes_label()
+        return failed
+
+    def update_pending_writes_label(self):
+        count = self.file_manager.pending_write_count()
+        self.pending_writes_label.setText(f"Pending writes: {count}")
+        self.pending_writes_label.setVisible(count > 0)
+
     def next_image(self):
+        self.flush_pending_writes()
         if self.file_manager.next_image():
             self.update_ui()
 
     def prev_image(self):
+        self.flush_pending_writes()
         if self.file_manager.prev_image():
             self.update_ui()
 
@@ -419,6 +866,7 @@ class MainWindow(QMainWindow):
             return
         idx = int(text) - 1
         if 0 <= idx < len(self.file_manager.image_files):
+            self.flush_pending_writes()
             self.file_manager.current_index = idx
             self.update_ui()
             self.jump_input.clear()
@@ -432,7 +880,7 @@ class MainWindow(QMainWindow):
         
         reply = QMessageBox.question(self, 'Confirm Clear', f"Clear all tags for this image?", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
-            self.file_manager.save_tags(img_path, [])
+            self.save_tags_deferred(img_path, [])
             self.load_tags()
 
     def copy_tags(self):
@@ -444,14 +892,8 @@ class MainWindow(QMainWindow):
     def paste_tags(self):
         img_path = self.file_manager.get_current_image_path()
         if img_path and self.tag_clipboard:
-            current_tags = self.file_manager.read_tags(img_path)
-            added = False
-            for tag in self.tag_clipboard:
-                if tag not in current_tags:
-                    current_tags.append(tag)
-                    added = True
-            if added:
-                self.file_manager.save_tags(img_path, current_tags)
+            clipboard = list(self.tag_clipboard)
+            if self.edit_tags(img_path, lambda tags: append_missing(tags, clipboard)) is not None:
                 self.load_tags()
                 self.statusBar().showMessage(f"Pasted {len(self.tag_clipboard)} tags", 2000)
 
@@ -465,10 +907,8 @@ class MainWindow(QMainWindow):
         action_text = "at the beginning of" if position == "start" else "to the end of"
         reply = QMessageBox.question(self, 'Confirm', f"Add '{tag}' {action_text} all text files in this folder?", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
-            count = self.file_manager.add_tag_to_all(tag, position)
-            QMessageBox.information(self, "Success", f"Added '{tag}' to {count} files.")
+            self.start_bulk_edit(self.file_manager.bulk_add_tag(tag, position))
             self.tag_input.clear()
-            self.load_tags()
 
     def remove_tag_from_all(self):
         tag = self.tag_input.text().strip()
@@ -478,15 +918,101 @@ class MainWindow(QMainWindow):
             
         reply = QMessageBox.question(self, 'Confirm', f"Remove '{tag}' from all text files in this folder?", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
-            count = self.file_manager.remove_tag_from_all(tag)
-            QMessageBox.information(self, "Success", f"Removed '{tag}' from {count} files.")
+            self.start_bulk_edit(self.file_manager.bulk_remove_tag(tag))
             self.tag_input.clear()
+
+    def undo_bulk_edit(self):
+        bulk_edit = self.file_manager.bulk_history.undo_edit()
+        if bulk_edit:
+            self.start_bulk_edit(bulk_edit, "undo")
+
+    def redo_bulk_edit(self):
+        bulk_edit = self.file_manager.bulk_history.redo_edit()
+        if bulk_edit:
+            self.start_bulk_edit(bulk_edit, "redo")
+
+    def start_bulk_edit(self, bulk_edit, kind="do"):
+        if hasattr(self, 'bulk_edit_worker') and self.bulk_edit_worker.isRunning():
+            return
+        self.set_ai_buttons_enabled(False)
+        self.progress_bar.setVisible(True)
+        self.batch_status_label.setVisible(True)
+        self.cancel_batch_btn.setVisible(True)
+        self.progress_bar.setValue(0)
+        self.statusBar().showMessage(f"{bulk_edit.description}...")
+
+        self.bulk_edit_worker = BulkEditWorker(self.file_manager, bulk_edit, kind)
+        self.bulk_edit_worker.progress.connect(self.update_batch_progress)
+        self.bulk_edit_worker.finished.connect(self.on_bulk_edit_finished)
+        self.bulk_edit_worker.start()
+
+    def on_bulk_edit_finished(self, count, total, error_msg):
+        bulk_edit = self.bulk_edit_worker.bulk_edit
+        kind = self.bulk_edit_worker.kind
+        self.set_ai_buttons_enabled(True)
+        self.progress_bar.setVisible(False)
+        self.batch_status_label.setVisible(False)
+        self.cancel_batch_btn.setVisible(False)
+        self.cancel_batch_btn.setEnabled(True)
+        self.statusBar().clearMessage()
+        self.update_undo_actions()
+
+        if error_msg:
+            QMessageBox.critical(self, "Bulk Edit Error", error_msg)
+        elif bulk_edit.cancelled:
+            self.statusBar().showMessage(f"{bulk_edit.description} cancelled, no files were changed.", 3000)
+        else:
+            verb = {"undo": "Undid", "redo": "Redid"}.get(kind, "Done:")
+            QMessageBox.information(self, "Success", f"{verb} {bulk_edit.description} in {count} files.")
+        self.load_tags()
+
+    def update_undo_actions(self):
+        history = self.file_manager.bulk_history
+        # Not while a bulk edit or AI batch is writing; the history changes when it finishes
+        idle = self.add_all_btn.isEnabled()
+        self.undo_action.setEnabled(idle and history.can_undo())
+        self.redo_action.setEnabled(idle and history.can_redo())
+        if history.can_undo():
+            self.undo_action.setText(f"Undo {history.undo_stack[-1].description}")
+        else:
+            self.undo_action.setText("Undo Bulk Edit")
+        if history.can_redo():
+            self.redo_action.setText(f"Redo {history.redo_stack[-1].description}")
+        else:
+            self.redo_action.setText("Redo Bulk Edit")
+
+    def check_interrupted_bulk_edit(self):
+        description = pending_journal(self.file_manager.folder_path)
+        if not description:
+            return
+        reply = QMessageBox.question(
+            self, 'Interrupted Bulk Edit',
+            f"The bulk edit \"{description}\" did not finish in this folder. Roll back the files it already changed?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if reply == QMessageBox.StandardButton.Yes:
+            count = rollback_journal(self.file_manager)
+            self.statusBar().showMessage(f"Restored {count} files.", 3000)
             self.load_tags()
+        else:
+            discard_journal(self.file_manager.folder_path)
+
+    def closeEvent(self, event):
+        if self.flush_pending_writes():
+            reply = QMessageBox.question(self, 'Unsaved Tags', "Some tag files could not be written. Quit anyway?", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+            if reply != QMessageBox.StandardButton.Yes:
+                event.ignore()
+                return
+        self.folder_watcher.stop()
+        self.thumbnail_model.shutdown()
+        self.image_cache.shutdown()
+        self.file_manager.close()
+        super().closeEvent(event)
 
     def resizeEvent(self, event):
         super().resizeEvent(event)
         # Re-scale image on resize without reloading tags
-        self.load_image_pixmap()
+        self.resize_timer.start()
 
     def set_ai_buttons_enabled(self, enabled):
         self.pixai_btn.setEnabled(enabled)
@@ -495,6 +1021,12 @@ class MainWindow(QMainWindow):
         self.batch_florence_btn.setEnabled(enabled)
         self.add_all_btn.setEnabled(enabled)
         self.remove_all_btn.setEnabled(enabled)
+        self.find_duplicates_action.setEnabled(enabled)
+        self.update_undo_actions()
+        if enabled:
+            self.update_threshold_delta()
+        else:
+            self.apply_threshold_btn.setEnabled(False)
 
     def run_pixai_tagger(self):
         img_path = self.file_manager.get_current_image_path()
@@ -504,29 +1036,95 @@ class MainWindow(QMainWindow):
         self.set_ai_buttons_enabled(False)
         self.statusBar().showMessage("Initializing PixAI Tagger...")
         
-        self.pixai_worker = PixAITaggerWorker(img_path)
+        self.pixai_worker = PixAITaggerWorker(img_path, threshold=self.tagger_threshold())
         self.pixai_worker.progress.connect(self.update_status)
         self.pixai_worker.finished.connect(self.on_ai_finished)
         self.pixai_worker.start()
 
+    def resumable_job(self, kind, description):
+        """Unfinished batch job of kind the user wants to resume, None to start
+        a new one, or False to do nothing"""
+        job = BatchJob.load(self.file_manager.folder_path, kind)
+        if job is None or job.is_complete():
+            return None
+        done, failed, remaining = job.counts()
+        reply = QMessageBox.question(
+            self, 'Resume Batch',
+            f"A previous {description} batch stopped with {done} of {len(job.names)} images done"
+            f"{f' and {failed} failed' if failed else ''}. Resume it ({remaining} left)?\n\n"
+            "No starts a new batch over the current images.",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No | QMessageBox.StandardButton.Cancel
+        )
+        if reply == QMessageBox.StandardButton.Yes:
+            return job
+        if reply == QMessageBox.StandardButton.No:
+            job.discard()
+            return None
+        return False
+
+    def show_batch_progress(self, total):
+        self.set_ai_buttons_enabled(False)
+        self.progress_bar.setVisible(True)
+        self.batch_status_label.setVisible(True)
+        self.cancel_batch_btn.setVisible(True)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setMaximum(total)
+
     def run_batch_pixai(self):
         if not self.file_manager.image_files:
             QMessageBox.warning(self, "Warning", "No images loaded in the folder.")
             return
-            
-        reply = QMessageBox.question(self, 'Confirm', f"Run PixAI Tagger on all {len(self.file_manager.image_files)} images?", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
-        if reply == QMessageBox.StandardButton.Yes:
-            self.set_ai_buttons_enabled(False)
-            self.progress_bar.setVisible(True)
-            self.batch_status_label.setVisible(True)
-            self.cancel_batch_btn.setVisible(True)
-            self.progress_bar.setValue(0)
-            self.progress_bar.setMaximum(len(self.file_manager.image_files))
-            
-            self.batch_pixai_worker = BatchPixAITaggerWorker(self.file_manager, self.file_manager.image_files)
-            self.batch_pixai_worker.progress.connect(self.update_batch_progress)
-            self.batch_pixai_worker.finished.connect(self.on_batch_finished)
-            self.batch_pixai_worker.start()
+
+        job = self.resumable_job("pixai", "PixAI")
+        if job is False:
+            return
+        if job:
+            threshold = job.params.get("threshold", self.tagger_threshold())
+            self.batch_pixai_worker = BatchPixAITaggerWorker(self.file_manager, None, threshold=threshold, job=job)
+        else:
+            reply = QMessageBox.question(self, 'Confirm', f"Run PixAI Tagger on all {len(self.file_manager.image_files)} images?", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+            if reply != QMessageBox.StandardButton.Yes:
+                return
+            self.batch_pixai_worker = BatchPixAITaggerWorker(self.file_manager, self.file_manager.image_files, threshold=self.tagger_threshold(), skip_duplicates=self.skip_duplicates_action.isChecked())
+        self.show_batch_progress(len(self.batch_pixai_worker.image_paths))
+        self.batch_pixai_worker.progress.connect(self.update_batch_progress)
+        self.batch_pixai_worker.finished.connect(self.on_batch_finished)
+        self.batch_pixai_worker.start()
+
+    def tagger_threshold(self):
+        return self.threshold_slider.value() / 100.0
+
+    def folder_score_store(self):
+        if not self.file_manager.folder_path:
+            return None
+        try:
+            store = get_score_store(self.file_manager.folder_path)
+        except OSError:
+            return None
+        return None if store.is_empty() or store.threshold is None else store
+
+    def on_threshold_changed(self, value):
+        self.threshold_value_label.setText(f"{value / 100.0:.2f}")
+        self.update_threshold_delta()
+
+    def update_threshold_delta(self):
+        store = self.folder_score_store()
+        if store is None:
+            self.threshold_delta_label.setText("")
+            self.apply_threshold_btn.setEnabled(False)
+            return
+        threshold = self.tagger_threshold()
+        # Counted from a histogram of the stored scores, so this is instant while dragging
+        added, removed = store.threshold_delta(threshold)
+        self.threshold_delta_label.setText(f"+{added} / -{removed}")
+        self.threshold_delta_label.setToolTip(f"Tags added/removed across the folder compared to the last applied threshold {store.threshold:.2f}")
+        self.apply_threshold_btn.setEnabled(self.batch_pixai_btn.isEnabled() and abs(threshold - store.threshold) > 1e-6)
+
+    def apply_threshold(self):
+        store = self.folder_score_store()
+        if store is None:
+            return
+        self.start_bulk_edit(RethresholdEdit(self.file_manager, store, store.threshold, self.tagger_threshold()))
 
     def run_florence2(self):
         img_path = self.file_manager.get_current_image_path()
@@ -547,20 +1145,22 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Warning", "No images loaded in the folder.")
             return
             
-        task_prompt = self.flo_task_combo.currentText()
-        reply = QMessageBox.question(self, 'Confirm', f"Run Florence-2 ({task_prompt}) on all {len(self.file_manager.image_files)} images? This may take a long time.", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
-        if reply == QMessageBox.StandardButton.Yes:
-            self.set_ai_buttons_enabled(False)
-            self.progress_bar.setVisible(True)
-            self.batch_status_label.setVisible(True)
-            self.cancel_batch_btn.setVisible(True)
-            self.progress_bar.setValue(0)
-            self.progress_bar.setMaximum(len(self.file_manager.image_files))
-            
-            self.batch_flo_worker = BatchFlorence2Worker(self.file_manager, self.file_manager.image_files, task_prompt=task_prompt)
-            self.batch_flo_worker.progress.connect(self.update_batch_progress)
-            self.batch_flo_worker.finished.connect(self.on_batch_finished)
-            self.batch_flo_worker.start()
+        job = self.resumable_job("florence", "Florence-2")
+        if job is False:
+            return
+        if job:
+            task_prompt = job.params.get("task", self.flo_task_combo.currentText())
+            self.batch_flo_worker = BatchFlorence2Worker(self.file_manager, None, task_prompt=task_prompt, batch_size=self.flo_batch_spin.value(), job=job)
+        else:
+            task_prompt = self.flo_task_combo.currentText()
+            reply = QMessageBox.question(self, 'Confirm', f"Run Florence-2 ({task_prompt}) on all {len(self.file_manager.image_files)} images? This may take a long time.", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+            if reply != QMessageBox.StandardButton.Yes:
+                return
+            self.batch_flo_worker = BatchFlorence2Worker(self.file_manager, self.file_manager.image_files, task_prompt=task_prompt, batch_size=self.flo_batch_spin.value(), skip_duplicates=self.skip_duplicates_action.isChecked())
+        self.show_batch_progress(len(self.batch_flo_worker.image_paths))
+        self.batch_flo_worker.progress.connect(self.update_batch_progress)
+        self.batch_flo_worker.finished.connect(self.on_batch_finished)
+        self.batch_flo_worker.start()
 
     def update_status(self, msg):
         self.statusBar().showMessage(msg)
@@ -572,26 +1172,40 @@ class MainWindow(QMainWindow):
         if hasattr(self, 'batch_flo_worker') and self.batch_flo_worker.isRunning():
             self.batch_flo_worker.requestInterruption()
             self.statusBar().showMessage("Cancelling Florence-2 batch...")
+        if hasattr(self, 'bulk_edit_worker') and self.bulk_edit_worker.isRunning():
+            self.bulk_edit_worker.requestInterruption()
+            self.statusBar().showMessage("Cancelling bulk edit and restoring files...")
+        if hasattr(self, 'dedup_worker') and self.dedup_worker.isRunning():
+            self.dedup_worker.requestInterruption()
+            self.statusBar().showMessage("Cancelling duplicate scan...")
         self.cancel_batch_btn.setEnabled(False)
 
     def update_batch_progress(self, current, total, filename):
+        self.progress_bar.setMaximum(total)
         self.progress_bar.setValue(current)
         self.batch_status_label.setText(f"Processing {current + 1}/{total}: {filename}")
         self.statusBar().showMessage(f"Batch Processing: {current + 1}/{total}...")
 
-    def on_batch_finished(self, success_count, total, error_msg):
+    def hide_batch_progress(self):
         self.set_ai_buttons_enabled(True)
         self.progress_bar.setVisible(False)
         self.batch_status_label.setVisible(False)
         self.cancel_batch_btn.setVisible(False)
         self.cancel_batch_btn.setEnabled(True)
         self.statusBar().clearMessage()
+
+    def on_batch_finished(self, success_count, total, error_msg):
+        self.hide_batch_progress()
         
         if error_msg:
             QMessageBox.critical(self, "Batch Error", error_msg)
         else:
-            QMessageBox.information(self, "Batch Complete", f"Successfully processed {success_count} out of {total} images.")
+            skipped = self.sender().job.skipped_count()
+            note = f" ({skipped} duplicates skipped)" if skipped else ""
+            QMessageBox.information(self, "Batch Complete", f"Successfully processed {success_count} out of {total} images{note}.")
             
+        # A first PixAI run imports the tagger's tag list as the dictionary
+        self.refresh_vocabulary()
         self.load_tags()
 
     def on_ai_finished(self, new_tags, error_msg):
@@ -610,17 +1224,16 @@ class MainWindow(QMainWindow):
         if not img_path:
             return
             
-        current_tags = self.file_manager.read_tags(img_path)
-        added_count = 0
-        
-        for tag in new_tags:
-            tag = str(tag).strip()
-            if tag and tag not in current_tags:
-                current_tags.append(tag)
-                added_count += 1
+        added = []
+
+        def merge(tags):
+            merged = append_missing(tags, new_tags)
+            added[:] = merged[len(tags):]
+            return merged
+        self.edit_tags(img_path, merge)
+        added_count = len(added)
                 
         if added_count > 0:
-            self.file_manager.save_tags(img_path, current_tags)
             self.load_tags()
             self.statusBar().showMessage(f"Added {added_count} new tags.", 3000)
         else:
@@ -647,23 +1260,13 @@ class MainWindow(QMainWindow):
             
             if os.path.exists(file_path):
                 if os.path.isdir(file_path):
-                    self.statusBar().showMessage(f"Loading folder: {file_path}")
-                    self.file_manager.load_folder(file_path)
-                    self.update_ui()
+                    self.load_folder(file_path)
                 elif os.path.isfile(file_path):
                     ext = os.path.splitext(file_path)[1].lower()
-                    if ext in {'.png', '.jpg', '.jpeg', '.webp'}:
+                    if ext in SUPPORTED_IMAGE_EXTS:
                         folder_path = os.path.dirname(file_path)
-                        self.statusBar().showMessage(f"Loading image from folder: {folder_path}")
-                        self.file_manager.load_folder(folder_path)
-                        
-                        # Find the index of the dropped image
-                        for i, img in enumerate(self.file_manager.image_files):
-                            if os.path.normpath(img) == file_path:
-                                self.file_manager.current_index = i
-                                break
-                                
-                        self.update_ui()
+                        # The dropped image is selected as soon as the loader lists it
+                        self.load_folder(folder_path, select_path=file_path)
             
             event.acceptProposedAction()
             